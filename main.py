@@ -1,11 +1,14 @@
 import argparse
+import os
+import signal
 import time
 from dateutil import parser as date_parser
 
 from src.reader import NYC311Reader
-from src.writer import SQLiteWriter
+from src.writer import FanoutWriter, ParquetWriter, PartitionedSQLiteWriter, SQLiteWriter
 from src.runner import PipelineRunner
 from src.db_utils import DBUtils
+from src.state import CursorStore, SliceStore
 
 
 # ─────────────────────────────────────────────
@@ -29,6 +32,21 @@ def date_converter(s: str):
         raise argparse.ArgumentTypeError(f"Invalid date format: {s}")
 
 
+def float_list(n: int):
+    """
+    argparse type for `n` comma-separated numbers, e.g. a "lat,lon,radius_m" triple.
+    """
+    def convert(s: str):
+        try:
+            values = tuple(float(x) for x in s.split(","))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Expected {n} comma-separated numbers: {s}")
+        if len(values) != n:
+            raise argparse.ArgumentTypeError(f"Expected {n} comma-separated numbers: {s}")
+        return values
+    return convert
+
+
 def add_db_args(p):
     p.add_argument(
         "--db",
@@ -36,6 +54,32 @@ def add_db_args(p):
         default="data/nyc311.db",
         help="SQLite database path"
     )
+    p.add_argument(
+        "--partition-dir",
+        default=None,
+        help="Store requests in monthly SQLite databases under this directory instead of --db"
+    )
+
+
+def build_db(args):
+    return DBUtils(args.db, partition_dir=args.partition_dir)
+
+
+def sqlite_writer(args, mode="ignore"):
+    """
+    Persistent SQLite writer for the CLI: one database, or one per month with --partition-dir.
+    """
+    if args.partition_dir:
+        return PartitionedSQLiteWriter(root=args.partition_dir, persistent=True, mode=mode)
+    return SQLiteWriter(db_path=args.db, persistent=True, mode=mode)
+
+
+def add_server_arg(p):
+    p.add_argument(
+        "--server",
+        default=None,
+        help="Ask a running `serve` instance (e.g. http://127.0.0.1:8765) instead of opening the database"
+    )
 
 
 def add_run_args(p):
@@ -50,72 +94,454 @@ def add_run_args(p):
         default=None,
         help="Fetch only rows created after this timestamp"
     )
+    p.add_argument(
+        "--format",
+        choices=["json", "csv"],
+        default="json",
+        help="API response format; csv is parsed with pandas' C parser (faster on big pages)"
+    )
+    p.add_argument(
+        "--stream",
+        action="store_true",
+        help="Decode the response incrementally and validate/write it in chunks"
+    )
+    p.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=5000,
+        help="Records per chunk in --stream mode (default 5000)"
+    )
+    p.add_argument(
+        "--sink",
+        choices=["sqlite", "parquet", "both"],
+        default="sqlite",
+        help="Where ingested rows are written (default sqlite)"
+    )
+    p.add_argument(
+        "--parquet-dir",
+        type=str,
+        default="data/parquet",
+        help="Root of the partitioned parquet store"
+    )
+    p.add_argument(
+        "--upsert",
+        action="store_true",
+        help="Apply upstream changes to rows already stored (SQLite rewrites a row only when its content hash changed)"
+    )
+    add_metrics_args(p)
+
+
+def add_metrics_args(p):
+    p.add_argument(
+        "--metrics-textfile",
+        type=str,
+        default=None,
+        help="Rewrite this Prometheus textfile with per-stage metrics after every cycle"
+    )
+    p.add_argument(
+        "--metrics-jsonl",
+        type=str,
+        default=None,
+        help="Append one JSON line of per-stage metrics per cycle to this file"
+    )
+    p.add_argument(
+        "--profile",
+        choices=["cprofile", "tracemalloc"],
+        default=None,
+        help="Profile the first cycle (in listen, SIGUSR1 profiles the next one too)"
+    )
+    p.add_argument(
+        "--profile-out",
+        type=str,
+        default=None,
+        help="Profile output path (default data/profile/cycle.prof or .txt)"
+    )
+
+
+def add_source_args(p):
+    p.add_argument(
+        "--api-url",
+        type=str,
+        default=None,
+        help="Resource URL to fetch from instead of the NYC API (e.g. a fake-api server)"
+    )
+    p.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Record/replay API responses in this directory"
+    )
+    p.add_argument(
+        "--cache-mode",
+        choices=["record", "replay"],
+        default="replay",
+        help="With --cache-dir: record hits the API and stores responses, replay serves them offline"
+    )
+    p.add_argument(
+        "--api-rate",
+        type=float,
+        default=None,
+        help="Max API requests/s across all fetchers (default sized to whether NYC_APP_TOKEN is set)"
+    )
+    p.add_argument(
+        "--api-burst",
+        type=int,
+        default=None,
+        help="Requests allowed back-to-back before --api-rate applies"
+    )
+
+
+def build_scheduler(args):
+    """
+    One scheduler per command, shared by every reader it creates, so concurrent
+    fetchers are rate limited together. A --api-url without --api-rate is unthrottled.
+    """
+    from src.scheduler import RequestScheduler
+
+    if args.api_url and not args.api_rate:
+        return RequestScheduler(rate=None)
+    return RequestScheduler.for_token(os.getenv("NYC_APP_TOKEN"), rate=args.api_rate, burst=args.api_burst)
+
+
+def build_reader(args, scheduler=None):
+    session = None
+    if args.cache_dir:
+        from src.http_cache import CachedSession
+        session = CachedSession(args.cache_dir, mode=args.cache_mode)
+    return NYC311Reader(
+        limit=args.limit,
+        fmt=args.format,
+        session=session,
+        base_url=args.api_url,
+        scheduler=scheduler or build_scheduler(args),
+    )
+
+
+def build_writer(args):
+    writers = []
+    if args.sink in ("sqlite", "both"):
+        mode = "upsert" if getattr(args, "upsert", False) else "ignore"
+        writers.append(sqlite_writer(args, mode))
+    if args.sink in ("parquet", "both"):
+        writers.append(ParquetWriter(root=args.parquet_dir))
+    return writers[0] if len(writers) == 1 else FanoutWriter(writers)
+
+
+def resume_point(db, since=None, sink="sqlite", parquet_dir=None):
+    """
+    Where the next fetch starts. An explicit --since wins; otherwise resume from the
+    ingest checkpoint (inclusive of the watermark, skipping the keys already stored there).
+    A parquet-only sink resumes from the newest row in the store (it dedupes on its own).
+    """
+    if since:
+        return {"since": since}
+    if sink == "parquet":
+        from src.parquet_store import ParquetStore
+        latest = ParquetStore(parquet_dir).latest_timestamp()
+        return {"since": latest, "inclusive": latest is not None}
+    checkpoint = db.get_checkpoint()
+    if checkpoint is None:
+        return {"since": None}
+    return {
+        "since": checkpoint["watermark"],
+        "inclusive": True,
+        "skip_keys": checkpoint["boundary_keys"],
+    }
 
 # ─────────────────────────────────────────────
 # Command Implementations
 # ─────────────────────────────────────────────
 
 def cmd_run(args):
-    db = DBUtils(args.db)
-
-    # If user did not specify --since, infer from DB
-    since = args.since or db.get_latest_timestamp()
-
-    reader = NYC311Reader(limit=args.limit)
-    writer = SQLiteWriter(db_path=args.db)
-    runner = PipelineRunner(reader, writer)
+    db = build_db(args)
+
+    # If user did not specify --since, infer from the DB checkpoint
+    resume = resume_point(db, args.since, args.sink, args.parquet_dir)
+    since = resume["since"]
+
+    reader = build_reader(args)
+    with build_writer(args) as writer:
+        runner = build_runner(args, reader, writer)
+
+        if args.paged:
+            # In paged mode --limit is the page size, and the whole window is walked.
+            print(f"\nRunning paged ETL (page size={args.limit}, since={since})")
+            runner.run_pages(
+                since=since,
+                inclusive=resume.get("inclusive", False),
+                cursor_store=CursorStore(args.state),
+            )
+            return
+
+        print(f"\nRunning ETL cycle (limit={args.limit}, since={since})")
+        if args.stream:
+            runner.run_stream(chunk_rows=args.chunk_rows, **resume)
+        else:
+            runner.run(**resume)
+
+def build_runner(args, reader, writer, hooks=None):
+    from src.metrics import JSONLinesExporter, Metrics, PrometheusTextfile
+
+    exporters = []
+    if args.metrics_textfile:
+        exporters.append(PrometheusTextfile(args.metrics_textfile))
+    if args.metrics_jsonl:
+        exporters.append(JSONLinesExporter(args.metrics_jsonl))
+    runner = PipelineRunner(reader, writer, hooks=hooks, metrics=Metrics(exporters))
+    if args.profile:
+        runner.profile_next_cycle(args.profile, profile_path(args))
+    return runner
+
+
+def profile_path(args):
+    if args.profile_out:
+        return args.profile_out
+    return "data/profile/cycle.prof" if args.profile == "cprofile" else "data/profile/cycle.txt"
+
+
+def build_hooks(args):
+    """
+    In-stream alerting: compile the rules file once and run it on every batch, and/or
+    keep the per-series anomaly statistics current (--anomaly).
+    """
+    if not args.rules and not args.anomaly:
+        return []
+    from src.sinks import make_sink
+
+    sinks = [make_sink(spec) for spec in (args.alert_sink or ["stdout"])]
+    hooks = []
+    if args.rules:
+        from src.alerts import StreamAlerter
+        from src.rules import load_rules
+
+        ruleset = load_rules(args.rules)
+        print(f"Loaded {len(ruleset.rules)} alert rules → {', '.join(args.alert_sink or ['stdout'])}")
+        hooks.append(StreamAlerter(ruleset, sinks))
+    if args.anomaly:
+        from src.anomaly import AnomalyDetector
+        if getattr(args, "stream", False):
+            raise SystemExit("--anomaly needs batches oldest first; --stream reads newest first.")
+        hooks.append(AnomalyDetector(sinks, state_path=args.anomaly_state, alpha=args.anomaly_alpha,
+                                     z=args.anomaly_z, min_count=args.anomaly_min_count))
+    return hooks
 
-    print(f"\nRunning ETL cycle (limit={args.limit}, since={since})")
-    runner.run(since=since)
 
 def cmd_listen(args):
-    db = DBUtils(args.db)
-    reader = NYC311Reader(limit=args.limit)
-    writer = SQLiteWriter(db_path=args.db)
-    runner = PipelineRunner(reader, writer)
-
+    db = build_db(args)
+    reader = build_reader(args)
+    writer = build_writer(args)
+    runner = build_runner(args, reader, writer, hooks=build_hooks(args))
+
+    if args.profile and hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> profiles the next cycle of a running listener
+        signal.signal(signal.SIGUSR1, lambda *_: runner.profile_next_cycle(args.profile, profile_path(args)))
+
+    if not args.stream:
+        import asyncio
+        from src.listener import AdaptiveInterval, AsyncListener
+
+        policy = AdaptiveInterval(args.interval, min_interval=args.min_interval, max_interval=args.max_interval)
+        resume = resume_point(db, args.since, args.sink, args.parquet_dir)
+        print(f"\n Starting listener (interval={args.interval}s, adapting between "
+              f"{policy.min_interval}s and {policy.max_interval}s, since={resume['since']})\n")
+        try:
+            asyncio.run(AsyncListener(runner, policy, **resume).run())
+        except KeyboardInterrupt:
+            print("Listener stopped.")
+        return
+
+    # --stream: the sequential loop (one streamed DESC query per poll, fixed interval)
     interval = args.interval
     last_ts = args.since # this is so if the listener is activated we can call it back in time and then only call from latest.
     print(f'\n Starting listener mode (interval={interval}s)\n')
 
     while True:
-        if last_ts is None:
-            since = db.get_latest_timestamp()
-        else: 
-            since = last_ts
-        print(f"\n Polling API (since={since})...")
-        runner.run(since=since)
-        last_ts = db.get_latest_timestamp()
+        resume = resume_point(db, last_ts, args.sink, args.parquet_dir)
+        print(f"\n Polling API (since={resume['since']})...")
+        runner.run_stream(chunk_rows=args.chunk_rows, **resume)
+        last_ts = None  # from here on the checkpoint drives the next poll
         print(f"Sleeping for {interval} seconds... \n")
         time.sleep(interval) 
 
 
+def cmd_refresh(args):
+    reader = build_reader(args)
+    with sqlite_writer(args, mode="upsert") as writer:
+        runner = build_runner(args, reader, writer)
+        runner.run_updates(since=args.since, cursor_store=CursorStore(args.state))
+
+
+def cmd_backfill(args):
+    from src.backfill import BackfillRunner
+
+    store = SliceStore(args.state or f"{args.db}.backfill.json")
+    scheduler = build_scheduler(args)
+    with sqlite_writer(args) as writer:
+        runner = BackfillRunner(
+            reader_factory=lambda: build_reader(args, scheduler),
+            writer=writer,
+            slice_store=store,
+            workers=args.workers,
+        )
+        runner.run(
+            date_parser.parse(args.start),
+            date_parser.parse(args.end),
+            unit=args.slice,
+        )
+
+
+def joined(values):
+    return None if values is None else ",".join(str(v) for v in values)
+
+
 def cmd_preview(args):
-    db = DBUtils(args.db)
+    if args.server:
+        from src.service import query_service
+        print(query_service(args.server, "preview", n=args.n))
+        return
+    db = build_db(args)
     df = db.preview(n=args.n)
     print(df)
 
 
+def cmd_migrate(args):
+    db = build_db(args)
+    version = db.migrate()
+    print(f"Database {args.partition_dir or args.db} is at schema v{version}.")
+
+
+def cmd_rollups(args):
+    db = build_db(args)
+    db.rebuild_rollups()
+    db.rebuild_geo_index()
+    db.rebuild_search_index()
+
+
 def cmd_drop(args):
-    db = DBUtils(args.db)
+    if args.partition_dir:
+        raise SystemExit("drop works on a single database; use retention --keep-months for partitions.")
+    db = build_db(args)
     db.drop_table()
 
 
+def cmd_retention(args):
+    from src.partitions import PartitionSet
+
+    if not args.partition_dir:
+        raise SystemExit("retention needs --partition-dir.")
+    done = PartitionSet(args.partition_dir).apply_retention(
+        hot_months=args.hot_months,
+        keep_months=args.keep_months,
+        compress=args.compress,
+    )
+    print(f"Retention: archived {len(done['archived'])} months, dropped {len(done['dropped'])}.")
+
+
+def cmd_fake_api(args):
+    from src.fake_socrata import FakeSocrata
+    from src.synthetic import generate_records
+
+    server = FakeSocrata(generate_records(args.rows, seed=args.seed), port=args.port)
+    print(f"FakeAPI: Serving {args.rows} rows at {server.resource_url} (Ctrl-C to stop)")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        print("FakeAPI: Stopped.")
+    finally:
+        server.server.server_close()
+
+
+def cmd_bench(args):
+    import json
+    from src.bench import STAGES, compare, run_benchmark, save_report
+
+    # Checked here rather than with argparse choices, so other commands don't import
+    # src.bench (matplotlib, resource) just to build the parser.
+    unknown = sorted(set(args.stages or []) - set(STAGES))
+    if unknown:
+        raise SystemExit(f"Unknown bench stages: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args.sizes, chunk_rows=args.chunk_rows, seed=args.seed, stages=args.stages)
+    save_report(report, args.out)
+    if baseline is not None:
+        regressions = compare(baseline, report, threshold=args.threshold)
+        for r in regressions:
+            print(f"Bench: REGRESSION {r['stage']} @ {r['size']} rows: "
+                  f"{r['baseline']:,.0f} -> {r['current']:,.0f} rec/s ({r['change']:+.0%})")
+        if not regressions:
+            print(f"Bench: No stage slower than {args.threshold:.0%} vs {args.compare}.")
+
+
 def cmd_trends(args):
+    if args.server:
+        # thin client: the table comes back from `serve`, no plot
+        from src.service import query_service
+        density = args.kind == "density"
+        print(query_service(args.server, "trends", kind=args.kind, since=args.since, until=args.until,
+                            top_n=args.top_n if args.kind == "top" else None,
+                            cell_m=args.cell_m if density else None, bbox=joined(args.bbox) if density else None))
+        return
     from src.trends import TrendAnalyser
-    ta = TrendAnalyser()
+    ta = TrendAnalyser(db_path=args.db, parquet_dir=args.parquet_dir, partition_dir=args.partition_dir)
+    window = {"since": args.since, "until": args.until}
     if args.kind == "daily":
-        ta.daily_volume()
+        ta.daily_volume(**window)
     elif args.kind == "top":
-        ta.top_complaints(args.top_n)
+        ta.top_complaints(args.top_n, **window)
+    elif args.kind == "density":
+        ta.density_map(args.cell_m, bbox=args.bbox, **window)
     else:
-        ta.borough_distribution()
+        ta.borough_distribution(**window)
 
 
 def cmd_alerts(args):
+    if args.server and not (args.anomalies or args.incremental):
+        from src.service import query_service
+        rows = query_service(args.server, "alerts", filter=args.filter, hours=args.hours,
+                             bbox=joined(args.bbox), near=joined(args.near))
+        print(rows)
+        print(f"\nTotal matching complaints: {len(rows)}")
+        return
     from src.alerts import AlertEngine
-    ae = AlertEngine()
-    ae.recent_complaints(args.filter, args.hours)
+    ae = AlertEngine(db_path=args.db, parquet_dir=args.parquet_dir, partition_dir=args.partition_dir)
+    if args.anomalies:
+        from src.anomaly import AnomalyDetector
+        scores = AnomalyDetector(state_path=args.anomaly_state).current()
+        print(scores.head(args.top_n))
+        return
+    if args.filter is None and args.bbox is None and args.near is None:
+        raise SystemExit("alerts needs --filter, --bbox and/or --near.")
+    if args.incremental:
+        if args.parquet_dir or args.partition_dir:
+            raise SystemExit("--incremental works on a single SQLite database only.")
+        if args.bbox is not None or args.near is not None:
+            raise SystemExit("--incremental doesn't support --bbox/--near yet.")
+        if args.filter.startswith("fts:"):
+            raise SystemExit("--incremental doesn't support fts: queries.")
+        ae.new_matches(args.filter, args.hours, rule=args.rule)
+    else:
+        try:
+            ae.recent_complaints(args.filter or "", args.hours, bbox=args.bbox, near=args.near)
+        except ValueError as e:
+            raise SystemExit(str(e))
+
+def cmd_serve(args):
+    from src.service import QueryService
+
+    service = QueryService(args.db, host=args.host, port=args.port, partition_dir=args.partition_dir,
+                           pool_size=args.pool_size, cache_entries=args.cache_entries)
+    print(f"QueryService: Serving {args.partition_dir or args.db} at {service.url} (Ctrl-C to stop)")
+    try:
+        service.server.serve_forever()
+    except KeyboardInterrupt:
+        print("QueryService: Stopped.")
+    finally:
+        service.close()
 
 # ─────────────────────────────────────────────
 # Parser Builder
@@ -135,6 +561,18 @@ def build_parser():
     )
     add_db_args(p_run)
     add_run_args(p_run)
+    add_source_args(p_run)
+    p_run.add_argument(
+        "--paged",
+        action="store_true",
+        help="Walk the whole window in ascending pages of --limit rows (resumable backfill)"
+    )
+    p_run.add_argument(
+        "--state",
+        type=str,
+        default="data/run_cursor.json",
+        help="Where the paged run stores its resume cursor"
+    )
     p_run.set_defaults(func=cmd_run)
 
     p_listen = subparsers.add_parser(
@@ -143,14 +581,128 @@ def build_parser():
     )
     add_db_args(p_listen)
     add_run_args(p_listen)
+    add_source_args(p_listen)
     p_listen.add_argument(
         "--interval", 
         type=int,
         default=60,
-        help="Polling interval in seconds (default 60)."
+        help="Polling interval in seconds (default 60); the starting point when adapting."
+    )
+    p_listen.add_argument(
+        "--min-interval",
+        type=float,
+        default=1.0,
+        help="Shortest gap between polls while catching up on full pages (default 1s)"
+    )
+    p_listen.add_argument(
+        "--max-interval",
+        type=float,
+        default=None,
+        help="Longest gap between polls when the feed is quiet (default 8x --interval)"
+    )
+    p_listen.add_argument(
+        "--rules",
+        type=str,
+        default=None,
+        help="JSON rules file evaluated against every ingested batch"
+    )
+    p_listen.add_argument(
+        "--alert-sink",
+        action="append",
+        default=None,
+        help="Where rule matches go: stdout, jsonl:<path> or webhook:<url> (repeatable)"
     )
+    p_listen.add_argument(
+        "--anomaly",
+        action="store_true",
+        help="Alert on hourly spikes per complaint type and borough (seasonal EWMA z-scores)"
+    )
+    p_listen.add_argument("--anomaly-state", default="data/anomaly_state.npz",
+                          help="Where the anomaly statistics are persisted between runs")
+    p_listen.add_argument("--anomaly-z", type=float, default=4.0, help="z-score that counts as a spike")
+    p_listen.add_argument("--anomaly-alpha", type=float, default=0.1,
+                          help="EWMA weight of each new week's observation of an hour slot")
+    p_listen.add_argument("--anomaly-min-count", type=int, default=5,
+                          help="Ignore hours with fewer complaints than this")
     p_listen.set_defaults(func=cmd_listen)
 
+    # Refresh Command
+    p_refresh = subparsers.add_parser(
+        "refresh",
+        help="Upsert every record changed upstream (:updated_at) since the last refresh"
+    )
+    add_db_args(p_refresh)
+    p_refresh.add_argument("--limit", type=int, default=None, help="Page size per request")
+    p_refresh.add_argument(
+        "--since",
+        type=date_converter,
+        default=None,
+        help="Refresh records updated after this timestamp (instead of the saved cursor)"
+    )
+    p_refresh.add_argument("--format", choices=["json", "csv"], default="json", help="API response format")
+    add_metrics_args(p_refresh)
+    add_source_args(p_refresh)
+    p_refresh.add_argument(
+        "--state",
+        type=str,
+        default="data/refresh_cursor.json",
+        help="Where the :updated_at cursor is kept between refreshes"
+    )
+    p_refresh.set_defaults(func=cmd_refresh)
+
+    # Backfill Command
+    p_backfill = subparsers.add_parser(
+        "backfill",
+        help="Fetch a historical date range in parallel time slices"
+    )
+    add_db_args(p_backfill)
+    p_backfill.add_argument(
+        "--from",
+        dest="start",
+        type=date_converter,
+        required=True,
+        help="Start of the range (inclusive)"
+    )
+    p_backfill.add_argument(
+        "--to",
+        dest="end",
+        type=date_converter,
+        required=True,
+        help="End of the range (exclusive)"
+    )
+    p_backfill.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of concurrent fetchers (default 4)"
+    )
+    p_backfill.add_argument(
+        "--slice",
+        choices=["day", "hour"],
+        default="day",
+        help="Slice width (default day)"
+    )
+    p_backfill.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Page size per request"
+    )
+    p_backfill.add_argument(
+        "--format",
+        choices=["json", "csv"],
+        default="json",
+        help="API response format"
+    )
+    p_backfill.add_argument(
+        "--state",
+        type=str,
+        default=None,
+        help="Slice completion file (default <db>.backfill.json)"
+    )
+    add_source_args(p_backfill)
+    p_backfill.set_defaults(func=cmd_backfill)
+
     # Preview Command
     p_preview = subparsers.add_parser(
         "preview",
@@ -163,8 +715,25 @@ def build_parser():
         default=10,
         help="Number of rows to preview"
     )
+    add_server_arg(p_preview)
     p_preview.set_defaults(func=cmd_preview)
 
+    # Migrate Command
+    p_migrate = subparsers.add_parser(
+        "migrate",
+        help="Upgrade the database to the current declared schema"
+    )
+    add_db_args(p_migrate)
+    p_migrate.set_defaults(func=cmd_migrate)
+
+    # Rollups Command
+    p_rollups = subparsers.add_parser(
+        "rebuild-rollups",
+        help="Recompute the hourly rollups, spatial and full-text indexes from scratch and report any drift"
+    )
+    add_db_args(p_rollups)
+    p_rollups.set_defaults(func=cmd_rollups)
+
     # Drop Command
     p_drop = subparsers.add_parser(
         "drop",
@@ -173,20 +742,91 @@ def build_parser():
     add_db_args(p_drop)
     p_drop.set_defaults(func=cmd_drop)
 
+    # Retention Command
+    p_retention = subparsers.add_parser(
+        "retention",
+        help="Compact closed monthly partitions into read-only archives and drop expired months"
+    )
+    add_db_args(p_retention)
+    p_retention.add_argument("--hot-months", type=int, default=3,
+                             help="Months kept as writable hot partitions (the current month is always hot)")
+    p_retention.add_argument("--keep-months", type=int, default=None,
+                             help="Delete months this old or older (default: keep everything)")
+    p_retention.add_argument("--compress", action="store_true", help="gzip the archives")
+    p_retention.set_defaults(func=cmd_retention)
+
+    # Fake API Command
+    p_fake = subparsers.add_parser(
+        "fake-api",
+        help="Serve synthetic 311 data from a local Socrata stand-in (use with --api-url)"
+    )
+    p_fake.add_argument("--rows", type=int, default=100_000, help="Number of synthetic records")
+    p_fake.add_argument("--port", type=int, default=8311)
+    p_fake.add_argument("--seed", type=int, default=0)
+    p_fake.set_defaults(func=cmd_fake_api)
+
+
+    # Bench Command
+    p_bench = subparsers.add_parser(
+        "bench",
+        help="Benchmark each ingest stage and analytics query on synthetic data"
+    )
+    p_bench.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    p_bench.add_argument("--chunk-rows", type=int, default=500_000, help="Rows generated/processed per chunk")
+    p_bench.add_argument("--seed", type=int, default=0)
+    p_bench.add_argument("--stages", nargs="+", default=None, metavar="STAGE",
+                         help="Only run these stages (see src/bench.py STAGES)")
+    p_bench.add_argument("--out", default="data/bench/results.json", help="Where the JSON results go")
+    p_bench.add_argument("--compare", default=None, help="Baseline results JSON to check for regressions")
+    p_bench.add_argument("--threshold", type=float, default=0.10, help="Slowdown that counts as a regression (default 0.10)")
+    p_bench.set_defaults(func=cmd_bench)
+
 
     # Analysis commands
     # trends command
     p_trends = subparsers.add_parser("trends", help="Run simple historical trend analysis")
-    p_trends.add_argument("--kind", choices=["daily", "top", "borough"], default="daily")
+    p_trends.add_argument("--kind", choices=["daily", "top", "borough", "density"], default="daily")
     p_trends.add_argument("--top_n", type=int, default=10)
+    p_trends.add_argument("--since", type=date_converter, default=None, help="Only include rows created at/after this timestamp")
+    p_trends.add_argument("--until", type=date_converter, default=None, help="Only include rows created before this timestamp")
+    p_trends.add_argument("--cell-m", type=float, default=500, help="Grid cell size in metres for --kind density")
+    p_trends.add_argument("--bbox", type=float_list(4), default=None, metavar="MIN_LAT,MIN_LON,MAX_LAT,MAX_LON",
+                          help="Only cells inside this box (--kind density)")
+    add_db_args(p_trends)
+    p_trends.add_argument("--parquet-dir", default=None, help="Read from this parquet store instead of SQLite")
+    add_server_arg(p_trends)
     p_trends.set_defaults(func=cmd_trends)
 
     # alerts command
     p_alerts = subparsers.add_parser("alerts", help="Run alert engine for recent complaints")
-    p_alerts.add_argument("--filter", required=True, help="Complaint substring filter")
+    p_alerts.add_argument("--filter", default=None,
+                          help='Complaint substring (or regex) filter, or an FTS5 query after "fts:" e.g. '
+                               '"fts:noise NOT street", "fts:noi*", "fts:resolution_description: inspected"')
+    p_alerts.add_argument("--bbox", type=float_list(4), default=None, metavar="MIN_LAT,MIN_LON,MAX_LAT,MAX_LON",
+                          help="Only complaints inside this box")
+    p_alerts.add_argument("--near", type=float_list(3), default=None, metavar="LAT,LON,RADIUS_M",
+                          help="Only complaints within RADIUS_M metres of LAT,LON (nearest first)")
     p_alerts.add_argument("--hours", type=int, default=24)
+    p_alerts.add_argument("--incremental", action="store_true", help="Only evaluate rows ingested since this rule last ran")
+    p_alerts.add_argument("--rule", default=None, help="Cursor name for --incremental (defaults to one per filter)")
+    p_alerts.add_argument("--anomalies", action="store_true",
+                          help="Show the current hour's z-scores from the anomaly state kept by listen --anomaly")
+    p_alerts.add_argument("--anomaly-state", default="data/anomaly_state.npz")
+    p_alerts.add_argument("--top_n", type=int, default=20, help="Series shown with --anomalies")
+    add_db_args(p_alerts)
+    p_alerts.add_argument("--parquet-dir", default=None, help="Read from this parquet store instead of SQLite")
+    add_server_arg(p_alerts)
     p_alerts.set_defaults(func=cmd_alerts)
 
+    # serve command
+    p_serve = subparsers.add_parser("serve", help="Serve trend, alert and preview queries over HTTP/JSON")
+    add_db_args(p_serve)
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=8765)
+    p_serve.add_argument("--pool-size", type=int, default=4, help="Read connections shared by request threads")
+    p_serve.add_argument("--cache-entries", type=int, default=256, help="Trend/preview results kept in memory")
+    p_serve.set_defaults(func=cmd_serve)
+
     return parser
 
 
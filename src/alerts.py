@@ -1,8 +1,15 @@
 # alerts/notify.py
 
+import re
 import sqlite3
+import time
 import pandas as pd
 from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+from src.db_utils import connection
+from src.rules import RuleSet, haversine_m, radius_bbox
+from src.schema import REQUESTS_COLUMNS, decode_lookups, has_search_index, migrate, to_epoch
+from src.sinks import AlertSink
 
 
 class AlertEngine:
@@ -10,37 +17,270 @@ class AlertEngine:
     Generates simple alerts based on recent NYC 311 complaints.
     """
 
-    def __init__(self, db_path="data/nyc311.db"):
+    def __init__(self, db_path="data/nyc311.db", parquet_dir=None, partition_dir=None, pool=None):
         self.db_path = db_path
+        self.pool = pool  # ConnectionPool for the read queries (new_matches writes, so it connects itself)
+        self.parquet_dir = parquet_dir
+        self.partitions = None
+        if partition_dir is not None:
+            from src.partitions import PartitionSet
+            self.partitions = PartitionSet(partition_dir)
 
-    def _load_df(self):
-        with sqlite3.connect(self.db_path) as conn:
-            try: 
-                df = pd.read_sql("SELECT * FROM requests", conn)
-            except pd.errors.DatabaseError as e:
-                print(f"Please first load data into the database, before running analysis")
-                raise
+    def _load_df(self, since=None, box: Optional[Sequence[float]] = None, match: Optional[str] = None):
+        """
+        Loads requests created after `since` (a timestamp), using the created_epoch index
+        so only the window is read rather than the whole table.
+
+        With `box` (min_lat, min_lon, max_lat, max_lon) only rows inside it are loaded,
+        found through the requests_geo R*Tree - one probe covers both the box and the
+        time window. With `match` (an FTS5 query, see match_expression) only rows the
+        requests_fts index matches are loaded.
+        """
+        if self.parquet_dir:
+            from src.parquet_store import ParquetStore
+            columns = ["created_date", "created_epoch", "complaint_type", "borough", "unique_key"]
+            if box is not None:
+                columns += ["latitude", "longitude"]
+            df = ParquetStore(self.parquet_dir).scan(columns, since=None if since is None else since.isoformat())
+            if box is not None:
+                df = df.loc[_in_box(df, box)]
+            df["created_date"] = pd.to_datetime(df["created_date"])
+            return df
+
+        since_epoch = None if since is None else int(to_epoch([since.isoformat()]).iloc[0])
+        sources, clauses, params = ["requests r"], [], []
+        if box is not None:
+            min_lat, min_lon, max_lat, max_lon = box
+            # The R*Tree holds 32-bit floats rounded outwards, so the overlap test can
+            # only over-select; the exact bounds are re-checked on the requests row.
+            sources.append("JOIN requests_geo g ON g.id = r.rowid")
+            clauses.append(
+                "g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?"
+                " AND r.latitude BETWEEN ? AND ? AND r.longitude BETWEEN ? AND ?"
+            )
+            params += [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+            if since_epoch is not None:
+                clauses.append("g.max_t >= ?")
+                params.append(since_epoch)
+        if match is not None:
+            sources.append("JOIN requests_fts f ON f.rowid = r.rowid")
+            clauses.append("requests_fts MATCH ?")
+            params.append(match)
+        if since_epoch is not None:
+            clauses.append("r.created_epoch > ?")
+            params.append(since_epoch)
+
+        query = f"SELECT r.* FROM {' '.join(sources)}"
+        if clauses:
+            query += f" WHERE {' AND '.join(clauses)}"
+        try: 
+            if self.partitions is not None:
+                # only the months from `since` on are attached
+                window = None if since is None else since.isoformat()
+                df = self.partitions.read_sql(query, params, since=window, decode=True)
+            else:
+                with connection(self.db_path, self.pool) as conn:
+                    migrate(conn)
+                    df = decode_lookups(conn, pd.read_sql(query, conn, params=params))
+        except (pd.errors.DatabaseError, sqlite3.OperationalError) as e:
+            if match is not None:
+                # fts5 syntax errors, but also e.g. "no such column" for an unknown column:
+                raise ValueError(f"Invalid search query {match!r}: {e}") from e
+            print(f"Please first load data into the database, before running analysis")
+            raise
+        if df.columns.empty:
+            # no partition in the window
+            df = pd.DataFrame(columns=list(REQUESTS_COLUMNS))
         df["created_date"] = pd.to_datetime(df["created_date"])
         return df
 
-    def recent_complaints(self, complaint_filter: str, hours: int = 24):
+    def _searchable(self) -> bool:
+        """
+        True when the SQLite store has the requests_fts index (FTS5 builds only).
+        """
+        if self.parquet_dir:
+            return False
+        if self.partitions is not None:
+            return self.partitions.searchable()
+        with connection(self.db_path, self.pool) as conn:
+            migrate(conn)
+            return has_search_index(conn)
+
+    def recent_complaints(
+        self,
+        complaint_filter: str,
+        hours: int = 24,
+        bbox: Optional[Sequence[float]] = None,
+        near: Optional[Tuple[float, float, float]] = None,
+        verbose: bool = True,
+    ):
         """
         Prints all complaints matching substring `complaint_filter`
-        within the last X hours.
+        within the last X hours (verbose=False just returns them).
+
+        bbox: (min_lat, min_lon, max_lat, max_lon) - only complaints inside the box.
+        near: (lat, lon, radius_m) - only complaints within radius_m metres, with their
+            distance in a `distance_m` column, nearest first.
+
+        On SQLite the filter is answered by the requests_fts index. A filter using
+        regex operators (`light|noise`) is still matched as a regex, and with the "fts:"
+        prefix it is an FTS5 query: `fts:noise OR heat`, `fts:noise NOT street`,
+        `fts:noi*`, or `fts:resolution_description: inspected` to search another text
+        column (see match_expression).
         """
-        df = self._load_df()
         cutoff = pd.Timestamp.now() - pd.Timedelta(hours=hours)
+        box = bbox
+        if near is not None:
+            circle = radius_bbox(*near)
+            box = circle if box is None else (
+                max(box[0], circle[0]), max(box[1], circle[1]), min(box[2], circle[2]), min(box[3], circle[3])
+            )
+        match = None
+        if complaint_filter:
+            if self._searchable():
+                match = match_expression(complaint_filter)
+            elif complaint_filter.startswith(FTS_PREFIX):
+                raise ValueError(f"{FTS_PREFIX} queries need the requests_fts index (SQLite only).")
+        if match == "":
+            raise ValueError(f"Empty search query: {complaint_filter!r}")
+        df = self._load_df(since=cutoff, box=box, match=match)
 
-        mask = (
-            df["complaint_type"]
-            .str.contains(complaint_filter, case=False, na=False)
-        ) & (df["created_date"] > cutoff)
+        mask = df["created_date"] > cutoff
+        if match is None:
+            mask &= contains_filter(df["complaint_type"], complaint_filter)
 
         recent = df.loc[mask]
+        where = ""
+        if bbox is not None:
+            where += f" inside {tuple(bbox)}"
+        if near is not None:
+            lat, lon, radius_m = near
+            recent = recent.assign(distance_m=haversine_m(recent["latitude"], recent["longitude"], lat, lon))
+            recent = recent.loc[recent["distance_m"] <= radius_m].sort_values("distance_m")
+            where += f" within {radius_m:g} m of ({lat}, {lon})"
 
-        print(f"\nAlertEngine: Complaints containing '{complaint_filter}' "
+        if not verbose:
+            return recent
+        print(f"\nAlertEngine: Complaints containing '{complaint_filter}'{where} "
               f"in the last {hours} hours:\n")
-        print(recent[["created_date", "borough", "complaint_type"]])
+        cols = ["created_date", "borough", "complaint_type"] + (["distance_m"] if near is not None else [])
+        print(recent[cols])
         print(f"\nTotal matching complaints: {len(recent)}")
 
         return recent
+
+    def new_matches(self, complaint_filter: str, hours: int = 24, rule: Optional[str] = None):
+        """
+        Incremental version of recent_complaints: only rows ingested since this rule
+        last ran are looked at, and only their matches are returned, so the cost per run
+        depends on how much arrived rather than on the size of the table.
+
+        Each rule keeps a cursor (highest requests.rowid evaluated) in alert_cursors.
+        The first run of a rule evaluates the usual `hours` window to seed it.
+        """
+        if self.partitions is not None:
+            raise ValueError("Incremental alerts need a single database; rowid cursors don't span partitions.")
+        rule = rule or f"contains:{complaint_filter.lower()}"
+        cutoff = pd.Timestamp.now() - pd.Timedelta(hours=hours)
+        cutoff_epoch = int(to_epoch([cutoff.isoformat()]).iloc[0])
+
+        with sqlite3.connect(self.db_path) as conn:
+            migrate(conn)
+            row = conn.execute("SELECT last_rowid FROM alert_cursors WHERE rule = ?", (rule,)).fetchone()
+            last_rowid = row[0] if row else 0
+            (high,) = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM requests").fetchone()
+
+            # rowid range is a seek on the table's own b-tree, no full scan.
+            df = pd.read_sql(
+                """
+                SELECT rowid AS row_id, * FROM requests
+                WHERE rowid > ? AND rowid <= ? AND created_epoch > ?
+                """,
+                conn,
+                params=(last_rowid, high, cutoff_epoch),
+            )
+            df = decode_lookups(conn, df)
+            conn.execute(
+                """
+                INSERT INTO alert_cursors (rule, last_rowid, updated_at) VALUES (?, ?, datetime('now'))
+                ON CONFLICT(rule) DO UPDATE SET last_rowid = excluded.last_rowid, updated_at = excluded.updated_at
+                """,
+                (rule, high),
+            )
+            conn.commit()
+
+        mask = contains_filter(df["complaint_type"], complaint_filter)
+        matches = df.loc[mask].drop(columns="row_id")
+        matches["created_date"] = pd.to_datetime(matches["created_date"])
+
+        print(f"\nAlertEngine: {len(df)} new rows since last run of '{rule}', "
+              f"{len(matches)} new matches:\n")
+        if not matches.empty:
+            print(matches[["created_date", "borough", "complaint_type"]])
+
+        return matches
+
+
+# `alerts --filter "fts:noise NOT street"` opts into raw FTS5 query syntax.
+FTS_PREFIX = "fts:"
+# Regex operators: a filter using any of them is matched as a regex (str.contains), as
+# before the search index existed; anything else is taken literally.
+_REGEX_OPS = re.compile(r"[|\[\]*+?{}^$\\]")
+
+
+def match_expression(complaint_filter: str, column: str = "complaint_type") -> Optional[str]:
+    """
+    FTS5 MATCH expression for an `alerts --filter` value.
+
+    Plain text becomes a quoted phrase restricted to `column` ('"' doubled), which with
+    the trigram tokenizer is a case-insensitive substring match - the same result as
+    str.contains. A filter starting with "fts:" is an FTS5 query (AND/OR/NOT, "phrases",
+    prefix*, column: filters), passed through as is; it searches every indexed column
+    unless it names one. Returns None for regexes and for plain text under 3
+    characters, which a trigram index can't look up; those are matched with
+    contains_filter instead.
+    """
+    if complaint_filter.startswith(FTS_PREFIX):
+        return complaint_filter[len(FTS_PREFIX):].strip()
+    if _REGEX_OPS.search(complaint_filter) or len(complaint_filter.strip()) < 3:
+        return None
+    phrase = complaint_filter.replace('"', '""')
+    return f'{column} : "{phrase}"'
+
+
+def contains_filter(values: pd.Series, complaint_filter: str) -> pd.Series:
+    """
+    Case-insensitive substring match of a (non-FTS) filter, as a regex if it uses any
+    regex operators.
+    """
+    regex = bool(_REGEX_OPS.search(complaint_filter))
+    return values.str.contains(complaint_filter, case=False, na=False, regex=regex)
+
+
+def _in_box(df: pd.DataFrame, box: Sequence[float]) -> pd.Series:
+    min_lat, min_lon, max_lat, max_lon = box
+    return df["latitude"].between(min_lat, max_lat) & df["longitude"].between(min_lon, max_lon)
+
+
+class StreamAlerter:
+    """
+    Runs a compiled RuleSet against each freshly validated batch, in memory, before it
+    is written - plug it into PipelineRunner(hooks=[...]) so alerts fire as part of
+    ingestion rather than waiting for someone to run `alerts`.
+    """
+
+    def __init__(self, ruleset: RuleSet, sinks: List[AlertSink]):
+        self.ruleset = ruleset
+        self.sinks = sinks
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        start = time.perf_counter()
+        alerts = self.ruleset.match(df)
+        if alerts.empty:
+            return alerts
+        alerts["alerted_at"] = pd.Timestamp.now().isoformat()
+        for sink in self.sinks:
+            sink.emit(alerts)
+        print(f"StreamAlerter: {len(alerts)} alerts from {len(df)} rows "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        return alerts
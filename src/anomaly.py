@@ -0,0 +1,264 @@
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.schema import to_epoch
+from src.sinks import AlertSink
+
+# Seasonal slots: one per (day of week, hour of day), Monday 00:00 first.
+SLOTS = 7 * 24
+# Hour 0 of the epoch (1970-01-01) was a Thursday.
+EPOCH_DOW = 3
+
+Key = Tuple[str, str]
+
+
+def slot_of(hour: int) -> int:
+    """
+    Seasonal slot of an absolute hour (epoch seconds // 3600).
+    """
+    return ((hour // 24 + EPOCH_DOW) % 7) * 24 + hour % 24
+
+
+class AnomalyDetector:
+    """
+    Streaming spike detection on hourly complaint counts per (complaint_type, borough).
+
+    Every key keeps, for each of the 168 day-of-week x hour-of-day slots, an EWMA of the
+    hourly count and of its variance, so "Monday 9am" is compared with earlier Monday
+    9ams rather than with 3am. Batches only bump the current hour's counters (one
+    scatter-add per batch); when the stream moves into a later hour the finished hour
+    is scored and folded into its slot, hours with no rows counting as zero. Nothing is
+    ever re-read from the database.
+
+    An hour alerts when its count is at least `min_count` and `z` standard deviations
+    above the slot mean, once the slot has `min_obs` observations. The deviation is
+    floored at sqrt(mean) (Poisson noise), so quiet series don't alert on a couple of
+    extra rows. The open hour is checked on every batch, so a spike alerts as soon as
+    it is big enough rather than when the hour ends, and at most once per hour.
+
+    Batches have to arrive oldest first (run/listen keyset pages, not the DESC --stream
+    query): rows older than the open hour can't be counted any more and are only
+    tallied in `late`.
+
+    Plug it into PipelineRunner(hooks=[...]); with `state_path` the statistics are saved
+    (a few MB of .npz) whenever the open hour moves on, and loaded back on start.
+
+    Parameters
+    ----------
+    alpha: float
+        EWMA weight of the newest observation of a slot (slots update once a week).
+    """
+    def __init__(
+        self,
+        sinks: Optional[List[AlertSink]] = None,
+        state_path: Optional[str] = None,
+        alpha: float = 0.1,
+        z: float = 4.0,
+        min_count: int = 5,
+        min_obs: int = 4,
+    ):
+        self.sinks = sinks or []
+        self.state_path = Path(state_path) if state_path else None
+        self.alpha = alpha
+        self.z = z
+        self.min_count = min_count
+        self.min_obs = min_obs
+
+        self.keys: List[Key] = []
+        self._index: Dict[Key, int] = {}
+        self.mean = np.zeros((0, SLOTS), dtype=np.float32)
+        self.var = np.zeros((0, SLOTS), dtype=np.float32)
+        self.obs = np.zeros((0, SLOTS), dtype=np.uint16)
+        self.hour: Optional[int] = None             # the open hour (epoch hours)
+        self.counts = np.zeros(0, dtype=np.int64)   # rows per key in the open hour
+        self.alerted = np.zeros(0, dtype=bool)      # key already alerted for the open hour
+        self.late = 0                               # rows older than the open hour (not counted)
+        self._saved_hour: Optional[int] = None      # open hour at the last save
+
+        if self.state_path is not None and self.state_path.exists():
+            self.load()
+
+    # ── state ──
+
+    def _key_ids(self, complaint_type: pd.Series, borough: pd.Series) -> np.ndarray:
+        """
+        Row -> key index, adding (and zero-initialising) keys seen for the first time.
+        """
+        pairs = pd.MultiIndex.from_arrays([complaint_type.astype(str), borough.fillna("").astype(str)])
+        codes, uniques = pd.factorize(pairs)
+        ids = np.empty(len(uniques), dtype=np.int64)
+        new = []
+        for i, key in enumerate(uniques):
+            idx = self._index.get(key)
+            if idx is None:
+                idx = self._index[key] = len(self.keys) + len(new)
+                new.append(key)
+            ids[i] = idx
+        if new:
+            self.keys.extend(new)
+            grow = len(new)
+            self.mean = np.vstack([self.mean, np.zeros((grow, SLOTS), dtype=np.float32)])
+            self.var = np.vstack([self.var, np.zeros((grow, SLOTS), dtype=np.float32)])
+            self.obs = np.vstack([self.obs, np.zeros((grow, SLOTS), dtype=np.uint16)])
+            self.counts = np.concatenate([self.counts, np.zeros(grow, dtype=np.int64)])
+            self.alerted = np.concatenate([self.alerted, np.zeros(grow, dtype=bool)])
+        return ids[codes]
+
+    def save(self) -> None:
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp.npz")
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            tmp,
+            complaint_types=np.array([k[0] for k in self.keys], dtype=str),
+            boroughs=np.array([k[1] for k in self.keys], dtype=str),
+            mean=self.mean,
+            var=self.var,
+            obs=self.obs,
+            hour=np.array(-1 if self.hour is None else self.hour),
+            counts=self.counts,
+            alerted=self.alerted,
+        )
+        os.replace(tmp, self.state_path)
+        self._saved_hour = self.hour
+
+    def load(self) -> None:
+        with np.load(self.state_path) as state:
+            self.keys = list(zip(state["complaint_types"].tolist(), state["boroughs"].tolist()))
+            self.mean, self.var, self.obs = state["mean"], state["var"], state["obs"]
+            hour = int(state["hour"])
+            self.hour = None if hour < 0 else hour
+            self.counts, self.alerted = state["counts"], state["alerted"]
+        self._saved_hour = self.hour
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        print(f"AnomalyDetector: Loaded state for {len(self.keys)} series from {self.state_path}.")
+
+    # ── scoring ──
+
+    def _score(self, hour: int, counts: np.ndarray) -> np.ndarray:
+        """
+        z-score of each key's count for `hour` against its seasonal slot (NaN while
+        the slot is still warming up).
+        """
+        s = slot_of(hour)
+        mean = self.mean[:, s].astype(np.float64)
+        std = np.sqrt(np.maximum(self.var[:, s], np.maximum(mean, 1.0)))
+        z = (counts - mean) / std
+        return np.where(self.obs[:, s] >= self.min_obs, z, np.nan)
+
+    def _spikes(self, hour: int, counts: np.ndarray) -> pd.DataFrame:
+        z = self._score(hour, counts)
+        hits = np.flatnonzero((z >= self.z) & (counts >= self.min_count) & ~self.alerted)
+        self.alerted[hits] = True
+        s = slot_of(hour)
+        when = pd.Timestamp(hour * 3600, unit="s").isoformat()
+        spikes = pd.DataFrame({
+            "rule": "anomaly",
+            "created_date": when,
+            "complaint_type": [self.keys[i][0] for i in hits],
+            "borough": [self.keys[i][1] or None for i in hits],
+            "count": counts[hits],
+            "expected": self.mean[hits, s].astype(np.float64).round(2),
+            "z": z[hits].round(2),
+        })
+        # what StdoutSink prints, since these rows are series rather than records
+        spikes["message"] = [
+            f"{when} {borough or '-'} {complaint}: {count} this hour vs {expected} expected (z={score})"
+            for complaint, borough, count, expected, score in zip(
+                spikes["complaint_type"], spikes["borough"], spikes["count"], spikes["expected"], spikes["z"])
+        ]
+        return spikes
+
+    def _close(self, hour: int, counts: np.ndarray) -> None:
+        """
+        Fold a finished hour into its slot (West's incremental EWMA variance).
+        """
+        s = slot_of(hour)
+        first = self.obs[:, s] == 0
+        diff = counts - self.mean[:, s]
+        incr = self.alpha * diff
+        self.var[:, s] = np.where(first, 0.0, (1 - self.alpha) * (self.var[:, s] + diff * incr))
+        self.mean[:, s] = np.where(first, counts, self.mean[:, s] + incr)
+        self.obs[:, s] = np.minimum(self.obs[:, s].astype(np.int64) + 1, np.iinfo(np.uint16).max)
+
+    def _advance(self, hour: int) -> List[pd.DataFrame]:
+        """
+        Move the open hour forward to `hour`: the open hour is closed with its counts and
+        the hours in between with zeros - at most the last week of them, so a long
+        outage costs one update per slot rather than one per missing hour.
+        """
+        found = [self._spikes(self.hour, self.counts)]
+        self._close(self.hour, self.counts)
+        zeros = np.zeros_like(self.counts)
+        for gap in range(max(self.hour + 1, hour - SLOTS), hour):
+            self._close(gap, zeros)
+        self.hour = hour
+        self.counts = zeros
+        self.alerted = np.zeros_like(self.alerted)
+        return found
+
+    def update(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Feed one validated batch; returns the anomalies it raised (also sent to the sinks).
+        """
+        hours = to_epoch(df["created_date"]).to_numpy() // 3600
+        valid = ~np.isnan(hours)
+        borough = df["borough"] if "borough" in df else pd.Series(None, index=df.index, dtype=object)
+        ids = self._key_ids(df["complaint_type"][valid], borough[valid])
+        hours = hours[valid].astype(np.int64)
+        if not len(hours):
+            return pd.DataFrame()
+        if self.hour is None:
+            self.hour = int(hours.min())
+
+        late = hours < self.hour
+        self.late += int(late.sum())
+        ids, hours = ids[~late], hours[~late]
+
+        found = []
+        for hour in np.unique(hours):
+            if hour > self.hour:
+                found += self._advance(int(hour))
+            np.add.at(self.counts, ids[hours == hour], 1)
+        found.append(self._spikes(self.hour, self.counts))
+
+        alerts = pd.concat(found, ignore_index=True)
+        if not alerts.empty:
+            alerts["alerted_at"] = pd.Timestamp.now().isoformat()
+            for sink in self.sinks:
+                sink.emit(alerts)
+        return alerts
+
+    def __call__(self, df: pd.DataFrame) -> pd.DataFrame:
+        start = time.perf_counter()
+        late = self.late
+        alerts = self.update(df)
+        if self.state_path is not None and self.hour != self._saved_hour:
+            self.save()
+        if self.late > late:
+            print(f"AnomalyDetector: {self.late - late} rows older than the open hour were not counted "
+                  f"(batches must arrive oldest first).")
+        print(f"AnomalyDetector: {len(alerts)} anomalies from {len(df)} rows "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+        return alerts
+
+    def current(self) -> pd.DataFrame:
+        """
+        Every series in the open hour with its count, slot mean and z-score, highest
+        z first - what `alerts --anomalies` prints.
+        """
+        if self.hour is None:
+            return pd.DataFrame(columns=["complaint_type", "borough", "count", "expected", "z"])
+        s = slot_of(self.hour)
+        out = pd.DataFrame({
+            "complaint_type": [k[0] for k in self.keys],
+            "borough": [k[1] or None for k in self.keys],
+            "count": self.counts,
+            "expected": self.mean[:, s].astype(np.float64).round(2),
+            "z": self._score(self.hour, self.counts).round(2),
+        })
+        return out.sort_values("z", ascending=False, na_position="last", kind="stable").reset_index(drop=True)
@@ -0,0 +1,130 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from src.reader import NYC311Reader
+from src.runner import PipelineRunner
+from src.state import SliceStore
+from src.writer import WriterBase
+
+SLICE_UNITS = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+
+
+def make_slices(start: datetime, end: datetime, unit: str = "day") -> List[Tuple[str, str]]:
+    """
+    Splits [start, end) into consecutive day or hour slices as ISO (start, end) pairs.
+    """
+    step = SLICE_UNITS[unit]
+    slices = []
+    cur = start
+    while cur < end:
+        nxt = min(cur + step, end)
+        slices.append((cur.isoformat(), nxt.isoformat()))
+        cur = nxt
+    return slices
+
+
+def slice_key(since: str, until: str) -> str:
+    """
+    SliceStore id of a slice: both bounds, since the last slice of a run is cut short
+    at `end` and a rerun with another --slice unit starts slices at the same times.
+    """
+    return f"{since}/{until}"
+
+
+class BackfillRunner:
+    """
+    Historical ingestion that fetches time slices concurrently on a thread pool.
+
+    HTTP is the bottleneck, so each worker fetches + validates its own slice with its
+    own reader (requests.Session is not thread safe). Validated pages are pushed onto a
+    single bounded queue and drained by the calling thread, which is the only one that
+    ever touches the writer - so SQLite never sees concurrent writers, and the queue
+    bound stops fast fetchers from outrunning the disk.
+
+    A slice is marked complete in the SliceStore (by its full [since, until) interval)
+    only after its last page is written.
+    """
+    def __init__(
+        self,
+        reader_factory: Callable[[], NYC311Reader],
+        writer: WriterBase,
+        slice_store: SliceStore,
+        workers: int = 4,
+    ):
+        self.reader_factory = reader_factory
+        self.writer = writer
+        self.slice_store = slice_store
+        self.workers = workers
+        self._local = threading.local()
+        self._stop = threading.Event()
+
+    def _reader(self) -> NYC311Reader:
+        if not hasattr(self._local, "reader"):
+            self._local.reader = self.reader_factory()
+        return self._local.reader
+
+    def _fetch_slice(self, since: str, until: str, out: queue.Queue) -> None:
+        slice_id = slice_key(since, until)
+        rows = 0
+        try:
+            for page in self._reader().fetch_pages(since=since, until=until, inclusive=True):
+                if self._stop.is_set():
+                    return
+                rows += len(page)
+                out.put(("page", slice_id, PipelineRunner.validate(page)))
+            out.put(("done", slice_id, rows))
+        except Exception as e:
+            out.put(("error", slice_id, e))
+
+    def run(self, start: datetime, end: datetime, unit: str = "day") -> Dict[str, int]:
+        """
+        Backfills [start, end), skipping slices already recorded as complete.
+        Returns a small summary of slices done / failed / skipped and rows written.
+        """
+        slices = make_slices(start, end, unit)
+        done = self.slice_store.completed()
+        todo = [s for s in slices if slice_key(*s) not in done]
+        summary = {"slices": len(slices), "skipped": len(slices) - len(todo), "done": 0, "failed": 0, "rows": 0}
+        print(f"Backfill: {len(todo)} of {len(slices)} {unit} slices to fetch with {self.workers} workers.")
+        if not todo:
+            return summary
+
+        out: queue.Queue = queue.Queue(maxsize=self.workers * 2)
+        self._stop.clear()
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        futures = [pool.submit(self._fetch_slice, since, until, out) for since, until in todo]
+        try:
+            pending = len(todo)
+            while pending:
+                kind, slice_id, payload = out.get()
+                if kind == "page":
+                    self.writer.write(payload)
+                    summary["rows"] += len(payload)
+                elif kind == "done":
+                    self.slice_store.mark_done(slice_id)
+                    summary["done"] += 1
+                    pending -= 1
+                    print(f"Backfill: Slice {slice_id} complete ({payload} raw records). {pending} remaining.")
+                else:
+                    summary["failed"] += 1
+                    pending -= 1
+                    print(f"Backfill: Slice {slice_id} failed: {payload}. It will be retried on the next run.")
+        except BaseException:
+            # Writer failed (or Ctrl-C): stop the workers and drain the queue so none of
+            # them stays blocked on a full queue.
+            self._stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+            while not all(f.done() for f in futures):
+                try:
+                    out.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            raise
+        finally:
+            pool.shutdown()
+
+        print(f"Backfill: Finished. {summary}")
+        return summary
@@ -0,0 +1,280 @@
+import contextlib
+import io
+import json
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from src.alerts import AlertEngine
+from src.http_cache import CachedResponse
+from src.reader import NYC311Reader
+from src.schema import NYC311Record, validate_batch
+from src.synthetic import generate_records
+from src.trends import TrendAnalyser
+from src.writer import SQLiteWriter
+
+# Per-chunk stages run on every generated chunk, query stages once on the loaded table.
+CHUNK_STAGES = [
+    "decode_json", "decode_csv", "dataframe", "validate_records", "validate_batch", "sqlite_write",
+]
+QUERY_STAGES = [
+    "trends_daily", "trends_daily_raw", "trends_complaints", "trends_borough",
+    "alerts_recent", "alerts_incremental",
+]
+STAGES = CHUNK_STAGES + QUERY_STAGES
+
+# How messy the generated feed is: some nulls, a few bad dates, some re-sent keys.
+MESSY = {"null_rate": 0.05, "bad_date_rate": 0.01, "dup_rate": 0.02}
+
+
+def _status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak() -> bool:
+    """
+    Reset the kernel's high-water RSS mark (Linux only) so VmHWM reflects one stage.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class StageMeter:
+    """
+    Accumulates wall time, rows and peak RSS per stage across chunks.
+
+    Peak RSS is the process high-water mark while the stage ran. On Linux the mark is
+    reset before each stage, elsewhere it falls back to ru_maxrss, which only ever
+    grows, so later stages inherit earlier peaks.
+    """
+    def __init__(self):
+        self.results: Dict[str, Dict] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows: int):
+        resettable = _reset_peak()
+        rss_before = _status_kb("VmRSS")
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = _status_kb("VmHWM") if resettable else None
+            if peak is None:
+                # ru_maxrss is KiB on Linux, bytes on macOS
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                peak = peak // 1024 if sys.platform == "darwin" else peak
+
+            r = self.results.setdefault(name, {"rows": 0, "seconds": 0.0, "peak_rss_mb": 0.0, "rss_delta_mb": 0.0})
+            r["rows"] += rows
+            r["seconds"] += elapsed
+            r["peak_rss_mb"] = max(r["peak_rss_mb"], peak / 1024)
+            if rss_before is not None:
+                r["rss_delta_mb"] = max(r["rss_delta_mb"], (peak - rss_before) / 1024)
+
+    def summary(self) -> Dict[str, Dict]:
+        out = {}
+        for name, r in self.results.items():
+            out[name] = {
+                "rows": r["rows"],
+                "seconds": round(r["seconds"], 4),
+                "records_per_s": round(r["rows"] / r["seconds"], 1) if r["seconds"] else None,
+                "peak_rss_mb": round(r["peak_rss_mb"], 1),
+                "rss_delta_mb": round(r["rss_delta_mb"], 1),
+            }
+        return out
+
+
+def _json_body(df: pd.DataFrame) -> bytes:
+    # API shape: null fields are left out of each object
+    rows = [{k: v for k, v in rec.items() if v is not None} for rec in df.to_dict("records")]
+    return json.dumps(rows).encode()
+
+
+def bench_size(
+    n: int,
+    workdir: str,
+    chunk_rows: int = 500_000,
+    seed: int = 0,
+    stages: Optional[Iterable[str]] = None,
+) -> Dict[str, Dict]:
+    """
+    Runs every selected stage over `n` generated rows and returns per-stage results.
+
+    Rows are generated, decoded, validated and written `chunk_rows` at a time (the way
+    a paged run sees them), so peak RSS reflects the chunk rather than all `n` rows.
+    The generated window ends now so the alert queries have something to find.
+    """
+    stages = set(stages or STAGES)
+    meter = StageMeter()
+    json_reader = NYC311Reader(fmt="json")
+    csv_reader = NYC311Reader(fmt="csv")
+    db_path = str(Path(workdir) / f"bench_{n}.db")
+    days = 30
+    start = (pd.Timestamp.now().floor("h") - pd.Timedelta(days=days)).isoformat()
+
+    with SQLiteWriter(db_path, persistent=True) as writer:
+        for i, lo in enumerate(range(0, n, chunk_rows)):
+            size = min(chunk_rows, n - lo)
+            # Each chunk is its own slice of the window, so the chunks stay in time order.
+            span = days * size / n
+            chunk_start = (pd.Timestamp(start) + pd.Timedelta(days=days * lo / n)).isoformat()
+            gen = generate_records(size, seed=seed + i, start=chunk_start, days=span, key_start=60_000_000 + lo, **MESSY)
+            body = _json_body(gen)
+            csv_body = gen.to_csv(index=False).encode()
+            del gen
+
+            records = None
+            if stages & {"decode_json", "dataframe", "validate_records", "validate_batch", "sqlite_write"}:
+                with meter.stage("decode_json", size):
+                    records = json_reader._decode(CachedResponse(body))
+            if "decode_csv" in stages:
+                with meter.stage("decode_csv", size):
+                    csv_reader._decode(CachedResponse(csv_body))
+            del body, csv_body
+
+            if "dataframe" in stages:
+                with meter.stage("dataframe", size):
+                    pd.DataFrame.from_records(records)
+            if "validate_records" in stages:
+                with meter.stage("validate_records", size):
+                    for raw in records:
+                        try:
+                            NYC311Record.from_api(raw)
+                        except ValueError:
+                            pass
+
+            if stages & {"validate_batch", "sqlite_write"}:
+                with meter.stage("validate_batch", size):
+                    clean = validate_batch(records)
+                del records
+                if "sqlite_write" in stages:
+                    with meter.stage("sqlite_write", len(clean)):
+                        writer.write(clean)
+
+    loaded = _count(db_path)
+    trends = TrendAnalyser(db_path, output_dir=str(Path(workdir) / "plots"))
+    raw_trends = TrendAnalyser(db_path, output_dir=str(Path(workdir) / "plots"), use_rollups=False)
+    alerts = AlertEngine(db_path)
+    queries = {
+        "trends_daily": trends.daily_counts,
+        "trends_daily_raw": raw_trends.daily_counts,
+        "trends_complaints": lambda: trends.complaint_counts(n=10),
+        "trends_borough": trends.borough_counts,
+        "alerts_recent": lambda: alerts.recent_complaints("noise", hours=24 * 7),
+        "alerts_incremental": lambda: alerts.new_matches("noise", hours=24 * 7),
+    }
+    for name in QUERY_STAGES:
+        if name in stages and loaded:
+            with meter.stage(name, loaded):
+                queries[name]()
+
+    results = meter.summary()
+    Path(db_path).unlink(missing_ok=True)
+    for suffix in ("-wal", "-shm"):
+        Path(db_path + suffix).unlink(missing_ok=True)
+    return results
+
+
+def _count(db_path: str) -> int:
+    if not Path(db_path).exists():
+        return 0
+    with sqlite3.connect(db_path) as conn:
+        try:
+            return conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parent,
+        )
+        return out.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    sizes: Iterable[int] = (10_000, 1_000_000, 10_000_000),
+    chunk_rows: int = 500_000,
+    seed: int = 0,
+    stages: Optional[Iterable[str]] = None,
+    workdir: Optional[str] = None,
+    quiet: bool = True,
+) -> Dict:
+    """
+    Benchmarks the ingest stages and analytics queries at each size and returns a
+    JSON-ready dict tagged with the commit and environment, so two runs can be diffed
+    with compare().
+    """
+    report = {
+        "commit": _git_commit(),
+        "timestamp": pd.Timestamp.now(tz="UTC").isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "chunk_rows": chunk_rows,
+        "seed": seed,
+        "messy": MESSY,
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for n in sizes:
+            print(f"Bench: {n:,} rows...")
+            # The pipeline's progress prints would swamp the output (and the timings).
+            sink = io.StringIO() if quiet else sys.stdout
+            with contextlib.redirect_stdout(sink):
+                report["sizes"][str(n)] = bench_size(n, tmp, chunk_rows=chunk_rows, seed=seed, stages=stages)
+            for name, r in report["sizes"][str(n)].items():
+                print(f"  {name:<20} {r['records_per_s'] or 0:>14,.0f} rec/s  peak {r['peak_rss_mb']:>8.1f} MB")
+    return report
+
+
+def save_report(report: Dict, path: str) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Bench: Results written to {path}")
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Stages whose throughput dropped by more than `threshold` (fractional) against a
+    baseline report, for sizes and stages present in both.
+    """
+    regressions = []
+    for size, stages in current["sizes"].items():
+        for name, r in stages.items():
+            old = baseline.get("sizes", {}).get(size, {}).get(name)
+            if not old or not old.get("records_per_s") or not r.get("records_per_s"):
+                continue
+            change = r["records_per_s"] / old["records_per_s"] - 1
+            if change < -threshold:
+                regressions.append({
+                    "size": size, "stage": name,
+                    "baseline": old["records_per_s"], "current": r["records_per_s"],
+                    "change": round(change, 3),
+                })
+    return regressions
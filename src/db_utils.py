@@ -1,19 +1,160 @@
+import contextlib
+import json
+import queue
 import sqlite3
+import threading
 from pathlib import Path
 import pandas as pd
+from src.schema import decode_lookups, has_search_index, migrate, rebuild_geo_index, rebuild_rollups, rebuild_search_index
+
+
+class ConnectionPool:
+    """
+    Fixed set of read-only connections to one database, shared by threads (e.g. the
+    `serve` request handlers) so a query doesn't pay for opening a connection and
+    warming its page cache. Connections are opened lazily; borrowing blocks while all
+    `size` are in use.
+    """
+    PRAGMAS = {
+        "cache_size": "-32768",  # 32 MiB page cache per connection
+        "mmap_size": "268435456",
+        "temp_store": "MEMORY",
+    }
+
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()  # most recently used first: warmest cache
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            for pragma, value in self.PRAGMAS.items():
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        except sqlite3.Error:
+            conn.close()
+            raise
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                fresh = self._opened < self.size
+                self._opened += fresh
+            if not fresh:
+                conn = self._idle.get()
+            else:
+                try:
+                    conn = self._open()
+                except Exception:
+                    # give the slot back, or enough failures would leave every borrower blocked
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+@contextlib.contextmanager
+def connection(db_path: str, pool: ConnectionPool = None):
+    """
+    A connection to db_path for one query: borrowed from `pool` when there is one,
+    otherwise opened (and closed) here.
+    """
+    if pool is not None:
+        with pool.connection() as conn:
+            yield conn
+        return
+    conn = sqlite3.connect(db_path)
+    try:
+        yield conn
+    finally:
+        conn.close()
 
 
 class DBUtils:
+    """
+    Maintenance and read helpers for the requests database.
+
+    With partition_dir the data lives in monthly databases (src/partitions.py) rather
+    than db_path: plan() names the files a --since/--until window touches, read_sql()
+    runs a query over just those, and the maintenance commands run per partition.
+    With a ConnectionPool, the read helpers borrow its connections.
+    """
 
-    def __init__(self, db_path="data/nyc311.db"):
+    def __init__(self, db_path="data/nyc311.db", partition_dir=None, pool=None):
         self.db_path = db_path
+        self.pool = pool
+        self.partitions = None
+        if partition_dir is not None:
+            from src.partitions import PartitionSet
+            self.partitions = PartitionSet(partition_dir)
         Path(db_path).parent.mkdir(parents=True, exist_ok=True)
 
     def _connect(self):
         return sqlite3.connect(self.db_path)
 
+    def plan(self, since=None, until=None):
+        """
+        Database files a [since, until) window has to read - every month it overlaps
+        when partitioned, otherwise just db_path.
+        """
+        if self.partitions is None:
+            return [Path(self.db_path)]
+        return self.partitions.plan(since, until)
+
+    def read_sql(self, sql, params=(), since=None, until=None, decode=False):
+        """
+        Run a read query over the window's partitions (see PartitionSet.read_sql) and
+        return the stacked frames; unpartitioned, a plain read of db_path. Aggregates come
+        back once per partition, so callers re-aggregate.
+        """
+        if self.partitions is not None:
+            return self.partitions.read_sql(sql, params, since=since, until=until, decode=decode)
+        with connection(self.db_path, self.pool) as conn:
+            df = pd.read_sql(sql, conn, params=params)
+            return decode_lookups(conn, df) if decode else df
+
+    def each_partition(self):
+        """
+        A DBUtils for every writable database: each hot partition, or just this one.
+        Archives are read-only and never need migrating or rebuilding.
+        """
+        if self.partitions is None:
+            yield self
+            return
+        for month, files in self.partitions.months().items():
+            if "hot" in files:
+                yield DBUtils(str(files["hot"]))
+
+    def latest(self):
+        """
+        The DBUtils holding the newest data (the last month on disk when partitioned,
+        None if there isn't one yet).
+        """
+        if self.partitions is None:
+            return self
+        paths = self.partitions.plan()
+        return DBUtils(str(paths[-1])) if paths else None
+
     def table_exists(self, table="requests"):
-        with self._connect() as conn:
+        with connection(self.db_path, self.pool) as conn:
             cur = conn.execute(
                 "SELECT name FROM sqlite_master WHERE type='table' AND name=?",
                 (table,)
@@ -21,28 +162,152 @@ class DBUtils:
             return cur.fetchone() is not None
 
     def count_rows(self, table="requests"):
+        if self.partitions is not None:
+            counts = self.read_sql(f"SELECT COUNT(*) AS n FROM {table}")
+            return int(counts["n"].sum()) if len(counts) else 0
         if not self.table_exists(table):
             return 0
-        with self._connect() as conn:
+        with connection(self.db_path, self.pool) as conn:
             (count,) = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
             return count
 
     def preview(self, table="requests", n=5):
+        if self.partitions is not None:
+            latest = self.latest()
+            return latest.preview(table, n) if latest else pd.DataFrame()
         if not self.table_exists(table):
             return pd.DataFrame()
+        with connection(self.db_path, self.pool) as conn:
+            df = pd.read_sql(f"SELECT * FROM {table} LIMIT {n}", conn)
+            return decode_lookups(conn, df) if table == "requests" else df
+
+    def migrate(self):
+        """
+        Upgrade the database to the declared schema in src/schema.py (no-op if current).
+        """
+        if self.partitions is not None:
+            return max((part.migrate() for part in self.each_partition()), default=None)
         with self._connect() as conn:
-            return pd.read_sql(f"SELECT * FROM {table} LIMIT {n}", conn)
+            return migrate(conn)
 
     def get_latest_timestamp(self):
+        if self.partitions is not None:
+            latest = self.latest()
+            return latest.get_latest_timestamp() if latest else None
+        if not self.table_exists("requests"):
+            return None
+        with self._connect() as conn:
+            migrate(conn)
+            # Index seek on created_epoch rather than MAX() over the text column.
+            row = conn.execute(
+                "SELECT created_date FROM requests ORDER BY created_epoch DESC LIMIT 1"
+            ).fetchone()
+            return row[0] if row else None
+
+    def get_checkpoint(self, name="requests"):
+        """
+        Ingest checkpoint written by SQLiteWriter: a single primary-key lookup, so
+        working out where the next poll starts is O(1) however big the table is.
+        Returns None if nothing has been ingested yet. Partitioned, the newest month's
+        checkpoint is the one that matters (older months only ever see late rows).
+        """
+        if self.partitions is not None:
+            latest = self.latest()
+            return latest.get_checkpoint(name) if latest else None
         if not self.table_exists("requests"):
             return None
         with self._connect() as conn:
-            (ts,) = conn.execute("SELECT MAX(created_date) FROM requests").fetchone()
-            return ts
+            migrate(conn)
+            row = conn.execute(
+                """
+                SELECT watermark, boundary_keys, rows_processed, pages_processed, updated_at
+                FROM ingest_checkpoint WHERE name = ?
+                """,
+                (name,),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return {
+            "watermark": row[0],
+            "boundary_keys": set(json.loads(row[1])),
+            "rows_processed": row[2],
+            "pages_processed": row[3],
+            "updated_at": row[4],
+        }
+
+    def rebuild_rollups(self):
+        """
+        Recompute rollup_hourly from the requests table and report how many
+        (hour, complaint_type_id, borough_id) groups differed from the trigger-maintained copy.
+        """
+        if self.partitions is not None:
+            return [part.rebuild_rollups() for part in self.each_partition()]
+        with self._connect() as conn:
+            migrate(conn)
+            conn.execute("CREATE TEMP TABLE rollup_before AS SELECT * FROM rollup_hourly WHERE n > 0")
+            rebuild_rollups(conn)
+            (diff,) = conn.execute("""
+                SELECT COUNT(*) FROM (
+                    SELECT * FROM (SELECT * FROM rollup_before EXCEPT SELECT * FROM rollup_hourly)
+                    UNION ALL
+                    SELECT * FROM (SELECT * FROM rollup_hourly EXCEPT SELECT * FROM rollup_before)
+                )
+            """).fetchone()
+            conn.execute("DROP TABLE rollup_before")
+            conn.commit()
+        print(f"Rebuilt rollups: {diff} groups differed from the incremental copy.")
+        return diff
+
+    def rebuild_geo_index(self):
+        """
+        Repopulate the requests_geo R*Tree from the requests table, e.g. after a VACUUM
+        (which may renumber the rowids it's keyed on). Returns the number of indexed rows.
+        """
+        if self.partitions is not None:
+            return [part.rebuild_geo_index() for part in self.each_partition()]
+        with self._connect() as conn:
+            migrate(conn)
+            rebuild_geo_index(conn)
+            (n,) = conn.execute("SELECT COUNT(*) FROM requests_geo").fetchone()
+            conn.commit()
+        print(f"Rebuilt spatial index: {n} rows with coordinates.")
+        return n
+
+    def rebuild_search_index(self):
+        """
+        Re-read requests into the requests_fts full-text index, e.g. if rows were
+        inserted by something other than SQLiteWriter. No-op without FTS5.
+        """
+        if self.partitions is not None:
+            return [part.rebuild_search_index() for part in self.each_partition()]
+        with self._connect() as conn:
+            migrate(conn)
+            if not has_search_index(conn):
+                print("No full-text index in this database (SQLite without FTS5).")
+                return False
+            rebuild_search_index(conn)
+            conn.commit()
+        print("Rebuilt full-text index.")
+        return True
 
     def drop_table(self, table="requests"):
         with self._connect() as conn:
             conn.execute(f"DROP TABLE IF EXISTS {table}")
+            if table == "requests":
+                # keyed on requests.rowid, meaningless without it
+                conn.execute("DROP TABLE IF EXISTS requests_geo")
+                conn.execute("DROP TABLE IF EXISTS requests_fts")
+                # derived from requests too; the migrations rebuild them in their own layout
+                conn.execute("DROP VIEW IF EXISTS requests_decoded")
+                conn.execute("DROP TABLE IF EXISTS rollup_hourly")
+            if self.table_exists("ingest_checkpoint"):
+                conn.execute("DELETE FROM ingest_checkpoint WHERE name = ?", (table,))
+            if table == "requests" and self.table_exists("alert_cursors"):
+                # rowids restart at 1 on the next load, so old cursors would hide every row
+                conn.execute("DELETE FROM alert_cursors")
+            if table == "requests":
+                # Schema is rebuilt from scratch on the next write.
+                conn.execute("PRAGMA user_version = 0")
             conn.commit()
         print(f"Dropped table {table}.")
 
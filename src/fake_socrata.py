@@ -0,0 +1,213 @@
+import gzip
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+# ─────────────────────────────────────────────
+# SoQL subset
+# ─────────────────────────────────────────────
+#
+# Enough of SoQL for the queries NYC311Reader sends: comparisons between a column
+# (including system fields like :updated_at) and a quoted string or number, combined
+# with AND / OR and parentheses.
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|('(?:[^']|'')*')|(>=|<=|!=|<>|=|>|<)|(AND|OR)\b|([:\w.]+))", re.IGNORECASE)
+
+
+def _tokenize(where: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    while pos < len(where.rstrip()):
+        m = _TOKEN.match(where, pos)
+        if not m:
+            raise ValueError(f"Cannot parse $where at: {where[pos:]!r}")
+        pos = m.end()
+        lpar, rpar, string, op, conj, word = m.groups()
+        if lpar:
+            tokens.append(("(", lpar))
+        elif rpar:
+            tokens.append((")", rpar))
+        elif string:
+            tokens.append(("lit", string[1:-1].replace("''", "'")))
+        elif op:
+            tokens.append(("op", "!=" if op == "<>" else op))
+        elif conj:
+            tokens.append((conj.upper(), conj))
+        else:
+            tokens.append(("word", word))
+    return tokens
+
+
+def compile_where(where: str) -> Callable[[pd.DataFrame], pd.Series]:
+    """
+    Turn a $where string into a function DataFrame -> boolean mask.
+    """
+    tokens = _tokenize(where)
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def take(kind):
+        nonlocal pos
+        if peek() != kind:
+            raise ValueError(f"Expected {kind} in $where: {where!r}")
+        pos += 1
+        return tokens[pos - 1][1]
+
+    def parse_or():
+        left = parse_and()
+        while peek() == "OR":
+            take("OR")
+            right = parse_and()
+            left = (lambda a, b: lambda df: a(df) | b(df))(left, right)
+        return left
+
+    def parse_and():
+        left = parse_atom()
+        while peek() == "AND":
+            take("AND")
+            right = parse_atom()
+            left = (lambda a, b: lambda df: a(df) & b(df))(left, right)
+        return left
+
+    def parse_atom():
+        if peek() == "(":
+            take("(")
+            inner = parse_or()
+            take(")")
+            return inner
+        column = take("word")
+        op = take("op")
+        kind = peek()
+        value = take(kind) if kind in ("lit", "word") else take("lit")
+        if kind == "word":
+            value = float(value)
+        ops = {
+            "=": lambda s: s == value, "!=": lambda s: s != value,
+            ">": lambda s: s > value, ">=": lambda s: s >= value,
+            "<": lambda s: s < value, "<=": lambda s: s <= value,
+        }
+        compare = ops[op]
+        return lambda df: compare(df[column]).fillna(False).astype(bool)
+
+    fn = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Trailing tokens in $where: {where!r}")
+    return fn
+
+
+def apply_soql(df: pd.DataFrame, params: dict) -> pd.DataFrame:
+    """
+    Apply $where / $order / $offset / $limit / $select to a DataFrame of string columns.
+    """
+    if params.get("$where"):
+        df = df.loc[compile_where(params["$where"])(df)]
+    if params.get("$order"):
+        cols, asc = [], []
+        for part in params["$order"].split(","):
+            bits = part.split()
+            cols.append(bits[0])
+            asc.append(len(bits) < 2 or bits[1].upper() != "DESC")
+        df = df.sort_values(cols, ascending=asc, kind="stable")
+    offset = int(params.get("$offset", 0))
+    limit = int(params.get("$limit", 1000))
+    df = df.iloc[offset:offset + limit]
+    if params.get("$select"):
+        df = df[[c.strip() for c in params["$select"].split(",") if c.strip() in df.columns]]
+    return df
+
+
+# ─────────────────────────────────────────────
+# HTTP server
+# ─────────────────────────────────────────────
+
+class FakeSocrata:
+    """
+    Local stand-in for the Socrata resource endpoint, serving a DataFrame (e.g. from
+    src.synthetic.generate_records) at /resource/<id>.json and /resource/<id>.csv with
+    $where/$order/$limit/$offset/$select, gzip when asked for, and JSON rows that omit
+    null fields like the real API. Lets ingestion be benchmarked and tested offline.
+
+    Rows get a :updated_at system field (their created_date unless the data has one);
+    update() changes rows and bumps it, like an agency closing a request.
+    """
+    def __init__(self, data: pd.DataFrame, host: str = "127.0.0.1", port: int = 0, dataset_id: str = "erm2-nwe9"):
+        self.data = data.astype(object).where(data.notna(), None)
+        if ":updated_at" not in self.data:
+            self.data[":updated_at"] = self.data["created_date"]
+        self.dataset_id = dataset_id
+        self.requests_served = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    def update(self, keys, updated_at: str, **fields) -> None:
+        """
+        Set `fields` on the rows with these unique_keys and stamp them with updated_at.
+        """
+        mask = self.data["unique_key"].isin(list(keys))
+        for name, value in fields.items():
+            self.data.loc[mask, name] = value
+        self.data.loc[mask, ":updated_at"] = updated_at
+
+    @property
+    def resource_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/resource/{self.dataset_id}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                m = re.fullmatch(rf"/resource/{re.escape(fake.dataset_id)}\.(json|csv)", url.path)
+                if not m:
+                    self.send_error(404)
+                    return
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                try:
+                    page = apply_soql(fake.data, params)
+                except (ValueError, KeyError) as e:
+                    self.send_error(400, str(e))
+                    return
+
+                if m.group(1) == "json":
+                    rows = [{k: v for k, v in rec.items() if v is not None} for rec in page.to_dict("records")]
+                    body, ctype = json.dumps(rows).encode(), "application/json"
+                else:
+                    body, ctype = page.to_csv(index=False).encode(), "text/csv"
+
+                fake.requests_served += 1
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self) -> "FakeSocrata":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
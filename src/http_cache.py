@@ -0,0 +1,126 @@
+import hashlib
+import io
+import json
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlencode
+
+import requests
+
+
+class CacheMiss(RuntimeError):
+    """
+    Raised in replay mode when a request was never recorded. Not a RequestException,
+    so the reader's retry loop doesn't sit through its backoff for it.
+    """
+
+
+class CachedResponse:
+    """
+    Just enough of requests.Response for NYC311Reader: status, body, json(), streaming
+    via iter_content()/raw, and use as a context manager.
+    """
+    def __init__(self, content: bytes, status_code: int = 200, headers: Optional[Dict] = None, url: str = ""):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.url = url
+        self.raw = io.BytesIO(content)
+
+    def json(self):
+        return json.loads(self.content)
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+    def iter_content(self, chunk_size: int = 1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CachedSession:
+    """
+    Drop-in for requests.Session.get that records API responses to disk and replays
+    them, so a pipeline run can be repeated offline byte-for-byte (benchmarks, CI, bug
+    reports against a fixed set of pages).
+
+    Responses are keyed on the URL plus the sorted query params - headers such as the
+    app token are left out of the key on purpose. Each entry is a body file and a small
+    JSON file with the status and content type.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Where entries live.
+    mode: "record" or "replay"
+        record: always hit the network and (over)write the entry - for 2xx responses
+            only, so a throttled (429) or failed (5xx) request is never replayed.
+        replay: serve from disk only, raising CacheMiss for anything not recorded.
+    session: requests.Session, optional
+        Underlying session used when recording.
+    """
+    MODES = ("record", "replay")
+
+    def __init__(self, cache_dir: str = "data/http_cache", mode: str = "replay", session: Optional[requests.Session] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported cache mode: {mode}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.session = session or requests.Session()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    @staticmethod
+    def cache_key(url: str, params: Optional[Dict] = None) -> str:
+        query = urlencode(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+        return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+    def _paths(self, key: str):
+        return self.cache_dir / f"{key}.body", self.cache_dir / f"{key}.json"
+
+    def get(self, url: str, params: Optional[Dict] = None, **kwargs) -> CachedResponse:
+        key = self.cache_key(url, params)
+        body_path, meta_path = self._paths(key)
+
+        if self.mode == "replay":
+            if not meta_path.exists():
+                self.misses += 1
+                raise CacheMiss(f"No recorded response for {url} {params}")
+            meta = json.loads(meta_path.read_text())
+            self.hits += 1
+            return CachedResponse(body_path.read_bytes(), meta["status_code"], meta.get("headers"), url)
+
+        kwargs.pop("stream", None)  # always read the whole body so it can be stored
+        response = self.session.get(url, params=params, **kwargs)
+        content = response.content
+        headers = {k: v for k, v in response.headers.items() if k.lower() == "content-type"}
+        self.misses += 1
+        if not 200 <= response.status_code < 300:
+            return CachedResponse(content, response.status_code, headers, url)
+        body_path.write_bytes(content)
+        meta_path.write_text(json.dumps({
+            "url": url,
+            "params": {str(k): str(v) for k, v in (params or {}).items()},
+            "status_code": response.status_code,
+            "headers": headers,
+        }, indent=2))
+        return CachedResponse(content, response.status_code, headers, url)
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set, Tuple
+
+import pandas as pd
+
+from src.runner import PipelineRunner
+from src.schema import to_epoch
+
+
+class AdaptiveInterval:
+    """
+    Poll interval that follows the arrival rate instead of a fixed sleep.
+
+    - full page: there's a backlog, poll again after min_interval (catch up after bursts)
+    - empty page: back off by `backoff`, up to max_interval (quiet periods)
+    - otherwise: the interval that would fill `target_fill` of a page at the observed
+      arrival rate (an EWMA of rows/s), clamped to [min_interval, max_interval]
+
+    Parameters
+    ----------
+    base: float
+        Starting interval in seconds (the old fixed --interval).
+    """
+    def __init__(
+        self,
+        base: float = 60.0,
+        min_interval: float = 0.0,
+        max_interval: Optional[float] = None,
+        backoff: float = 2.0,
+        target_fill: float = 0.5,
+        alpha: float = 0.3,
+    ):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval if max_interval is not None else base * 8
+        self.backoff = backoff
+        self.target_fill = target_fill
+        self.alpha = alpha
+        self.interval = base
+        self.rate: Optional[float] = None  # rows per second
+
+    def _clamp(self, value: float) -> float:
+        return min(self.max_interval, max(self.min_interval, value))
+
+    def update(self, rows: int, page_size: int, elapsed: float) -> float:
+        """
+        Feed one poll's result (rows returned, page size, seconds since the previous
+        poll) and get the delay before the next one.
+        """
+        if rows >= page_size:
+            # Rate is only a lower bound when the page was full, so don't learn from it.
+            self.interval = self.min_interval
+            return self.interval
+
+        if elapsed > 0:
+            observed = rows / elapsed
+            self.rate = observed if self.rate is None else self.alpha * observed + (1 - self.alpha) * self.rate
+
+        if rows == 0:
+            self.interval = self._clamp(max(self.interval, self.min_interval, 1.0) * self.backoff)
+        elif self.rate:
+            self.interval = self._clamp(self.target_fill * page_size / self.rate)
+        return self.interval
+
+
+class AsyncListener:
+    """
+    Event-loop listener: the next page is fetched while the current one is validated and
+    written, and the gap between polls comes from AdaptiveInterval.
+
+    Polls ascending keyset pages (reader.fetch_page) and carries the cursor in memory,
+    so the next fetch doesn't have to wait for the write to commit and re-read the
+    checkpoint. Fetches run on one worker thread and validate/hooks/write on another;
+    the writer only ever sees one thread, so a persistent SQLite connection is fine.
+
+    Parameters
+    ----------
+    runner: PipelineRunner
+        Supplies reader, writer, hooks and metrics. Each page is one runner cycle.
+    policy: AdaptiveInterval
+    since / inclusive / skip_keys:
+        Where to start, as returned by main.resume_point. skip_keys only apply to the
+        first page (after that the keyset cursor is exact). With no `since` the
+        listener starts at the newest page of the dataset (see _start), not its oldest row.
+    """
+    def __init__(
+        self,
+        runner: PipelineRunner,
+        policy: AdaptiveInterval,
+        since: Optional[str] = None,
+        inclusive: bool = False,
+        skip_keys: Optional[Set[str]] = None,
+    ):
+        self.runner = runner
+        self.policy = policy
+        self.since = since
+        self.inclusive = inclusive
+        self.skip_keys = set(skip_keys or ())
+        self.cursor: Optional[Tuple[str, str]] = None
+        self.polls = 0
+        self.rows = 0
+
+    @property
+    def page_size(self) -> int:
+        reader = self.runner.reader
+        return reader.limit or reader.DEFAULT_PAGE_SIZE
+
+    def _start(self) -> None:
+        """
+        One DESC probe (reader.fetch, the query the --stream loop polls with) and start
+        from the oldest valid created_date on that newest page, inclusive.
+        """
+        page = self.runner.reader.fetch()
+        frame = page if isinstance(page, pd.DataFrame) else pd.DataFrame(page)
+        if "created_date" not in frame:
+            return
+        dates = frame["created_date"].dropna()
+        dates = dates[to_epoch(dates).notna().to_numpy()]
+        if len(dates):
+            self.since, self.inclusive = min(dates), True
+
+    def _fetch(self):
+        start = time.perf_counter()
+        page = self.runner.reader.fetch_page(since=self.since, after=self.cursor, inclusive=self.inclusive)
+        return page, time.perf_counter() - start
+
+    async def run(self, max_polls: Optional[int] = None) -> int:
+        """
+        Poll until cancelled (or max_polls). Returns the number of raw records handled.
+        """
+        loop = asyncio.get_running_loop()
+        fetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="listen-fetch")
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="listen-write")
+        pending = None
+        last_poll = time.monotonic()
+        try:
+            if self.since is None and self.cursor is None:
+                await loop.run_in_executor(fetcher, self._start)
+                print(f"AsyncListener: No start point given, starting at the newest page (since={self.since}).")
+            while max_polls is None or self.polls < max_polls:
+                page, fetch_secs = await loop.run_in_executor(fetcher, self._fetch)
+                now = time.monotonic()
+                elapsed, last_poll = now - last_poll, now
+                self.polls += 1
+                self.rows += len(page)
+                self.cursor = self.runner.reader.page_cursor(page) or self.cursor
+
+                # One write in flight at a time keeps pages in order; anything it raised
+                # surfaces here.
+                if pending is not None:
+                    await pending
+                    pending = None
+                if len(page):
+                    skip, self.skip_keys = self.skip_keys, set()
+                    pending = loop.run_in_executor(writer, self.runner.run_batch, page, skip, fetch_secs)
+
+                delay = self.policy.update(len(page), self.page_size, elapsed)
+                print(f"AsyncListener: Poll {self.polls}: {len(page)} records "
+                      f"(fetch {fetch_secs:.2f}s), next poll in {delay:.1f}s.")
+                if max_polls is not None and self.polls >= max_polls:
+                    break
+                # The write carries on in its thread while we wait and fetch again.
+                await asyncio.sleep(delay)
+        finally:
+            if pending is not None:
+                await asyncio.shield(pending)
+            # close the writer on the thread that opened its connection
+            await loop.run_in_executor(writer, self.runner.writer.close)
+            fetcher.shutdown(wait=False)
+            writer.shutdown(wait=True)
+        return self.rows
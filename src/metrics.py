@@ -0,0 +1,248 @@
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# name -> (type, help). Everything the runner reports lives here so the textfile
+# always has the same series, even before the first cycle.
+METRICS = {
+    "nyc311_cycles_total": ("counter", "ETL cycles completed"),
+    "nyc311_cycle_errors_total": ("counter", "ETL cycles that raised"),
+    "nyc311_stage_seconds_total": ("counter", "Wall time spent per stage"),
+    "nyc311_fetch_requests_total": ("counter", "HTTP requests issued to the API (including retries)"),
+    "nyc311_fetch_retries_total": ("counter", "HTTP requests that were retries"),
+    "nyc311_fetch_bytes_total": ("counter", "Response bytes received from the API"),
+    "nyc311_records_total": ("counter", "Raw records by validation outcome"),
+    "nyc311_rows_written_total": ("counter", "Validated rows by write result"),
+    "nyc311_last_cycle_seconds": ("gauge", "Duration of the most recent cycle"),
+    "nyc311_last_cycle_timestamp_seconds": ("gauge", "Unix time the most recent cycle finished"),
+    "nyc311_last_stage_seconds": ("gauge", "Per-stage wall time of the most recent cycle"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    """
+    Per-stage instrumentation for PipelineRunner.
+
+    During a cycle the runner times stages (fetch, validate, hooks, write) and adds
+    counts to `self.cycle`; when the cycle ends it's folded into cumulative Prometheus
+    style counters and handed to every exporter. Cheap enough to always be on - it's
+    the exporters that are opt-in.
+
+    Parameters
+    ----------
+    exporters: list, optional
+        Objects with export(metrics, cycle), e.g. PrometheusTextfile / JSONLinesExporter.
+    """
+    def __init__(self, exporters: Optional[List] = None):
+        self.exporters = exporters or []
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        self.cycle: Optional[Dict] = None
+        self.last_cycle: Optional[Dict] = None
+        self._lock = threading.Lock()
+
+    # ── cumulative series ──
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name: str, **labels) -> float:
+        return self.values.get((name, tuple(sorted(labels.items()))), 0.0)
+
+    # ── per cycle ──
+
+    def start_cycle(self, kind: str) -> None:
+        self.cycle = {
+            "kind": kind,
+            "started_at": time.time(),
+            "stages": {},
+            "fetch": {"requests": 0, "retries": 0, "bytes": 0},
+            "records": {"raw": 0, "accepted": 0, "rejected": {}},
+            "rows": {"inserted": 0, "updated": 0, "ignored": 0},
+            "batches": 0,
+        }
+        self._cycle_t0 = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.cycle is not None:
+                stages = self.cycle["stages"]
+                stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        """
+        Time for a stage measured somewhere else (e.g. a fetch that ran on another thread).
+        """
+        stages = self.cycle["stages"]
+        stages[name] = stages.get(name, 0.0) + seconds
+
+    def add_fetch(self, requests: int = 0, retries: int = 0, nbytes: int = 0) -> None:
+        f = self.cycle["fetch"]
+        f["requests"] += requests
+        f["retries"] += retries
+        f["bytes"] += nbytes
+
+    def add_validation(self, raw: int, accepted: int, rejected: Dict[str, int]) -> None:
+        r = self.cycle["records"]
+        r["raw"] += raw
+        r["accepted"] += accepted
+        for reason, count in rejected.items():
+            r["rejected"][reason] = r["rejected"].get(reason, 0) + count
+
+    def add_write(self, rows: int, inserted: int, updated: int = 0) -> None:
+        self.cycle["rows"]["inserted"] += inserted
+        self.cycle["rows"]["updated"] += updated
+        self.cycle["rows"]["ignored"] += rows - inserted - updated
+        self.cycle["batches"] += 1
+
+    def end_cycle(self, error: Optional[BaseException] = None) -> Dict:
+        cycle, self.cycle = self.cycle, None
+        cycle["seconds"] = round(time.perf_counter() - self._cycle_t0, 6)
+        cycle["finished_at"] = time.time()
+        cycle["stages"] = {k: round(v, 6) for k, v in cycle["stages"].items()}
+        if error is not None:
+            cycle["error"] = repr(error)
+
+        self.inc("nyc311_cycle_errors_total" if error is not None else "nyc311_cycles_total", kind=cycle["kind"])
+        for stage, secs in cycle["stages"].items():
+            self.inc("nyc311_stage_seconds_total", secs, stage=stage)
+            self.set("nyc311_last_stage_seconds", secs, stage=stage)
+        self.inc("nyc311_fetch_requests_total", cycle["fetch"]["requests"])
+        self.inc("nyc311_fetch_retries_total", cycle["fetch"]["retries"])
+        self.inc("nyc311_fetch_bytes_total", cycle["fetch"]["bytes"])
+        self.inc("nyc311_records_total", cycle["records"]["accepted"], outcome="accepted")
+        for reason, count in cycle["records"]["rejected"].items():
+            self.inc("nyc311_records_total", count, outcome="rejected", reason=reason)
+        for result in ("inserted", "updated", "ignored"):
+            self.inc("nyc311_rows_written_total", cycle["rows"][result], result=result)
+        self.set("nyc311_last_cycle_seconds", cycle["seconds"])
+        self.set("nyc311_last_cycle_timestamp_seconds", cycle["finished_at"])
+
+        self.last_cycle = cycle
+        for exporter in self.exporters:
+            try:
+                exporter.export(self, cycle)
+            except OSError as e:
+                print(f"Metrics: Export to {exporter} failed: {e}")
+        return cycle
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            series = sorted((labels, v) for (n, labels), v in self.values.items() if n == name)
+            if not series and kind == "counter":
+                series = [((), 0.0)]
+            for labels, value in series:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                value = _number(value)
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusTextfile:
+    """
+    Rewrites a Prometheus exposition file after every cycle, for node_exporter's
+    textfile collector. Written to a temp file and renamed so scrapes never see half a file.
+    """
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, metrics: Metrics, cycle: Dict) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(metrics.to_prometheus())
+        os.replace(tmp, self.path)
+
+    def __repr__(self):
+        return f"PrometheusTextfile({self.path})"
+
+
+class JSONLinesExporter:
+    """
+    Appends one JSON object per cycle (stage timings, fetch/validation/write counts).
+    """
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, metrics: Metrics, cycle: Dict) -> None:
+        with open(self.path, "a") as f:
+            f.write(json.dumps(cycle) + "\n")
+
+    def __repr__(self):
+        return f"JSONLinesExporter({self.path})"
+
+
+@contextlib.contextmanager
+def profile(mode: str, out_path: str, top: int = 25):
+    """
+    Profile whatever runs inside the block.
+
+    mode="cprofile": pstats dump to `out_path` (open with snakeviz / pstats) plus the
+        top functions by cumulative time printed.
+    mode="tracemalloc": the top allocation sites by line written to `out_path`, with the
+        traced peak.
+    """
+    if mode not in ("cprofile", "tracemalloc"):
+        raise ValueError(f"Unsupported profile mode: {mode}")
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+
+    if mode == "cprofile":
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(out_path)
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+            print(buf.getvalue())
+            print(f"Metrics: cProfile stats written to {out_path}")
+        return
+
+    already = tracemalloc.is_tracing()
+    if not already:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        if not already:
+            tracemalloc.stop()
+        with open(out_path, "w") as f:
+            f.write(f"peak traced memory: {peak / 2**20:.1f} MiB\n")
+            for stat in snapshot.statistics("lineno")[:top]:
+                f.write(f"{stat}\n")
+        print(f"Metrics: tracemalloc peak {peak / 2**20:.1f} MiB, top sites written to {out_path}")
@@ -0,0 +1,178 @@
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+import pandas as pd
+
+from src.schema import REQUESTS_COLUMNS, to_epoch
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for the parquet sink
+    pa = ds = pq = None
+
+PARTITION_KEYS = ("year", "month", "day")
+DICTIONARY_COLUMNS = ["complaint_type", "borough"]
+_ARROW_TYPES = {"TEXT": "string", "INTEGER": "int64", "REAL": "float64"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("The parquet store needs pyarrow: pip install pyarrow")
+
+
+class ParquetStore:
+    """
+    Hive-partitioned (year=/month=/day=) parquet copy of the requests table.
+
+    - Each append writes one new file per touched partition, with dictionary encoding
+      on the low-cardinality string columns.
+    - Rows are deduped on unique_key within their partition. The keys already present
+      in a partition are read once (unique_key column only) and then cached.
+    - Once a partition has more than `compact_after` files they're merged into one.
+    - scan() prunes partitions from the since/until window and reads only the
+      requested columns.
+    """
+    def __init__(self, root: str = "data/parquet", table: str = "requests", compact_after: int = 16):
+        _require_pyarrow()
+        self.root = Path(root) / table
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.compact_after = compact_after
+        self._keys: Dict[Tuple[int, int, int], Set[str]] = {}
+        self.schema = pa.schema([
+            (name, _ARROW_TYPES[decl.split()[0]]) for name, decl in REQUESTS_COLUMNS.items()
+        ])
+        self.partitioning = ds.partitioning(
+            pa.schema([(k, pa.int32()) for k in PARTITION_KEYS]), flavor="hive"
+        )
+
+    def _partition_dir(self, part: Tuple[int, int, int]) -> Path:
+        return self.root.joinpath(*(f"{k}={v}" for k, v in zip(PARTITION_KEYS, part)))
+
+    def _partition_keys(self, part: Tuple[int, int, int]) -> Set[str]:
+        if part not in self._keys:
+            files = sorted(self._partition_dir(part).glob("*.parquet"))
+            keys = set()
+            for f in files:
+                keys.update(pq.ParquetFile(f).read(columns=["unique_key"]).column(0).to_pylist())
+            self._keys[part] = keys
+        return self._keys[part]
+
+    def _to_arrow(self, df: pd.DataFrame) -> "pa.Table":
+        df = df.reindex(columns=list(REQUESTS_COLUMNS))
+        return pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+    def append(self, df: pd.DataFrame) -> int:
+        """
+        Append a validated batch; returns the number of new (non-duplicate) rows.
+        """
+        df = df.copy()
+        if "created_epoch" not in df:
+            df["created_epoch"] = to_epoch(df["created_date"])
+        df = df.dropna(subset=["created_epoch"]).drop_duplicates("unique_key", keep="first")
+        df["created_epoch"] = df["created_epoch"].astype("int64")
+        dt = pd.to_datetime(df["created_epoch"], unit="s")
+
+        written = 0
+        for part, rows in df.groupby([dt.dt.year, dt.dt.month, dt.dt.day]):
+            part = tuple(int(p) for p in part)
+            seen = self._partition_keys(part)
+            rows = rows.loc[~rows["unique_key"].isin(seen)]
+            if rows.empty:
+                continue
+
+            out_dir = self._partition_dir(part)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+            pq.write_table(
+                self._to_arrow(rows), out_dir / name,
+                use_dictionary=DICTIONARY_COLUMNS, compression="zstd",
+            )
+            seen.update(rows["unique_key"])
+            written += len(rows)
+
+            if len(list(out_dir.glob("*.parquet"))) > self.compact_after:
+                self.compact_partition(part)
+        return written
+
+    def compact_partition(self, part: Tuple[int, int, int]) -> None:
+        """
+        Merge all files of one partition into a single file sorted by created_epoch.
+        The merged file is written before the old ones are removed.
+        """
+        out_dir = self._partition_dir(part)
+        files = sorted(out_dir.glob("*.parquet"))
+        if len(files) <= 1:
+            return
+        # Go through pandas per file so files from before a column was added still line up.
+        df = pd.concat([pq.ParquetFile(f).read().to_pandas() for f in files], ignore_index=True)
+        df = df.drop_duplicates("unique_key", keep="first").sort_values("created_epoch")
+        name = f"compacted-{time.time_ns()}.parquet"
+        pq.write_table(self._to_arrow(df), out_dir / name, use_dictionary=DICTIONARY_COLUMNS, compression="zstd")
+        for f in files:
+            f.unlink()
+        print(f"ParquetStore: Compacted {len(files)} files in {out_dir.relative_to(self.root)}.")
+
+    def compact(self) -> None:
+        for day_dir in self.root.glob("year=*/month=*/day=*"):
+            part = tuple(int(p.split("=")[1]) for p in day_dir.relative_to(self.root).parts)
+            self.compact_partition(part)
+
+    @staticmethod
+    def _partition_filter(ts: pd.Timestamp, op: str):
+        """
+        Partition-only expression for created >= ts (op ">=") or created < ts (op "<"),
+        so whole year/month/day directories outside the window are never opened.
+        """
+        y, m, d = ds.field("year"), ds.field("month"), ds.field("day")
+        if op == ">=":
+            return (y > ts.year) | ((y == ts.year) & ((m > ts.month) | ((m == ts.month) & (d >= ts.day))))
+        return (y < ts.year) | ((y == ts.year) & ((m < ts.month) | ((m == ts.month) & (d <= ts.day))))
+
+    def scan(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Read [since, until) with partition pruning and column projection.
+        """
+        if not any(self.root.glob("year=*")):
+            return pd.DataFrame(columns=list(columns or REQUESTS_COLUMNS))
+        # Explicit schema so files written before a column was added read it as null.
+        schema = self.schema
+        for field in self.partitioning.schema:
+            schema = schema.append(field)
+        dataset = ds.dataset(self.root, format="parquet", partitioning=self.partitioning, schema=schema)
+
+        expr = None
+        for bound, op in ((since, ">="), (until, "<")):
+            if bound is None:
+                continue
+            epoch = int(to_epoch([bound]).iloc[0])
+            ts = pd.Timestamp(epoch, unit="s")
+            cond = self._partition_filter(ts, op) & (
+                ds.field("created_epoch") >= epoch if op == ">=" else ds.field("created_epoch") < epoch
+            )
+            expr = cond if expr is None else expr & cond
+
+        cols = list(columns) if columns else list(REQUESTS_COLUMNS)
+        return dataset.to_table(columns=cols, filter=expr).to_pandas()
+
+    def latest_timestamp(self) -> Optional[str]:
+        """
+        Newest created_date in the store, reading only the most recent day partition.
+        """
+        days = sorted(
+            self.root.glob("year=*/month=*/day=*"),
+            key=lambda p: tuple(int(x.split("=")[1]) for x in p.relative_to(self.root).parts),
+        )
+        if not days:
+            return None
+        table = ds.dataset(days[-1], format="parquet").to_table(columns=["created_date", "created_epoch"])
+        df = table.to_pandas()
+        return df.sort_values(["created_epoch", "created_date"]).iloc[-1]["created_date"]
@@ -0,0 +1,264 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import stat
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from src.schema import LOOKUPS, decode_lookups, has_search_index, to_epoch
+
+# data/partitions/requests_2025_01.db          hot month, written by PartitionedSQLiteWriter
+# data/partitions/archive/requests_2024_06.db  closed month, VACUUMed and read-only
+# data/partitions/archive/requests_2024_06.db.gz  ... or compressed (unpacked into .cache/ on read)
+PREFIX = "requests_"
+
+
+def month_of(ts) -> str:
+    """
+    Partition key ("YYYY_MM") for a timestamp / ISO string.
+    """
+    return pd.Timestamp(ts).strftime("%Y_%m")
+
+
+def _month_start(month: str) -> pd.Timestamp:
+    year, mon = month.split("_")
+    return pd.Timestamp(year=int(year), month=int(mon), day=1)
+
+
+def _months_between(older: str, newer: str) -> int:
+    a, b = _month_start(older), _month_start(newer)
+    return (b.year - a.year) * 12 + b.month - a.month
+
+
+class PartitionSet:
+    """
+    One SQLite database per calendar month of created_date under `root`.
+
+    Every partition is a complete nyc311 database (same schema, rollups, spatial and
+    full-text indexes), so everything that works on data/nyc311.db works on a month;
+    what this class adds is where each month lives, which months a [since, until)
+    window needs, and moving closed months into the archive.
+    """
+    def __init__(self, root: str = "data/partitions"):
+        self.root = Path(root)
+        self.archive_dir = self.root / "archive"
+        self.cache_dir = self.root / ".cache"
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def hot_path(self, month: str) -> Path:
+        return self.root / f"{PREFIX}{month}.db"
+
+    def months(self) -> Dict[str, Dict[str, Path]]:
+        """
+        month -> {"hot": path, "archive": path} for whichever exist. A month can have
+        both when late rows arrived after it was archived; compact() merges them.
+        """
+        out: Dict[str, Dict[str, Path]] = {}
+        for path in self.root.glob(f"{PREFIX}*.db"):
+            out.setdefault(path.name[len(PREFIX):-3], {})["hot"] = path
+        for path in self.archive_dir.glob(f"{PREFIX}*.db*"):
+            month = path.name[len(PREFIX):].split(".")[0]
+            out.setdefault(month, {})["archive"] = path
+        return dict(sorted(out.items()))
+
+    def plan(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Path]:
+        """
+        Database files a [since, until) window has to read, oldest month first; months
+        entirely outside the window are never opened.
+        """
+        lo = None if since is None else month_of(since)
+        hi = None if until is None else month_of(pd.Timestamp(until) - pd.Timedelta(microseconds=1))
+        paths = []
+        for month, files in self.months().items():
+            if (lo is not None and month < lo) or (hi is not None and month > hi):
+                continue
+            if "archive" in files:
+                paths.append(self.readable(files["archive"]))
+            if "hot" in files:
+                paths.append(files["hot"])
+        return paths
+
+    def readable(self, path: Path) -> Path:
+        """
+        A path sqlite can open: compressed archives are unpacked into .cache/ (once,
+        until the archive changes).
+        """
+        if path.suffix != ".gz":
+            return path
+        cached = self.cache_dir / path.name[:-3]
+        if not cached.exists() or cached.stat().st_mtime < path.stat().st_mtime:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_suffix(".tmp")
+            with gzip.open(path, "rb") as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp, cached)
+        return cached
+
+    def read_sql(
+        self,
+        sql: str,
+        params=(),
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        decode: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Run `sql` against every partition the window overlaps and stack the results.
+
+        Partitions are ATTACHed one at a time (read-only) to a single in-memory
+        connection: with nothing in `main`, the unqualified table names in `sql`
+        resolve to the attached month, so the same SQL runs unchanged. decode=True
+        turns lookup ids into Categorical columns while the month's lookups are
+        attached (ids are per partition).
+        """
+        frames = []
+        with sqlite3.connect(":memory:", uri=True) as conn:
+            for path in self.plan(since, until):
+                conn.execute("ATTACH DATABASE ? AS part", (f"{Path(path).resolve().as_uri()}?mode=ro",))
+                try:
+                    df = pd.read_sql(sql, conn, params=params)
+                    frames.append(decode_lookups(conn, df) if decode else df)
+                finally:
+                    conn.execute("DETACH DATABASE part")
+        if not frames:
+            return pd.DataFrame()
+        df = pd.concat(frames, ignore_index=True)
+        for name in LOOKUPS:
+            # categories differ between months, so concat falls back to object
+            if decode and name in df and df[name].dtype == object:
+                df[name] = df[name].astype("category")
+        return df
+
+    def archived_keys(self, month: str, keys) -> set:
+        """
+        The subset of `keys` (unique_keys) already in the month's archive.
+        """
+        archive = self.months().get(month, {}).get("archive")
+        if archive is None:
+            return set()
+        uri = f"{self.readable(archive).resolve().as_uri()}?mode=ro"
+        with sqlite3.connect(uri, uri=True) as conn:
+            rows = conn.execute(
+                "SELECT unique_key FROM requests WHERE unique_key IN (SELECT value FROM json_each(?))",
+                (json.dumps([str(k) for k in keys]),),
+            )
+            return {k for (k,) in rows}
+
+    def searchable(self) -> bool:
+        """
+        Whether the partitions carry the FTS index (they're all built by the same code).
+        """
+        paths = self.plan()
+        if not paths:
+            return False
+        with sqlite3.connect(f"{Path(paths[-1]).resolve().as_uri()}?mode=ro", uri=True) as conn:
+            return has_search_index(conn)
+
+    # ── retention ──
+
+    def compact(self, month: str, compress: bool = False) -> Path:
+        """
+        Turn a month's hot partition into its archive: merge it into any existing
+        archive (late rows), optimise the FTS index, VACUUM INTO a fresh file in
+        rollback-journal mode and make it read-only (gzipped if `compress`). The hot
+        file is removed once the archive is in place.
+        """
+        from src.writer import SQLiteWriter
+
+        files = self.months().get(month, {})
+        hot = files.get("hot")
+        if hot is None:
+            raise ValueError(f"No hot partition for {month}.")
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        work = self.archive_dir / f".{PREFIX}{month}.work.db"
+        out = self.archive_dir / f"{PREFIX}{month}.db"
+
+        source = hot
+        if "archive" in files:
+            # Late rows: start from the archive and upsert the hot rows into it.
+            shutil.copyfile(self.readable(files["archive"]), work)
+            os.chmod(work, stat.S_IRUSR | stat.S_IWUSR)
+            with sqlite3.connect(hot) as conn:
+                late = pd.read_sql("SELECT * FROM requests_decoded", conn).drop(columns=["rid"])
+            with SQLiteWriter(str(work), mode="upsert") as writer:
+                writer.write(late)
+            source = work
+
+        tmp = out.with_suffix(".tmp")
+        tmp.unlink(missing_ok=True)
+        with sqlite3.connect(source) as conn:
+            if has_search_index(conn):
+                conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('optimize')")
+                conn.commit()
+            conn.execute("VACUUM INTO ?", (str(tmp),))
+        with sqlite3.connect(tmp) as conn:
+            # WAL needs a writable -shm next to the file; archives are opened read-only.
+            conn.execute("PRAGMA journal_mode = DELETE")
+
+        for old in self.archive_dir.glob(f"{PREFIX}{month}.db*"):
+            os.chmod(old, stat.S_IRUSR | stat.S_IWUSR)
+            old.unlink()
+        if compress:
+            final = out.with_name(out.name + ".gz")
+            with open(tmp, "rb") as src, gzip.open(final, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            tmp.unlink()
+        else:
+            final = out
+            os.replace(tmp, final)
+        os.chmod(final, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        work.unlink(missing_ok=True)
+        (self.cache_dir / out.name).unlink(missing_ok=True)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{hot}{suffix}").unlink(missing_ok=True)
+        print(f"Partitions: Archived {month} → {final} ({final.stat().st_size / 2**20:.1f} MiB).")
+        return final
+
+    def drop(self, month: str) -> None:
+        for path in self.months().get(month, {}).values():
+            os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+            for suffix in ("", "-wal", "-shm"):
+                Path(f"{path}{suffix}").unlink(missing_ok=True)
+        (self.cache_dir / f"{PREFIX}{month}.db").unlink(missing_ok=True)
+        print(f"Partitions: Dropped {month}.")
+
+    def apply_retention(
+        self,
+        hot_months: int = 3,
+        keep_months: Optional[int] = None,
+        compress: bool = False,
+        now=None,
+    ) -> Dict[str, List[str]]:
+        """
+        Retention policy, by age in months relative to `now` (the current month is 0):
+
+        - hot partitions `hot_months` or older are compacted into the archive
+          (only closed months - the current month is never archived)
+        - with keep_months, every month that old or older is deleted outright
+        """
+        current = month_of(pd.Timestamp.now() if now is None else now)
+        done = {"archived": [], "dropped": []}
+        for month, files in self.months().items():
+            age = _months_between(month, current)
+            if keep_months is not None and age >= keep_months:
+                self.drop(month)
+                done["dropped"].append(month)
+            elif "hot" in files and age >= max(hot_months, 1):
+                self.compact(month, compress=compress)
+                done["archived"].append(month)
+        return done
+
+
+def split_by_month(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """
+    Batch -> {month: rows}, by created_date. Rows without a parseable date are left out.
+    """
+    epoch = to_epoch(df["created_date"]).to_numpy()
+    months = pd.to_datetime(epoch, unit="s").strftime("%Y_%m")
+    keyed = pd.Series(months, index=df.index).where(~pd.isna(epoch))
+    return {month: df.loc[rows] for month, rows in keyed.groupby(keyed).groups.items()}
@@ -1,8 +1,20 @@
+import codecs
+import io
+import json
 import requests
-import time
 import os
+import pandas as pd
 from abc import ABC, abstractmethod
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Iterator, Optional, Tuple, Union
+from src.scheduler import RequestScheduler
+from src.schema import RECORD_FIELDS
+
+# Socrata system field: when the row last changed upstream.
+UPDATED_AT = ":updated_at"
+
+# A page of raw records: list of dicts from the JSON endpoint, or a DataFrame of
+# strings from the CSV endpoint. validate_batch accepts either.
+Page = Union[List[Dict], pd.DataFrame]
 
 class ReaderBase(ABC):
     def fetch(self, *args) -> List[Dict]:
@@ -18,14 +30,70 @@ class NYC311Reader(ReaderBase):
     Parameters 
     ----------
     limit: int
+        Rows per request. In paged mode this is the page size.
+    fmt: "json" or "csv"
+        CSV pages are parsed with pandas' C parser straight into a DataFrame instead of
+        response.json() building one dict per row.
+    select: bool
+        Ask the API for only the columns NYC311Record keeps ($select), rather than all ~40.
+    session: requests.Session-like, optional
+        Anything with .get() and .headers, e.g. src.http_cache.CachedSession to record or
+        replay responses.
+    base_url: str, optional
+        Resource URL without the extension (e.g. a local src.fake_socrata server);
+        ".json"/".csv" is appended for the format.
+    scheduler: RequestScheduler, optional
+        Share one between readers (e.g. backfill workers) so they're rate limited
+        together. Defaults to one sized for the app token (unthrottled for base_url).
     """
     BASE_URL = "https://data.cityofnewyork.us/resource/erm2-nwe9.json"
-    def __init__(self, limit: int = 500, app_token: Optional[str] = None):
+    CSV_URL = "https://data.cityofnewyork.us/resource/erm2-nwe9.csv"
+    DEFAULT_PAGE_SIZE = 1000  # Socrata's own default $limit
+    def __init__(
+        self,
+        limit: int = 500,
+        app_token: Optional[str] = None,
+        fmt: str = "json",
+        select: bool = True,
+        session=None,
+        base_url: Optional[str] = None,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        if fmt not in ("json", "csv"):
+            raise ValueError(f"Unsupported format: {fmt}")
         self.limit = limit
-        self.session = requests.Session()
+        self.fmt = fmt
+        self.select = select
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.session = session or requests.Session()
+        # requests already offers gzip by default; made explicit since transfer size matters here.
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
         self.app_token = app_token or os.getenv("NYC_APP_TOKEN")
+        if scheduler is None:
+            scheduler = RequestScheduler(rate=None) if base_url else RequestScheduler.for_token(self.app_token)
+        self.scheduler = scheduler
+        # Cumulative request counters; PipelineRunner diffs them per cycle for its metrics.
+        self.stats = {"requests": 0, "retries": 0, "bytes": 0}
+
+    @property
+    def url(self) -> str:
+        if self.base_url:
+            return f"{self.base_url}.{self.fmt}"
+        return self.CSV_URL if self.fmt == "csv" else self.BASE_URL
+
+    def _base_params(self) -> Dict:
+        return {"$select": ",".join(RECORD_FIELDS)} if self.select else {}
 
-    def fetch(self, since: Optional[str] = None) -> List[Dict]:
+    def _decode(self, response) -> Page:
+        if self.fmt == "json":
+            return response.json()
+        if not response.content.strip():
+            return pd.DataFrame()
+        df = pd.read_csv(io.BytesIO(response.content), dtype=str, keep_default_na=False)
+        # The JSON API leaves null fields out; mirror that so validation behaves the same.
+        return df.replace("", None)
+
+    def fetch(self, since: Optional[str] = None, inclusive: bool = False) -> Page:
         """
         Fetchs data from the NYC 311 API.         
         
@@ -34,47 +102,251 @@ class NYC311Reader(ReaderBase):
         since: str, optional
             ISO timestamp filter, e.g. 2024-12-01. 
             If provided, fetches only records created after this timestamp. 
+        inclusive: bool
+            Use created_date >= since (for resuming from a checkpoint watermark).
         
         Returns
         -------
         list of dicts
-            Raw JSON records.
+            Raw JSON records (a DataFrame of strings for fmt="csv").
         """
         params = {
+            **self._base_params(),
             "$limit": self.limit,
             "$order": "created_date DESC"
         }
 
         if since:
-            params["$where"] = f"created_date > '{since}'"
+            op = ">=" if inclusive else ">"
+            params["$where"] = f"created_date {op} '{since}'"
+
+        return self._get(params)
+
+    def fetch_pages(
+        self,
+        since: Optional[str] = None,
+        after: Optional[Tuple[str, str]] = None,
+        until: Optional[str] = None,
+        inclusive: bool = False,
+        order_by: str = "created_date",
+    ) -> Iterator[Page]:
+        """
+        Walks the dataset in ascending order, one page of `limit` rows at a time.
+
+        Uses keyset pagination on (created_date, unique_key) rather than $offset, so
+        each page is a cheap index seek on the API side and rows sharing a timestamp
+        are never skipped or repeated between pages.
+
+        Parameters
+        ----------
+        since: str, optional
+            ISO timestamp, only rows created after this are returned.
+        after: (created_date, unique_key), optional
+            Keyset cursor of the last row already processed (e.g. from a crashed run).
+            Takes precedence over `since`.
+        until: str, optional
+            ISO timestamp upper bound (exclusive), used to fetch a fixed time slice.
+        inclusive: bool
+            Treat `since` as `>=` instead of `>` (slice starts).
+        order_by: str
+            Keyset column. UPDATED_AT walks records by when they last changed instead,
+            so since/after/until refer to :updated_at ("updated since" mode).
+
+        Yields
+        ------
+        list of dicts (or DataFrame for fmt="csv")
+            Raw records for one page, in ascending (created_date, unique_key) order.
+        """
+        page_size = self.limit or self.DEFAULT_PAGE_SIZE
+        cursor = after
+        while True:
+            page = self.fetch_page(since=since, after=cursor, until=until, inclusive=inclusive, order_by=order_by)
+            if len(page) == 0:
+                return
+
+            yield page
+
+            cursor = self.page_cursor(page, order_by) or cursor
+            if len(page) < page_size:
+                return
+
+    def fetch_page(
+        self,
+        since: Optional[str] = None,
+        after: Optional[Tuple[str, str]] = None,
+        until: Optional[str] = None,
+        inclusive: bool = False,
+        order_by: str = "created_date",
+    ) -> Page:
+        """
+        One ascending keyset page (see fetch_pages) - the listener polls with this,
+        carrying the cursor itself between polls.
+        """
+        params = {
+            **self._base_params(),
+            "$limit": self.limit or self.DEFAULT_PAGE_SIZE,
+            "$order": f"{order_by} ASC, unique_key ASC",
+        }
+        if "$select" in params and order_by not in RECORD_FIELDS:
+            # system fields are only returned when selected
+            params["$select"] += f",{order_by}"
+        where = self._keyset_where(since, after, until, inclusive, column=order_by)
+        if where:
+            params["$where"] = where
+        return self._get(params)
+
+    @staticmethod
+    def _keyset_where(
+        since: Optional[str],
+        cursor: Optional[Tuple[str, str]],
+        until: Optional[str] = None,
+        inclusive: bool = False,
+        column: str = "created_date",
+    ) -> Optional[str]:
+        clauses = []
+        if cursor:
+            ts, key = cursor
+            clauses.append(
+                f"({column} > '{ts}' OR "
+                f"({column} = '{ts}' AND unique_key > '{key}'))"
+            )
+        elif since:
+            op = ">=" if inclusive else ">"
+            clauses.append(f"{column} {op} '{since}'")
+        if until:
+            clauses.append(f"{column} < '{until}'")
+        return " AND ".join(clauses) or None
+
+    @staticmethod
+    def page_cursor(page: Page, column: str = "created_date") -> Optional[Tuple[str, str]]:
+        """
+        Keyset cursor (created_date, unique_key) of the last row in an ascending page
+        (or (`column`, unique_key) for other keyset columns).
+        """
+        if isinstance(page, pd.DataFrame):
+            if column not in page:
+                return None
+            keyed = page[[column, "unique_key"]].dropna()
+            return tuple(keyed.iloc[-1]) if len(keyed) else None
+        for rec in reversed(page):
+            if rec.get(column) and rec.get("unique_key"):
+                return rec[column], rec["unique_key"]
+        return None
+
+    def fetch_stream(
+        self,
+        since: Optional[str] = None,
+        inclusive: bool = False,
+        chunk_rows: int = 5000,
+    ) -> Iterator[Page]:
+        """
+        Same query as fetch(), but the response body is decoded incrementally while it
+        downloads and handed on in chunks of `chunk_rows` records, so a huge $limit
+        never has to sit in memory as one body plus one list of dicts.
+
+        Yields lists of dicts (JSON) or DataFrames (CSV). Connection errors are retried
+        as usual; an error after records have started flowing is raised.
+        """
+        params = {
+            **self._base_params(),
+            "$limit": self.limit,
+            "$order": "created_date DESC"
+        }
+        if since:
+            op = ">=" if inclusive else ">"
+            params["$where"] = f"created_date {op} '{since}'"
+
+        response = self._request(params, stream=True)
+        with response:
+            if self.fmt == "csv":
+                response.raw.decode_content = True  # let urllib3 gunzip
+                try:
+                    for chunk in pd.read_csv(response.raw, dtype=str, keep_default_na=False, chunksize=chunk_rows):
+                        yield chunk.replace("", None)
+                except pd.errors.EmptyDataError:
+                    return
+                finally:
+                    # bytes off the wire so far (compressed), as far as the raw stream knows
+                    tell = getattr(response.raw, "tell", None)
+                    if tell:
+                        self.stats["bytes"] += tell()
+                return
+
+            batch = []
+            for rec in iter_json_array(self._counted(response.iter_content(chunk_size=64 * 1024))):
+                batch.append(rec)
+                if len(batch) >= chunk_rows:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def _counted(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        for chunk in chunks:
+            self.stats["bytes"] += len(chunk)
+            yield chunk
+
+    def _get(self, params: Dict) -> Page:
+        """
+        Single GET against the API with retry + backoff, decoded in one go.
+        """
+        response = self._request(params)
+        self.stats["bytes"] += len(response.content)
+        return self._decode(response)
 
+    def _request(self, params: Dict, stream: bool = False):
+        """
+        Issues the GET through the request scheduler (rate limit, Retry-After, jittered
+        backoff, circuit breaker) and returns the response.
+        """
         headers = {}
         if self.app_token:
-            print("Trying with App Token")
             headers['X-App-Token'] = self.app_token
-        
-        for attempt in range(5):
-            print(f"Trying attempt {attempt + 1}...")
-            wait_time = 2 ** attempt
-            try: 
-                response = self.session.get(
-                    self.BASE_URL,
-                    params=params, 
-                    headers=headers,
-                    timeout=10
-                )
-                response.raise_for_status()
-                if response.status_code == 429 and e.response is not None:
-                    print(f"Rate limit hit. Retrying in {wait_time}s.")
-                    time.sleep(wait_time)
-                    continue
-                
-                return response.json()
-
-            except requests.RequestException as e:
-                print(f"Network error: {e}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
+
+        return self.scheduler.request(
+            lambda: self.session.get(
+                self.url,
+                params=params,
+                headers=headers,
+                timeout=10,
+                stream=stream
+            ),
+            stats=self.stats,
+        )
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """
+    Incrementally decode a top-level JSON array from byte chunks, yielding each element
+    as soon as its closing bracket has arrived. Only the unparsed tail of the body is
+    kept in memory.
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, started = "", False
+
+    for chunk in chunks:
+        buf += text.decode(chunk)
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array from the API.")
+                started = True
+                pos += 1
                 continue
-        
-        raise RuntimeError(f"Error fetching data from NYC 311 API: {e}")
-            
+            if buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element not complete yet, wait for more bytes
+            yield obj
+        buf = buf[pos:]
+
+    if buf.strip():
+        raise ValueError("Truncated JSON array in API response.")
@@ -0,0 +1,196 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6_371_000.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance in metres, vectorised over NumPy arrays / Series.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def radius_bbox(lat: float, lon: float, radius_m: float):
+    """
+    (min_lat, min_lon, max_lat, max_lon) of a box that contains the circle of
+    `radius_m` around (lat, lon) - the coarse filter before an exact haversine check.
+    """
+    dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(np.cos(np.radians(lat)), 1e-12)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+@dataclass
+class Rule:
+    """
+    One alert rule. Every predicate that's set has to hold (they're ANDed):
+
+    contains: case-insensitive substring of `field`
+    regex: case-insensitive regex searched in `field`
+    borough: borough name, or list of names
+    bbox: [min_lat, min_lon, max_lat, max_lon]
+    near: {"lat": .., "lon": .., "radius_m": ..}
+    """
+    name: str
+    contains: Optional[str] = None
+    regex: Optional[str] = None
+    field: str = "complaint_type"
+    borough: Optional[Sequence[str]] = None
+    bbox: Optional[Sequence[float]] = None
+    near: Optional[Dict[str, float]] = None
+
+    def __post_init__(self):
+        if isinstance(self.borough, str):
+            self.borough = [self.borough]
+        if self.borough:
+            self.borough = [b.upper() for b in self.borough]
+        if not any([self.contains, self.regex, self.borough, self.bbox, self.near]):
+            raise ValueError(f"Rule '{self.name}' has no predicates.")
+        if self.contains and self.regex:
+            raise ValueError(f"Rule '{self.name}': use either contains or regex, not both.")
+        if self.regex:
+            try:
+                re.compile(self.regex)
+            except re.error as e:
+                raise ValueError(f"Rule '{self.name}': invalid regex {self.regex!r}: {e}") from e
+
+    @property
+    def text_pattern(self) -> Optional[str]:
+        if self.contains:
+            return re.escape(self.contains)
+        return self.regex
+
+    @property
+    def combinable(self) -> bool:
+        """
+        Whether the text pattern still means the same inside RuleSet's alternation:
+        backreferences and named groups would point at other rules' groups, and global
+        inline flags like (?i) are only allowed at the very start of a pattern.
+        """
+        return self.contains is not None or not _NOT_COMBINABLE.search(self.regex)
+
+
+# \1 / (?P=name) backreferences, (?P<name>...) / (?<name>...) groups, global (?aiLmsux) flags
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P?[<=](?![=!])|\(\?[aiLmsux]+\)")
+
+
+@dataclass
+class RuleSet:
+    """
+    Rules compiled once into something cheap to run against every batch.
+
+    Text predicates (hundreds of substrings/regexes) are folded into one alternation
+    regex per field, used as a prefilter. They are evaluated per *distinct* field value
+    and memoised across batches - complaint_type only has a few hundred values, so in
+    steady state a batch costs one vectorised isin() per rule that can match, instead
+    of one regex search per rule per row. Borough and geo predicates are vectorised
+    set membership / NumPy distance checks. Regexes that can't be embedded in the
+    alternation (see Rule.combinable) are searched on their own instead.
+    """
+    rules: List[Rule]
+    _combined: Dict[str, re.Pattern] = field(default_factory=dict, init=False, repr=False)
+    _patterns: Dict[int, re.Pattern] = field(default_factory=dict, init=False, repr=False)
+    _solo: Dict[str, List[int]] = field(default_factory=dict, init=False, repr=False)
+    _memo: Dict[str, Dict[str, frozenset]] = field(default_factory=dict, init=False, repr=False)
+
+    MEMO_LIMIT = 100_000  # free-text fields could otherwise grow the memo without bound
+
+    def __post_init__(self):
+        by_field: Dict[str, List[str]] = {}
+        for i, rule in enumerate(self.rules):
+            if rule.text_pattern:
+                self._patterns[i] = re.compile(rule.text_pattern, re.IGNORECASE)
+                if rule.combinable:
+                    by_field.setdefault(rule.field, []).append(f"(?:{rule.text_pattern})")
+                else:
+                    self._solo.setdefault(rule.field, []).append(i)
+        self._combined = {f: re.compile("|".join(p), re.IGNORECASE) for f, p in by_field.items()}
+        self._memo = {f: {} for f in {*by_field, *self._solo}}
+
+    @classmethod
+    def from_dicts(cls, specs: List[Dict]) -> "RuleSet":
+        return cls([Rule(**spec) for spec in specs])
+
+    def _text_hits(self, value: str, field_name: str) -> frozenset:
+        """Indexes of the rules on `field_name` whose text predicate matches value."""
+        solo = self._solo.get(field_name, [])
+        hits = {i for i in solo if self._patterns[i].search(value)}
+        combined = self._combined.get(field_name)
+        if combined is not None and combined.search(value):
+            hits.update(
+                i for i, pat in self._patterns.items()
+                if self.rules[i].field == field_name and i not in solo and pat.search(value)
+            )
+        return frozenset(hits)
+
+    def match(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns one row per (rule, matching record), with the rule name in `rule`.
+        """
+        if df.empty or not self.rules:
+            return pd.DataFrame()
+
+        # Which distinct text values hit which rules (memoised across batches).
+        values_for_rule: Dict[int, List[str]] = {}
+        for field_name, memo in self._memo.items():
+            if field_name not in df.columns:
+                continue
+            if len(memo) > self.MEMO_LIMIT:
+                memo.clear()
+            for value in df[field_name].dropna().unique():
+                hits = memo.get(value)
+                if hits is None:
+                    hits = memo[value] = self._text_hits(str(value), field_name)
+                for i in hits:
+                    values_for_rule.setdefault(i, []).append(value)
+
+        lat = pd.to_numeric(df.get("latitude"), errors="coerce") if "latitude" in df else None
+        lon = pd.to_numeric(df.get("longitude"), errors="coerce") if "longitude" in df else None
+        borough = df["borough"].str.upper() if "borough" in df else None
+
+        out = []
+        for i, rule in enumerate(self.rules):
+            if i in self._patterns:
+                if i not in values_for_rule or rule.field not in df.columns:
+                    continue
+                mask = df[rule.field].isin(values_for_rule[i])
+            else:
+                mask = pd.Series(True, index=df.index)
+
+            if rule.borough:
+                mask &= borough.isin(rule.borough) if borough is not None else False
+            if rule.bbox or rule.near:
+                if lat is None or lon is None:
+                    continue
+                if rule.bbox:
+                    min_lat, min_lon, max_lat, max_lon = rule.bbox
+                    mask &= lat.between(min_lat, max_lat) & lon.between(min_lon, max_lon)
+                if rule.near:
+                    dist = haversine_m(lat, lon, rule.near["lat"], rule.near["lon"])
+                    mask &= dist <= rule.near["radius_m"]
+
+            if mask.any():
+                out.append(df.loc[mask].assign(rule=rule.name))
+
+        if not out:
+            return pd.DataFrame()
+        return pd.concat(out, ignore_index=True)
+
+
+def load_rules(path: str) -> RuleSet:
+    """
+    Load a JSON rules file: either a list of rule objects or {"rules": [...]}.
+    """
+    with open(path) as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = specs["rules"]
+    return RuleSet.from_dicts(specs)
@@ -1,43 +1,282 @@
+import contextlib
+import queue
+import threading
 import pandas as pd
-from typing import Optional
-from src.schema import NYC311Record
-from src.reader import ReaderBase
+from typing import Callable, Dict, Iterator, List, Optional, Set
+from src.metrics import Metrics, profile
+from src.schema import validate_batch
+from src.reader import UPDATED_AT, Page, ReaderBase
 from src.writer import WriterBase
+from src.state import CursorStore
 
 class PipelineRunner:
     """
     This is my main ochestrator for the ETL. 
         Reader -> Schema Validation -> Writer
     I am intentionally decoupling from concrete implementations: 
-        - reader must expose 'fetch' method
+        - reader must expose 'fetch' method (and 'fetch_pages' for paged runs)
         - writer must implement writerbase interface (i.e. the write(df) method).
+        - hooks are optional callables given each validated batch before it's written
+          (e.g. in-stream alerting).
     Then the runner can be easily tests and extended. 
+
+    Every run* call is one cycle for `metrics` (see src/metrics.py): fetch / validate /
+    hooks / write timings, request/retry/byte counts from the reader, reject reasons and
+    inserted vs ignored rows. Pass a Metrics with exporters to get them out.
     """
-    def __init__(self, reader: ReaderBase, writer: WriterBase):
+    def __init__(
+        self,
+        reader: ReaderBase,
+        writer: WriterBase,
+        hooks: Optional[List[Callable]] = None,
+        metrics: Optional[Metrics] = None,
+    ):
         self.reader = reader
         self.writer = writer
+        self.hooks = hooks or []
+        self.metrics = metrics or Metrics()
+        self._profile = None
+
+    def profile_next_cycle(self, mode: str, out_path: str) -> None:
+        """
+        Profile only the next cycle with cProfile or tracemalloc (see metrics.profile),
+        so a slow listen loop can be looked at without paying for it every cycle.
+        """
+        self._profile = (mode, out_path)
 
-    def run(self, **run_kwargs) -> None:
+    @contextlib.contextmanager
+    def _cycle(self, kind: str):
+        prof, self._profile = self._profile, None
+        before = dict(getattr(self.reader, "stats", None) or {})
+        self.metrics.start_cycle(kind)
+        error = None
+        try:
+            with profile(*prof) if prof else contextlib.nullcontext():
+                yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            after = getattr(self.reader, "stats", None) or {}
+            self.metrics.add_fetch(
+                requests=after.get("requests", 0) - before.get("requests", 0),
+                retries=after.get("retries", 0) - before.get("retries", 0),
+                nbytes=after.get("bytes", 0) - before.get("bytes", 0),
+            )
+            c = self.metrics.end_cycle(error)
+            stages = ", ".join(f"{k}={v:.3f}s" for k, v in c["stages"].items())
+            print(f"PipelineRunner: Cycle took {c['seconds']:.3f}s ({stages}); "
+                  f"{c['records']['accepted']}/{c['records']['raw']} records accepted, "
+                  f"{c['rows']['inserted']} inserted, {c['rows']['ignored']} ignored.")
+
+    def _on_batch(self, df: pd.DataFrame) -> None:
+        if df.empty:
+            return
+        for hook in self.hooks:
+            hook(df)
+
+    @staticmethod
+    def validate(raw_records: Page, rejects: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+        """
+        Validate + normalise raw API records, dropping any that fail the schema.
+        Uses the columnar validate_batch, which matches NYC311Record row for row.
+        """
+        return validate_batch(raw_records, rejects)
+
+    def _process(self, raw_records: Page, skip_keys: Optional[Set[str]] = None) -> pd.DataFrame:
+        """
+        skip -> validate -> hooks -> write for one batch, timing each stage.
+        """
+        if skip_keys and isinstance(raw_records, pd.DataFrame):
+            raw_records = raw_records.loc[~raw_records["unique_key"].isin(skip_keys)]
+        elif skip_keys:
+            raw_records = [r for r in raw_records if r.get("unique_key") not in skip_keys]
+
+        rejects: Dict[str, int] = {}
+        with self.metrics.stage("validate"):
+            df = self.validate(raw_records, rejects)
+        self.metrics.add_validation(len(raw_records), len(df), rejects)
+
+        with self.metrics.stage("hooks"):
+            self._on_batch(df)
+
+        with self.metrics.stage("write"):
+            inserted = self.writer.write(df)
+        updated = getattr(self.writer, "last_updated", 0)
+        self.metrics.add_write(len(df), int(inserted or 0), int(updated or 0))
+        return df
+
+    def _timed_fetch(self, pages: Iterator[Page]) -> Iterator[Page]:
+        """
+        Time spent waiting on the reader for each page/chunk counts as the fetch stage.
+        """
+        pages = iter(pages)
+        while True:
+            with self.metrics.stage("fetch"):
+                page = next(pages, _DONE)
+            if page is _DONE:
+                return
+            yield page
+
+    def run(self, skip_keys: Optional[Set[str]] = None, **run_kwargs) -> None:
         """
         First implementation implements a single ETL Cycle: fetch -> clean -> wrote.
+        skip_keys are unique_keys already stored at the checkpoint watermark, dropped
+        before validation when resuming with an inclusive `since`.
+        """
+        with self._cycle("run"):
+            print(f"PipelineRunner: Fetching raw data with raw run params: {run_kwargs}")
+            with self.metrics.stage("fetch"):
+                raw_records = self.reader.fetch(**run_kwargs)
+
+            print(f"Pipeline Runner: Fetched {len(raw_records)} raw records.")
+            print("PipelineRunner: Validating  + normalising records..")
+            self._process(raw_records, skip_keys)
+
+            print(f"PipelineRunner: ETL Cycle complete.")
+
+    def run_batch(
+        self,
+        raw_records: Page,
+        skip_keys: Optional[Set[str]] = None,
+        fetch_seconds: float = 0.0,
+        kind: str = "listen",
+    ) -> pd.DataFrame:
+        """
+        One cycle over records someone else already fetched (the async listener fetches
+        the next page while this one is written). fetch_seconds is recorded as the
+        cycle's fetch stage.
+        """
+        with self._cycle(kind):
+            self.metrics.add_stage("fetch", fetch_seconds)
+            return self._process(raw_records, skip_keys)
+
+    def run_stream(self, skip_keys: Optional[Set[str]] = None, chunk_rows: int = 5000, **run_kwargs) -> int:
         """
-        print(f"PipelineRunner: Fetching raw data with raw run params: {run_kwargs}")
-        raw_records = self.reader.fetch(**run_kwargs)
-
-        print(f"Pipeline Runner: Fetched {len(raw_records)} raw records.")
-
-        cleaned = []
-        print("PipelineRunner: Validating  + normalising records..")
-        for rec in raw_records:
-            try: 
-                row = NYC311Record.from_api(rec)
-                cleaned.append(row.to_dict())
-            except ValueError:
-                continue
-        
-        df = pd.DataFrame(cleaned)
-
-        print(f"PipelineRunner: Passing {len(df)} cleaned records to writer...")
-        self.writer.write(df)
-        
-        print(f"PipelineRunner: ETL Cycle complete.")
+        Streaming ETL cycle: the reader decodes the response incrementally and each
+        chunk of `chunk_rows` records is validated + written while the next one is
+        still downloading (the reader runs one chunk ahead on a background thread).
+        Memory stays bounded by a couple of chunks however large --limit is.
+
+        Returns the number of raw records processed.
+        """
+        print(f"PipelineRunner: Streaming raw data with raw run params: {run_kwargs}")
+        total = 0
+        with self._cycle("stream"):
+            chunks = prefetch(self.reader.fetch_stream(chunk_rows=chunk_rows, **run_kwargs))
+            for chunk in self._timed_fetch(chunks):
+                total += len(chunk)
+                self._process(chunk, skip_keys)
+        print(f"PipelineRunner: Streamed ETL cycle complete ({total} raw records).")
+        return total
+
+    def run_pages(
+        self,
+        since: Optional[str] = None,
+        cursor_store: Optional[CursorStore] = None,
+        inclusive: bool = False,
+    ) -> int:
+        """
+        Paged ETL: streams the reader's pages through validate -> write one page at a time,
+        so memory is bounded by the page size rather than by the size of the window.
+
+        If a cursor_store is given, the keyset cursor is saved after every written page and
+        a later call with the same `since` resumes from there. The cursor is cleared once
+        the reader runs out of pages.
+
+        Returns the number of pages processed.
+        """
+        after = None
+        pages = rows = 0
+        state = cursor_store.load() if cursor_store else None
+        if state and state.get("since") == since:
+            after = tuple(state["after"])
+            pages, rows = state.get("pages", 0), state.get("rows", 0)
+            print(f"PipelineRunner: Resuming after page {pages} (cursor={after}).")
+
+        with self._cycle("pages"):
+            page_iter = self.reader.fetch_pages(since=since, after=after, inclusive=inclusive)
+            for page in self._timed_fetch(page_iter):
+                df = self._process(page)
+                print(f"PipelineRunner: Page {pages + 1}: {len(page)} raw -> {len(df)} cleaned records.")
+
+                pages += 1
+                rows += len(page)
+                after = self.reader.page_cursor(page) or after
+                if cursor_store:
+                    cursor_store.save({"since": since, "after": after, "pages": pages, "rows": rows})
+
+        if cursor_store:
+            cursor_store.clear()
+        print(f"PipelineRunner: Paged run complete ({pages} pages, {rows} raw records).")
+        return pages
+
+    def run_updates(self, since: Optional[str] = None, cursor_store: Optional[CursorStore] = None) -> int:
+        """
+        "Updated since" refresh: walks every record whose :updated_at is past the saved
+        cursor (or past `since`, which wins when given) in keyset pages and writes them.
+        Meant for an upsert writer, so changed records are rewritten and unchanged ones
+        cost a hash comparison.
+
+        Unlike run_pages the cursor is kept afterwards - it's where the next refresh
+        starts. Returns the number of raw records seen.
+        """
+        state = cursor_store.load() if cursor_store and not since else None
+        after = tuple(state["after"]) if state and state.get("after") else None
+        pages = rows = 0
+        print(f"PipelineRunner: Refreshing records updated since {since or after}.")
+
+        with self._cycle("updates"):
+            page_iter = self.reader.fetch_pages(since=since, after=after, order_by=UPDATED_AT)
+            for page in self._timed_fetch(page_iter):
+                self._process(page)
+                pages += 1
+                rows += len(page)
+                after = self.reader.page_cursor(page, UPDATED_AT) or after
+                if cursor_store and after:
+                    cursor_store.save({"after": after})
+
+        print(f"PipelineRunner: Refresh complete ({pages} pages, {rows} updated records).")
+        return rows
+
+
+_DONE = object()
+
+
+def prefetch(iterator: Iterator, depth: int = 2) -> Iterator:
+    """
+    Pull items from `iterator` on a background thread, up to `depth` ahead of the
+    consumer, so producing (network + decode) overlaps with consuming (validate + write).
+    Exceptions in the producer are re-raised in the consumer.
+    """
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                q.put(item)
+            q.put(_DONE)
+        except BaseException as e:
+            q.put(e)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        # Unblock the producer if it's waiting on a full queue.
+        while worker.is_alive():
+            try:
+                q.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,256 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+
+# Requests/s and burst used when no rate is given. Socrata throttles anonymous callers
+# per IP much harder than callers sending an app token; these stay comfortably inside
+# both and can be raised with --api-rate once the token's real quota is known.
+DEFAULT_RATES = {
+    "token": (5.0, 10),
+    "anonymous": (1.0, 2),
+}
+
+# Worth another try: throttling and transient upstream errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(RuntimeError):
+    """
+    Raised instead of sending a request while the breaker is open.
+    """
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens/s refill up to `capacity`; acquire() blocks until
+    a token is free. Thread-safe, so every fetcher sharing it is limited together.
+    """
+    def __init__(self, rate: float, capacity: int = 1, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self) -> float:
+        """
+        Take one token, waiting if needed. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self.clock())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `threshold` consecutive failures. While open every call fails
+    fast with CircuitOpen; after `reset_timeout` one trial request is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+    def __init__(self, threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_timeout else "open"
+
+    def before_request(self) -> None:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return
+            retry_in = max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+            raise CircuitOpen(f"API circuit open after {self.failures} consecutive failures; retry in {retry_in:.0f}s.")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def abandon_trial(self) -> None:
+        """
+        The trial request ended without telling us anything about the API (e.g. a
+        replay cache miss): let the next call try again.
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self._trial = False
+
+
+def retry_after_seconds(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Retry-After is either delta-seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class RequestScheduler:
+    """
+    Shared gatekeeper for API requests: one instance can be handed to every reader (e.g.
+    all backfill workers) so together they run at the quota instead of each one
+    sleeping blindly.
+
+    - token bucket sized to the quota paces every attempt, retries included
+    - 429/503 with Retry-After pauses *all* callers until that time
+    - other retryable failures back off exponentially with full jitter
+    - consecutive network/5xx failures trip a circuit breaker
+
+    Parameters
+    ----------
+    rate, burst:
+        Requests per second and bucket size. rate=None means unthrottled (e.g. a local
+        fake API), keeping the retry/backoff/breaker behaviour.
+    max_attempts: int
+        Attempts per request before giving up with RuntimeError.
+    base_delay, max_delay: float
+        Backoff is uniform(0, min(max_delay, base_delay * 2**attempt)).
+    """
+    def __init__(
+        self,
+        rate: Optional[float] = 1.0,
+        burst: int = 2,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep) if rate else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout, clock=clock)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self._cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_token(cls, app_token: Optional[str], rate: Optional[float] = None, burst: Optional[int] = None, **kwargs):
+        default_rate, default_burst = DEFAULT_RATES["token" if app_token else "anonymous"]
+        return cls(rate=rate or default_rate, burst=burst or default_burst, **kwargs)
+
+    def backoff(self, attempt: int) -> float:
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _cool_down(self, seconds: float) -> None:
+        with self._lock:
+            self._cooldown_until = max(self._cooldown_until, self.clock() + seconds)
+
+    def _wait_for_cooldown(self) -> None:
+        while True:
+            with self._lock:
+                wait = self._cooldown_until - self.clock()
+            if wait <= 0:
+                return
+            self.sleep(wait)
+
+    def request(self, send: Callable[[], requests.Response], stats: Optional[Dict] = None) -> requests.Response:
+        """
+        Run `send` (one HTTP GET) under the rate limit with retries. Returns the first
+        successful response; non-retryable HTTP errors are raised straight away.
+        """
+        last_error = None
+        for attempt in range(self.max_attempts):
+            self.breaker.before_request()
+            self._wait_for_cooldown()
+            if self.bucket is not None:
+                self.bucket.acquire()
+            if stats is not None:
+                stats["requests"] += 1
+                stats["retries"] += attempt > 0
+
+            try:
+                response = send()
+            except requests.RequestException as e:
+                last_error = e
+                self.breaker.record_failure()
+                delay = self.backoff(attempt)
+                print(f"Network error: {e}. Retrying in {delay:.1f}s...")
+                self.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.abandon_trial()
+                raise
+
+            status = response.status_code
+            if status not in RETRY_STATUSES:
+                # Client errors (bad $where etc.) won't fix themselves - raise, but the
+                # API did answer, so the breaker stays closed.
+                self.breaker.record_success()
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError as e:
+                    raise RuntimeError(f"Error fetching data from NYC 311 API: {e}") from e
+                return response
+
+            last_error = requests.HTTPError(f"{status} from API", response=response)
+            retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            response.close()
+            if status == 429:
+                # Throttled, not down: the API answered, which also settles a half-open trial.
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            if retry_after is not None:
+                # Everyone sharing this scheduler waits it out, not just this caller.
+                print(f"Rate limit hit ({status}). Retrying after {retry_after:.1f}s (Retry-After).")
+                self._cool_down(retry_after)
+            else:
+                delay = self.backoff(attempt)
+                print(f"API returned {status}. Retrying in {delay:.1f}s...")
+                self.sleep(delay)
+
+        raise RuntimeError(f"Error fetching data from NYC 311 API after {self.max_attempts} attempts: {last_error}")
@@ -1,7 +1,12 @@
+import hashlib
+import json
+import sqlite3
+import numpy as np
+import pandas as pd
 from dateutil import parser
 from datetime import datetime
 from dataclasses import dataclass, field, fields
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Union
 
 @dataclass
 class NYC311Record:
@@ -11,6 +16,10 @@ class NYC311Record:
     borough: Optional[str] = None
     latitude: Optional[float] = None
     longitude: Optional[float] = None
+    # Fields the city updates after a request is created.
+    status: Optional[str] = None
+    closed_date: Optional[str] = None
+    resolution_description: Optional[str] = None
 
     # Any converted fields push here.
     created_dt: datetime = field(init=False)
@@ -51,5 +60,775 @@ class NYC311Record:
         """
         return {f.name: getattr(self, f.name) for f in fields(self) if f.init}
 
-    
-    
\ No newline at end of file
+
+RECORD_FIELDS = [f.name for f in fields(NYC311Record) if f.init]
+
+
+def _parse_ok(val) -> bool:
+    """Same acceptance rule as NYC311Record.__post_init__ for created_date."""
+    try:
+        parser.parse(val)
+        return True
+    except Exception:
+        return False
+
+
+def _to_float(values: np.ndarray) -> np.ndarray:
+    """
+    Vectorised NYC311Record._safe_float: to_numeric does the bulk, and anything it
+    refuses that float() might still accept (e.g. "nan", "1_000") goes the slow way.
+    """
+    out = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+    retry = np.isnan(out) & pd.notna(values)
+    for i in np.flatnonzero(retry):
+        val = NYC311Record._safe_float(values[i])
+        out[i] = np.nan if val is None else val
+    return out
+
+
+def _count_reject(rejects: Dict[str, int], reason: str, n: int) -> None:
+    if n:
+        rejects[reason] = rejects.get(reason, 0) + n
+
+
+def validate_batch(
+    raw_records: Union[List[Dict[str, Any]], pd.DataFrame],
+    rejects: Optional[Dict[str, int]] = None,
+) -> pd.DataFrame:
+    """
+    Columnar equivalent of `NYC311Record.from_api(rec).to_dict()` over a whole page.
+
+    Applies the same checks as the dataclass (required fields, parseable created_date,
+    lat/lon coerced to float or null) with column masks instead of one object and one
+    dateutil call per row, and returns the same DataFrame the per-record path builds.
+    dateutil is only called for the few dates the fast ISO8601 parser can't read, so
+    anything the dataclass would accept is still accepted.
+
+    raw_records may also be a DataFrame (e.g. a CSV page), with None for missing values.
+
+    If `rejects` is given, it's incremented with the number of dropped rows per reason
+    (missing_created_date, missing_complaint_type, bad_created_date).
+    """
+    if len(raw_records) == 0:
+        return pd.DataFrame()
+
+    if isinstance(raw_records, pd.DataFrame):
+        n = len(raw_records)
+        cols = {
+            name: raw_records[name].to_numpy(dtype=object) if name in raw_records else np.full(n, None, dtype=object)
+            for name in RECORD_FIELDS
+        }
+    else:
+        cols = {name: np.array([rec.get(name) for rec in raw_records], dtype=object) for name in RECORD_FIELDS}
+    created = cols["created_date"]
+
+    # Required fields: same truthiness test as `not self.created_date`.
+    has_created = created.astype(bool)
+    keep = has_created & cols["complaint_type"].astype(bool)
+    if rejects is not None:
+        _count_reject(rejects, "missing_created_date", int((~has_created).sum()))
+        _count_reject(rejects, "missing_complaint_type", int((has_created & ~keep).sum()))
+        required_ok = int(keep.sum())
+
+    # Fast path only for strings that start with a digit; pandas would also accept
+    # things like "now"/"today" which dateutil rejects.
+    idx = np.flatnonzero(keep)
+    cand = pd.Series(created[idx])
+    is_str = cand.map(type).eq(str).to_numpy()
+    fast = np.zeros(len(idx), dtype=bool)
+    if is_str.any():
+        strs = cand[is_str]
+        digit = strs.str[:1].str.isdigit().to_numpy(dtype=bool)
+        parsed = pd.to_datetime(strs[digit], format="ISO8601", errors="coerce", utc=True)
+        fast[np.flatnonzero(is_str)[digit]] = parsed.notna().to_numpy()
+    for i in np.flatnonzero(~fast):
+        keep[idx[i]] = _parse_ok(created[idx[i]])
+    if rejects is not None:
+        _count_reject(rejects, "bad_created_date", required_ok - int(keep.sum()))
+
+    if not keep.any():
+        return pd.DataFrame()
+
+    out = {}
+    for name in RECORD_FIELDS:
+        vals = cols[name][keep]
+        if name in ("latitude", "longitude"):
+            floats = _to_float(vals)
+            # All-null float columns come out of the dataclass path as object/None.
+            vals = floats if not np.isnan(floats).all() else [NYC311Record._safe_float(v) for v in vals]
+        out[name] = vals
+    return pd.DataFrame(out)
+
+
+# ─────────────────────────────────────────────
+# Storage schema
+# ─────────────────────────────────────────────
+#
+# The `requests` table is declared here rather than inferred from whatever dtypes the
+# first DataFrame had. The version lives in PRAGMA user_version and each entry in
+# MIGRATIONS upgrades a database by one version, so older files are fixed up in place
+# the first time a writer (or `main.py migrate`) opens them.
+
+SCHEMA_VERSION = 9
+
+REQUESTS_COLUMNS = {
+    "unique_key": "TEXT",
+    "created_date": "TEXT NOT NULL",      # ISO text exactly as the API sent it
+    "created_epoch": "INTEGER",           # seconds since epoch, sortable/range-friendly
+    "complaint_type": "TEXT NOT NULL",
+    "borough": "TEXT",
+    "latitude": "REAL",
+    "longitude": "REAL",
+    "status": "TEXT",
+    "closed_date": "TEXT",
+    "resolution_description": "TEXT",
+    "row_hash": "INTEGER",                # content_hash of TRACKED_FIELDS, for upserts
+}
+
+# Everything that identifies a version of a record (all data columns except the key).
+# When any of these change upstream, an upsert rewrites the row.
+TRACKED_FIELDS = [
+    "created_date", "complaint_type", "borough", "latitude", "longitude",
+    "status", "closed_date", "resolution_description",
+]
+
+# complaint_type and borough have a few hundred and six distinct values, so from v8
+# `requests` stores them as integer ids into these lookup tables (name -> table) rather
+# than repeating the text. REQUESTS_COLUMNS stays the logical record layout (what the
+# writer accepts, what parquet stores); STORED_COLUMNS is what's on disk in SQLite and
+# the requests_decoded view turns it back into REQUESTS_COLUMNS.
+LOOKUPS = {"complaint_type": "complaint_types", "borough": "boroughs"}
+
+STORED_COLUMNS = {
+    (f"{name}_id" if name in LOOKUPS else name):
+        (decl.replace("TEXT", "INTEGER") + f" REFERENCES {LOOKUPS[name]}(id)" if name in LOOKUPS else decl)
+    for name, decl in REQUESTS_COLUMNS.items()
+}
+
+LOOKUP_DDL = "CREATE TABLE IF NOT EXISTS {lookup} (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)"
+
+REQUESTS_INDEXES = {
+    "unique_key": "CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_unique_key ON {table}(unique_key)",
+    "created": "CREATE INDEX IF NOT EXISTS idx_{table}_created ON {table}(created_epoch)",
+    "type_created": "CREATE INDEX IF NOT EXISTS idx_{table}_type_created ON {table}({complaint_type}, created_epoch)",
+    "borough_created": "CREATE INDEX IF NOT EXISTS idx_{table}_borough_created ON {table}({borough}, created_epoch)",
+}
+
+_EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+
+
+def to_epoch(created) -> pd.Series:
+    """
+    created_date strings -> float seconds since epoch (NaN if unparseable).
+    Timestamps without an offset (the API's floating NYC local time) are taken as-is,
+    which matches SQLite's strftime('%s', ...), so Python- and SQL-computed values agree.
+    """
+    created = pd.Series(created, dtype=object)
+    ts = pd.to_datetime(created, format="ISO8601", errors="coerce", utc=True)
+    for i in np.flatnonzero(ts.isna().to_numpy() & created.notna().to_numpy()):
+        try:
+            dt = pd.Timestamp(parser.parse(created.iloc[i]))
+            ts.iloc[i] = dt.tz_localize("UTC") if dt.tzinfo is None else dt.tz_convert("UTC")
+        except Exception:
+            continue
+    return (ts - _EPOCH) // pd.Timedelta(seconds=1)
+
+
+def _hash_text(v) -> str:
+    # \x00 marks null so None and "" hash differently; floats use repr for stability
+    if v is None or v != v:
+        return "\x00"
+    return v if type(v) is str else repr(v) if isinstance(v, float) else str(v)
+
+
+def content_hash(df: pd.DataFrame, fields: List[str] = TRACKED_FIELDS) -> np.ndarray:
+    """
+    Signed 64-bit blake2b of each row's tracked fields (missing columns count as null),
+    so "did this record change?" is one integer comparison in SQL.
+    """
+    parts = [
+        [_hash_text(v) for v in df[name].tolist()] if name in df else ["\x00"] * len(df)
+        for name in fields
+    ]
+    blake, join = hashlib.blake2b, "\x1f".join
+    digests = b"".join([blake(join(values).encode(), digest_size=8).digest() for values in zip(*parts)])
+    return np.frombuffer(digests, dtype="<i8").astype(np.int64)
+
+
+def create_requests_table(conn: sqlite3.Connection, table: str = "requests", encoded: bool = False) -> None:
+    """
+    Plain layout (text columns) unless `encoded`, which gives the v8+ STORED_COLUMNS.
+    """
+    columns = STORED_COLUMNS if encoded else REQUESTS_COLUMNS
+    cols = ",\n    ".join(f"{name} {decl}" for name, decl in columns.items())
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (\n    {cols}\n)")
+    names = {name: f"{name}_id" if encoded else name for name in LOOKUPS}
+    for ddl in REQUESTS_INDEXES.values():
+        conn.execute(ddl.format(table=table, **names))
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    """
+    v0 -> v1: typed `requests` table with created_epoch and query indexes.
+    A v0 table (created by pandas.to_sql) is rebuilt and its rows copied across.
+    """
+    legacy = _table_columns(conn, "requests")
+    if not legacy:
+        create_requests_table(conn)
+        return
+
+    conn.execute("DROP INDEX IF EXISTS idx_requests_unique_key")
+    conn.execute("ALTER TABLE requests RENAME TO requests_v0")
+    create_requests_table(conn)
+
+    shared = [c for c in REQUESTS_COLUMNS if c in legacy and c != "created_epoch"]
+    cols = ", ".join(shared)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO requests ({cols}, created_epoch)
+        SELECT {cols}, CAST(strftime('%s', created_date) AS INTEGER) FROM requests_v0
+    """)
+    conn.execute("DROP TABLE requests_v0")
+
+
+CHECKPOINT_DDL = """
+    CREATE TABLE IF NOT EXISTS ingest_checkpoint (
+        name TEXT PRIMARY KEY,              -- table the checkpoint belongs to
+        watermark TEXT,                     -- latest created_date written
+        watermark_epoch INTEGER,
+        boundary_keys TEXT NOT NULL DEFAULT '[]',  -- JSON unique_keys stored at `watermark`
+        rows_processed INTEGER NOT NULL DEFAULT 0,
+        pages_processed INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )
+"""
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    """
+    v1 -> v2: ingest_checkpoint table, seeded from whatever is already in `requests`.
+    """
+    conn.execute(CHECKPOINT_DDL)
+    row = conn.execute(
+        "SELECT created_date, created_epoch FROM requests ORDER BY created_epoch DESC, created_date DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return
+    keys = [k for (k,) in conn.execute("SELECT unique_key FROM requests WHERE created_date = ?", (row[0],))]
+    (total,) = conn.execute("SELECT COUNT(*) FROM requests").fetchone()
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO ingest_checkpoint
+            (name, watermark, watermark_epoch, boundary_keys, rows_processed, updated_at)
+        VALUES ('requests', ?, ?, ?, ?, datetime('now'))
+        """,
+        (row[0], row[1], json.dumps(keys), total),
+    )
+
+
+# Hour x complaint_type x borough counts, kept current by triggers on `requests` so
+# they're updated in the writer's own transaction and only for rows that really went
+# in (INSERT OR IGNORE skips never fire AFTER INSERT). Keyed on the lookup ids; 0
+# stands in for a missing borough because NULLs can't take part in the primary key.
+ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour_epoch INTEGER NOT NULL,
+        complaint_type_id INTEGER NOT NULL,
+        borough_id INTEGER NOT NULL DEFAULT 0,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (hour_epoch, complaint_type_id, borough_id)
+    ) WITHOUT ROWID
+"""
+
+_ROLLUP_ADD = """
+        INSERT INTO rollup_hourly (hour_epoch, complaint_type_id, borough_id, n)
+        SELECT {row}.created_epoch - {row}.created_epoch % 3600, {row}.complaint_type_id, COALESCE({row}.borough_id, 0), 1
+        WHERE {row}.created_epoch IS NOT NULL
+        ON CONFLICT (hour_epoch, complaint_type_id, borough_id) DO UPDATE SET n = n + 1;
+"""
+
+_ROLLUP_SUB = """
+        UPDATE rollup_hourly SET n = n - 1
+        WHERE hour_epoch = {row}.created_epoch - {row}.created_epoch % 3600
+          AND complaint_type_id = {row}.complaint_type_id
+          AND borough_id = COALESCE({row}.borough_id, 0);
+"""
+
+ROLLUP_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_insert AFTER INSERT ON requests
+    BEGIN {_ROLLUP_ADD.format(row="NEW")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_delete AFTER DELETE ON requests
+    BEGIN {_ROLLUP_SUB.format(row="OLD")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_update
+    AFTER UPDATE OF created_epoch, complaint_type_id, borough_id ON requests
+    BEGIN {_ROLLUP_SUB.format(row="OLD")} {_ROLLUP_ADD.format(row="NEW")} END
+    """,
+]
+
+
+def rebuild_rollups(conn: sqlite3.Connection) -> None:
+    """
+    Recompute rollup_hourly from scratch off the requests table.
+    """
+    conn.execute("DELETE FROM rollup_hourly")
+    conn.execute("""
+        INSERT INTO rollup_hourly (hour_epoch, complaint_type_id, borough_id, n)
+        SELECT created_epoch - created_epoch % 3600, complaint_type_id, COALESCE(borough_id, 0), COUNT(*)
+        FROM requests
+        WHERE created_epoch IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+
+
+# The text-keyed rollups as v3 shipped them. ROLLUP_DDL and friends above describe the
+# current (v8+) layout, so a v2 database is upgraded with these and v8 re-keys them.
+_V3_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS rollup_hourly (
+        hour_epoch INTEGER NOT NULL,
+        complaint_type TEXT NOT NULL,
+        borough TEXT NOT NULL DEFAULT '',
+        n INTEGER NOT NULL,
+        PRIMARY KEY (hour_epoch, complaint_type, borough)
+    ) WITHOUT ROWID
+"""
+
+_V3_ROLLUP_ADD = """
+        INSERT INTO rollup_hourly (hour_epoch, complaint_type, borough, n)
+        SELECT {row}.created_epoch - {row}.created_epoch % 3600, {row}.complaint_type, COALESCE({row}.borough, ''), 1
+        WHERE {row}.created_epoch IS NOT NULL
+        ON CONFLICT (hour_epoch, complaint_type, borough) DO UPDATE SET n = n + 1;
+"""
+
+_V3_ROLLUP_SUB = """
+        UPDATE rollup_hourly SET n = n - 1
+        WHERE hour_epoch = {row}.created_epoch - {row}.created_epoch % 3600
+          AND complaint_type = {row}.complaint_type
+          AND borough = COALESCE({row}.borough, '');
+"""
+
+_V3_ROLLUP_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_insert AFTER INSERT ON requests
+    BEGIN {_V3_ROLLUP_ADD.format(row="NEW")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_delete AFTER DELETE ON requests
+    BEGIN {_V3_ROLLUP_SUB.format(row="OLD")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_rollup_update
+    AFTER UPDATE OF created_epoch, complaint_type, borough ON requests
+    BEGIN {_V3_ROLLUP_SUB.format(row="OLD")} {_V3_ROLLUP_ADD.format(row="NEW")} END
+    """,
+]
+
+
+def _v3_rebuild_rollups(conn: sqlite3.Connection) -> None:
+    conn.execute("DELETE FROM rollup_hourly")
+    conn.execute("""
+        INSERT INTO rollup_hourly (hour_epoch, complaint_type, borough, n)
+        SELECT created_epoch - created_epoch % 3600, complaint_type, COALESCE(borough, ''), COUNT(*)
+        FROM requests
+        WHERE created_epoch IS NOT NULL
+        GROUP BY 1, 2, 3
+    """)
+
+
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    """
+    v2 -> v3: trigger-maintained hourly rollups, back-filled from existing rows.
+    """
+    conn.execute(_V3_ROLLUP_DDL)
+    for ddl in _V3_ROLLUP_TRIGGERS:
+        conn.execute(ddl)
+    _v3_rebuild_rollups(conn)
+
+
+ALERT_CURSORS_DDL = """
+    CREATE TABLE IF NOT EXISTS alert_cursors (
+        rule TEXT PRIMARY KEY,
+        last_rowid INTEGER NOT NULL,   -- highest requests.rowid already evaluated
+        updated_at TEXT
+    )
+"""
+
+
+def _migrate_v4(conn: sqlite3.Connection) -> None:
+    """
+    v3 -> v4: per-rule cursors for incremental alerting.
+    """
+    conn.execute(ALERT_CURSORS_DDL)
+
+
+def _migrate_v5(conn: sqlite3.Connection) -> None:
+    """
+    v4 -> v5: mutable fields (status, closed_date, resolution_description) and row_hash
+    for upserts. Existing rows keep a NULL hash, which an upsert treats as changed.
+    """
+    existing = set(_table_columns(conn, "requests"))
+    for name in ("status", "closed_date", "resolution_description", "row_hash"):
+        if name not in existing:
+            conn.execute(f"ALTER TABLE requests ADD COLUMN {name} {REQUESTS_COLUMNS[name]}")
+
+
+# R*Tree over (latitude, longitude, created_epoch) keyed by requests.rowid, kept current by
+# triggers like the rollups. Space and time are searched in one index probe; the R*Tree
+# stores 32-bit floats and rounds boxes outwards, so callers re-check the exact values
+# from `requests`. Rows without coordinates aren't indexed.
+GEO_DDL = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS requests_geo USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon, min_t, max_t
+    )
+"""
+
+_GEO_ADD = """
+        INSERT INTO requests_geo
+        SELECT {row}.rowid, {row}.latitude, {row}.latitude, {row}.longitude, {row}.longitude,
+               {row}.created_epoch, {row}.created_epoch
+        WHERE {row}.latitude IS NOT NULL AND {row}.longitude IS NOT NULL AND {row}.created_epoch IS NOT NULL;
+"""
+
+GEO_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_geo_insert AFTER INSERT ON requests
+    BEGIN {_GEO_ADD.format(row="NEW")} END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_requests_geo_delete AFTER DELETE ON requests
+    BEGIN DELETE FROM requests_geo WHERE id = OLD.rowid; END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_geo_update
+    AFTER UPDATE OF latitude, longitude, created_epoch ON requests
+    BEGIN DELETE FROM requests_geo WHERE id = OLD.rowid; {_GEO_ADD.format(row="NEW")} END
+    """,
+]
+
+
+def rebuild_geo_index(conn: sqlite3.Connection) -> None:
+    """
+    Repopulate requests_geo from the requests table (e.g. after a VACUUM renumbered rowids).
+    """
+    conn.execute("DELETE FROM requests_geo")
+    conn.execute("""
+        INSERT INTO requests_geo
+        SELECT rowid, latitude, latitude, longitude, longitude, created_epoch, created_epoch
+        FROM requests
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND created_epoch IS NOT NULL
+    """)
+
+
+def _migrate_v6(conn: sqlite3.Connection) -> None:
+    """
+    v5 -> v6: R*Tree spatial index over requests, back-filled from existing rows.
+    """
+    conn.execute(GEO_DDL)
+    for ddl in GEO_TRIGGERS:
+        conn.execute(ddl)
+    rebuild_geo_index(conn)
+
+
+# FTS5 index over the free-text columns, external-content so the text isn't stored
+# twice. The trigram tokenizer makes MATCH "noise" a case-insensitive substring search,
+# the same semantics as the old str.contains filter.
+#
+# Updates and deletes are kept in sync by triggers, but inserts are not: FTS5 flushes
+# its pending terms at every statement savepoint, so a per-row insert trigger made
+# writes ~6x slower. SQLiteWriter indexes each batch's new rowids in one
+# INSERT ... SELECT instead (index_new_rows), inside the same transaction.
+#
+# The text comes from the requests_decoded view (content_rowid `rid`), since
+# complaint_type is only an id in `requests` itself.
+SEARCH_COLUMNS = ["complaint_type", "resolution_description"]
+
+SEARCH_DDL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+        {", ".join(SEARCH_COLUMNS)}, content='requests_decoded', content_rowid='rid', tokenize='trigram'
+    )
+"""
+
+
+def _decoded(row: str, name: str) -> str:
+    """
+    SQL for column `name` of trigger row `row` (NEW/OLD) as text.
+    """
+    if name in LOOKUPS:
+        return f"(SELECT name FROM {LOOKUPS[name]} WHERE id = {row}.{name}_id)"
+    return f"{row}.{name}"
+
+
+_FTS_COLS = ", ".join(SEARCH_COLUMNS)
+_FTS_ADD = f"""
+        INSERT INTO requests_fts (rowid, {_FTS_COLS})
+        VALUES (NEW.rowid, {", ".join(_decoded("NEW", c) for c in SEARCH_COLUMNS)});
+"""
+_FTS_SUB = f"""
+        INSERT INTO requests_fts (requests_fts, rowid, {_FTS_COLS})
+        VALUES ('delete', OLD.rowid, {", ".join(_decoded("OLD", c) for c in SEARCH_COLUMNS)});
+"""
+_FTS_STORED = [f"{c}_id" if c in LOOKUPS else c for c in SEARCH_COLUMNS]
+_FTS_CHANGED = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in _FTS_STORED)
+
+SEARCH_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_fts_delete AFTER DELETE ON requests
+    BEGIN {_FTS_SUB} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_fts_update AFTER UPDATE OF {", ".join(_FTS_STORED)} ON requests
+    WHEN {_FTS_CHANGED}
+    BEGIN {_FTS_SUB} {_FTS_ADD} END
+    """,
+]
+
+
+def has_search_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'requests_fts'").fetchone() is not None
+
+
+def index_new_rows(conn: sqlite3.Connection, after_rowid: int) -> None:
+    """
+    Add requests rows above `after_rowid` (i.e. the ones just inserted) to requests_fts.
+    """
+    conn.execute(f"""
+        INSERT INTO requests_fts (rowid, {_FTS_COLS})
+        SELECT rid, {_FTS_COLS} FROM requests_decoded WHERE rid > ?
+    """, (after_rowid,))
+
+
+def fts_available(conn: sqlite3.Connection) -> bool:
+    """
+    Whether this SQLite build has FTS5 with the trigram tokenizer (3.34+).
+    """
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp._fts_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def rebuild_search_index(conn: sqlite3.Connection) -> None:
+    """
+    Re-read every row of requests into requests_fts.
+    """
+    conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('rebuild')")
+
+
+# The search index as v7 shipped it, straight over the text columns of `requests`
+# (SEARCH_DDL above is the v8+ one, over requests_decoded).
+_V7_SEARCH_DDL = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+        {", ".join(SEARCH_COLUMNS)}, content='requests', content_rowid='rowid', tokenize='trigram'
+    )
+"""
+
+_V7_FTS_ADD = f"""
+        INSERT INTO requests_fts (rowid, {_FTS_COLS})
+        VALUES (NEW.rowid, {", ".join("NEW." + c for c in SEARCH_COLUMNS)});
+"""
+_V7_FTS_SUB = f"""
+        INSERT INTO requests_fts (requests_fts, rowid, {_FTS_COLS})
+        VALUES ('delete', OLD.rowid, {", ".join("OLD." + c for c in SEARCH_COLUMNS)});
+"""
+
+_V7_SEARCH_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_fts_delete AFTER DELETE ON requests
+    BEGIN {_V7_FTS_SUB} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS trg_requests_fts_update AFTER UPDATE OF {_FTS_COLS} ON requests
+    WHEN {" OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in SEARCH_COLUMNS)}
+    BEGIN {_V7_FTS_SUB} {_V7_FTS_ADD} END
+    """,
+]
+
+
+def _migrate_v7(conn: sqlite3.Connection) -> None:
+    """
+    v6 -> v7: FTS5 trigram search index over the text columns, back-filled from
+    existing rows. Skipped (searches fall back to pandas) where FTS5 isn't compiled in.
+    """
+    if not fts_available(conn):
+        print("Schema: SQLite has no FTS5 trigram tokenizer; complaint search will scan instead.")
+        return
+    conn.execute(_V7_SEARCH_DDL)
+    for ddl in _V7_SEARCH_TRIGGERS:
+        conn.execute(ddl)
+    rebuild_search_index(conn)
+
+
+DECODED_VIEW = "requests_decoded"
+
+
+def decoded_view_ddl() -> str:
+    """
+    `requests` with the lookup ids turned back into text: REQUESTS_COLUMNS plus the
+    rowid as `rid`. Joins are on the lookups' primary keys, so a rowid range or an
+    indexed filter on `requests` still drives the query.
+    """
+    cols, joins = ["r.rowid AS rid"], []
+    for name in REQUESTS_COLUMNS:
+        if name in LOOKUPS:
+            alias = LOOKUPS[name]
+            cols.append(f"{alias}.name AS {name}")
+            joins.append(f"LEFT JOIN {alias} ON {alias}.id = r.{name}_id")
+        else:
+            cols.append(f"r.{name}")
+    return f"CREATE VIEW IF NOT EXISTS {DECODED_VIEW} AS SELECT {', '.join(cols)} FROM requests r {' '.join(joins)}"
+
+
+def decode_lookups(conn: sqlite3.Connection, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn complaint_type_id/borough_id columns into Categorical complaint_type/borough,
+    built straight from the ids - no Python string per row, and group-bys and .str
+    filters work on the few hundred categories instead of every row.
+    """
+    for name, lookup in LOOKUPS.items():
+        col = f"{name}_id"
+        if col not in df:
+            continue
+        rows = conn.execute(f"SELECT id, name FROM {lookup} ORDER BY id").fetchall()
+        ids = np.array([i for i, _ in rows], dtype=np.int64)
+        values = df[col].to_numpy(dtype=float, na_value=np.nan)
+        codes = np.full(len(df), -1, dtype=np.int64)
+        present = ~np.isnan(values)
+        if len(ids):
+            pos = np.minimum(np.searchsorted(ids, values[present]), len(ids) - 1)
+            codes[present] = np.where(ids[pos] == values[present], pos, -1)
+        df[col] = pd.Categorical.from_codes(codes, categories=[n for _, n in rows])
+        df = df.rename(columns={col: name})
+    return df
+
+
+def _migrate_v8(conn: sqlite3.Connection) -> None:
+    """
+    v7 -> v8: complaint_type/borough move into lookup tables and `requests` keeps
+    integer ids. The table is rebuilt keeping every rowid (alert cursors and the geo
+    index are keyed on them), then the rollups and the full-text index, which both
+    depend on the new layout, are rebuilt.
+    """
+    for lookup in LOOKUPS.values():
+        conn.execute(LOOKUP_DDL.format(lookup=lookup))
+    for name, lookup in LOOKUPS.items():
+        conn.execute(f"""
+            INSERT OR IGNORE INTO {lookup} (name)
+            SELECT DISTINCT {name} FROM requests WHERE {name} IS NOT NULL ORDER BY 1
+        """)
+
+    # Everything that references the old layout goes first, or the rename drags it along.
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'requests'")
+    for (trigger,) in triggers.fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+    conn.execute(f"DROP VIEW IF EXISTS {DECODED_VIEW}")
+    conn.execute("DROP TABLE IF EXISTS requests_fts")
+    conn.execute("DROP TABLE IF EXISTS rollup_hourly")
+    for key in REQUESTS_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS idx_requests_{key}")
+    conn.execute("ALTER TABLE requests RENAME TO requests_v7")
+    create_requests_table(conn, encoded=True)
+
+    select = [
+        f"{LOOKUPS[name]}.id" if name in LOOKUPS else f"old.{name}" for name in REQUESTS_COLUMNS
+    ]
+    joins = " ".join(
+        f"LEFT JOIN {lookup} ON {lookup}.name = old.{name}" for name, lookup in LOOKUPS.items()
+    )
+    conn.execute(f"""
+        INSERT INTO requests (rowid, {", ".join(STORED_COLUMNS)})
+        SELECT old.rowid, {", ".join(select)} FROM requests_v7 old {joins}
+    """)
+    conn.execute("DROP TABLE requests_v7")
+
+    conn.execute(decoded_view_ddl())
+    conn.execute(ROLLUP_DDL)
+    for ddl in ROLLUP_TRIGGERS:
+        conn.execute(ddl)
+    rebuild_rollups(conn)
+    conn.execute(GEO_DDL)
+    for ddl in GEO_TRIGGERS:
+        conn.execute(ddl)
+    if not fts_available(conn):
+        print("Schema: SQLite has no FTS5 trigram tokenizer; complaint search will scan instead.")
+        return
+    conn.execute(SEARCH_DDL)
+    for ddl in SEARCH_TRIGGERS:
+        conn.execute(ddl)
+    rebuild_search_index(conn)
+
+
+def _has(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _migrate_v9(conn: sqlite3.Connection) -> None:
+    """
+    v8 -> v9: check that the derived tables of the lookup layout are all there - the
+    requests_decoded view, the id-keyed rollups and their triggers, and (where FTS5 is
+    available) the search index over the view - and build and back-fill any that
+    aren't. Files that went through v3/v7 and v8 already have them, so normally this
+    is a handful of sqlite_master lookups. The triggers are all CREATE IF NOT EXISTS.
+    """
+    conn.execute(decoded_view_ddl())
+    if not _has(conn, "rollup_hourly"):
+        conn.execute(ROLLUP_DDL)
+        rebuild_rollups(conn)
+    for ddl in ROLLUP_TRIGGERS:
+        conn.execute(ddl)
+    if not fts_available(conn):
+        return
+    if not _has(conn, "requests_fts"):
+        conn.execute(SEARCH_DDL)
+        rebuild_search_index(conn)
+    for ddl in SEARCH_TRIGGERS:
+        conn.execute(ddl)
+
+
+MIGRATIONS = {
+    1: _migrate_v1,
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: _migrate_v5,
+    6: _migrate_v6,
+    7: _migrate_v7,
+    8: _migrate_v8,
+    9: _migrate_v9,
+}
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION, one migration at a time, in a single
+    transaction. Cheap no-op (one PRAGMA read) when already current.
+    """
+    version = schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN")
+    try:
+        for v in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[v](conn)
+            conn.execute(f"PRAGMA user_version = {v}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f"Schema: Migrated database from v{version} to v{SCHEMA_VERSION}.")
+    return SCHEMA_VERSION
@@ -0,0 +1,223 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import requests
+
+from src.db_utils import ConnectionPool, DBUtils
+
+TREND_KINDS = ("daily", "top", "borough", "density")
+
+
+def _floats(value: Optional[str], n: int):
+    if value is None:
+        return None
+    values = tuple(float(x) for x in value.split(","))
+    if len(values) != n:
+        raise ValueError(f"Expected {n} comma-separated numbers: {value}")
+    return values
+
+
+class QueryService:
+    """
+    Long-running HTTP/JSON front end for the read side of the pipeline, so dashboards
+    (and the CLI with --server) don't pay interpreter start-up, the pandas/matplotlib
+    imports and a fresh connection on every query.
+
+    GET /trends?kind=daily|top|borough|density&since=&until=&top_n=&cell_m=&bbox=
+    GET /alerts?filter=&hours=&bbox=&near=
+    GET /preview?n=
+    GET /health
+
+    Every response is {"data_version", "cached", "rows": [...]}. Queries borrow from a
+    pool of read-only connections. Trend and preview results are kept in an LRU keyed
+    on the request and dropped as soon as the data changes: the version is SQLite's
+    PRAGMA data_version, which moves whenever another connection (the writer, a
+    rebuild) commits to the file. Alerts aren't cached - their window moves with the
+    clock - but they're index lookups anyway.
+
+    With partition_dir the queries go through the partition planner instead of the
+    pool, and the version is the size/mtime of the partition files.
+    """
+    def __init__(
+        self,
+        db_path: str = "data/nyc311.db",
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        partition_dir: Optional[str] = None,
+        pool_size: int = 4,
+        cache_entries: int = 256,
+    ):
+        # Imported here so the thin client (query_service) doesn't pull in matplotlib.
+        from src.alerts import AlertEngine
+        from src.trends import TrendAnalyser
+
+        self.db_path = db_path
+        self.partition_dir = partition_dir
+        self.pool = None
+        if partition_dir is None:
+            DBUtils(db_path).migrate()  # the pool is read-only, so the schema has to be current first
+            self.pool = ConnectionPool(db_path, size=pool_size)
+            self._watcher = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True,
+                                            check_same_thread=False)
+        self.db = DBUtils(db_path, partition_dir=partition_dir, pool=self.pool)
+        self.trends = TrendAnalyser(db_path, partition_dir=partition_dir, pool=self.pool)
+        self.alerts = AlertEngine(db_path, partition_dir=partition_dir, pool=self.pool)
+
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._cache_version = None
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def data_version(self):
+        if self.partition_dir is not None:
+            files = sorted(p for p in Path(self.partition_dir).rglob("requests_*.db*") if ".cache" not in p.parts)
+            return hash(tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in files))
+        with self._lock:
+            return self._watcher.execute("PRAGMA data_version").fetchone()[0]
+
+    # ── queries ──
+
+    def _trends(self, q: Dict[str, str]) -> pd.DataFrame:
+        kind = q.get("kind", "daily")
+        window = {"since": q.get("since"), "until": q.get("until")}
+        if kind == "daily":
+            return self.trends.counts("day", **window)
+        if kind == "top":
+            return self.trends.counts(by=["complaint_type"], limit=int(q.get("top_n", 10)), **window)
+        if kind == "borough":
+            return self.trends.counts(by=["borough"], **window)
+        if kind == "density":
+            return self.trends.density(float(q.get("cell_m", 500)), bbox=_floats(q.get("bbox"), 4), **window)
+        raise ValueError(f"Unknown trend kind: {kind} (expected one of {', '.join(TREND_KINDS)})")
+
+    def _alerts(self, q: Dict[str, str]) -> pd.DataFrame:
+        bbox, near = _floats(q.get("bbox"), 4), _floats(q.get("near"), 3)
+        if "filter" not in q and bbox is None and near is None:
+            raise ValueError("alerts needs filter, bbox and/or near.")
+        return self.alerts.recent_complaints(q.get("filter", ""), int(q.get("hours", 24)), bbox=bbox, near=near,
+                                             verbose=False)
+
+    def _preview(self, q: Dict[str, str]) -> pd.DataFrame:
+        return self.db.preview(n=int(q.get("n", 10)))
+
+    # path -> (query, cacheable)
+    @property
+    def routes(self) -> Dict[str, Tuple[Callable[[Dict[str, str]], pd.DataFrame], bool]]:
+        return {"/trends": (self._trends, True), "/alerts": (self._alerts, False), "/preview": (self._preview, True)}
+
+    def handle(self, path: str, q: Dict[str, str]) -> bytes:
+        """
+        JSON body for one GET to a known path (ValueError for bad parameters).
+        """
+        version = self.data_version()
+        if path == "/health":
+            return json.dumps({"status": "ok", "data_version": version, "cache_entries": len(self._cache),
+                               "hits": self.hits, "misses": self.misses}).encode()
+        query, cacheable = self.routes[path]
+        key = (path, tuple(sorted(q.items())))
+        if cacheable:
+            with self._lock:
+                if version != self._cache_version:
+                    self._cache.clear()
+                    self._cache_version = version
+                body = self._cache.get(key)
+                if body is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return b'{"data_version": %d, "cached": true, "rows": %s}' % (version, body)
+                self.misses += 1
+
+        df = query(q)
+        body = df.to_json(orient="records", date_format="iso").encode()
+        if cacheable:
+            with self._lock:
+                if version == self._cache_version:
+                    self._cache[key] = body
+                    while len(self._cache) > self.cache_entries:
+                        self._cache.popitem(last=False)
+        return b'{"data_version": %d, "cached": false, "rows": %s}' % (version, body)
+
+    def _handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                start = time.perf_counter()
+                if url.path != "/health" and url.path not in service.routes:
+                    self._send(404, json.dumps({"error": f"Unknown endpoint: {url.path}"}).encode())
+                    return
+                try:
+                    body, status = service.handle(url.path, q), 200
+                except ValueError as e:
+                    body, status = json.dumps({"error": str(e)}).encode(), 400
+                except Exception as e:
+                    body, status = json.dumps({"error": repr(e)}).encode(), 500
+                self._send(status, body)
+                print(f"QueryService: {status} {self.path} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        return Handler
+
+    def start(self) -> "QueryService":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.close()
+
+    def close(self) -> None:
+        self.server.server_close()
+        if self.pool is not None:
+            self.pool.close()
+            self._watcher.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def query_service(base_url: str, endpoint: str, timeout: float = 30.0, **params) -> pd.DataFrame:
+    """
+    Thin client: GET <base_url>/<endpoint> with `params` (None values dropped) and
+    return the rows as a DataFrame.
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    response = requests.get(f"{base_url.rstrip('/')}/{endpoint}", params=params, timeout=timeout)
+    if response.status_code != 200:
+        try:
+            message = response.json().get("error", response.text)
+        except ValueError:
+            message = response.text
+        raise RuntimeError(f"Query service returned {response.status_code}: {message}")
+    return pd.DataFrame(response.json()["rows"])
@@ -0,0 +1,76 @@
+import json
+import sys
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+import requests
+
+
+class AlertSink(ABC):
+    """
+    Somewhere matched alerts get sent. emit() receives one DataFrame per batch with a
+    `rule` column plus the record fields. Producers whose rows aren't records (e.g.
+    AnomalyDetector) add a `message` column with the one-line summary to show.
+    """
+    @abstractmethod
+    def emit(self, alerts: pd.DataFrame) -> None:
+        pass
+
+    @staticmethod
+    def _records(alerts: pd.DataFrame) -> List[dict]:
+        # NaN -> None so the payload is valid JSON.
+        return json.loads(alerts.to_json(orient="records", date_format="iso"))
+
+
+class StdoutSink(AlertSink):
+    def emit(self, alerts: pd.DataFrame) -> None:
+        for rec in self._records(alerts):
+            if rec.get("message"):
+                print(f"ALERT [{rec['rule']}] {rec['message']}")
+                continue
+            print(f"ALERT [{rec['rule']}] {rec.get('created_date')} "
+                  f"{rec.get('borough') or '-'} {rec.get('complaint_type')} ({rec.get('unique_key')})")
+        sys.stdout.flush()
+
+
+class JSONLSink(AlertSink):
+    """Appends one JSON object per alert to a file."""
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def emit(self, alerts: pd.DataFrame) -> None:
+        with open(self.path, "a") as f:
+            for rec in self._records(alerts):
+                f.write(json.dumps(rec) + "\n")
+
+
+class WebhookSink(AlertSink):
+    """POSTs each batch of alerts as a JSON list to a (local) webhook URL."""
+    def __init__(self, url: str, timeout: float = 2.0):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def emit(self, alerts: pd.DataFrame) -> None:
+        try:
+            self.session.post(self.url, json=self._records(alerts), timeout=self.timeout).raise_for_status()
+        except requests.RequestException as e:
+            # An unreachable webhook shouldn't stop ingestion.
+            print(f"WebhookSink: Failed to deliver {len(alerts)} alerts to {self.url}: {e}")
+
+
+def make_sink(spec: str) -> AlertSink:
+    """
+    Build a sink from a CLI spec: "stdout", "jsonl:<path>" or "webhook:<url>".
+    """
+    kind, _, target = spec.partition(":")
+    if kind == "stdout":
+        return StdoutSink()
+    if kind == "jsonl" and target:
+        return JSONLSink(target)
+    if kind == "webhook" and target:
+        return WebhookSink(target)
+    raise ValueError(f"Unknown alert sink: {spec}")
@@ -0,0 +1,50 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+
+class CursorStore:
+    """
+    Tiny JSON file used to remember how far a paged run got, so a crashed or
+    interrupted backfill can pick up from the last page that was fully written.
+    Writes go to a temp file first and are swapped in with os.replace, so the
+    file is never left half-written.
+    """
+    def __init__(self, path: str = "data/run_cursor.json"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def load(self) -> Optional[Dict]:
+        if not self.path.exists():
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, state: Dict) -> None:
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+
+class SliceStore(CursorStore):
+    """
+    Records which time slices of a backfill have been fully written, so a rerun
+    only fetches the slices that are still missing. Slice ids are "since/until"
+    (see backfill.slice_key).
+    """
+    def completed(self) -> set:
+        state = self.load() or {}
+        return set(state.get("completed", []))
+
+    def mark_done(self, slice_id: str) -> None:
+        done = self.completed()
+        done.add(slice_id)
+        self.save({"completed": sorted(done)})
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# Rough shape of the real feed: a handful of complaint types dominate.
+COMPLAINT_TYPES = [
+    "Noise - Residential", "Illegal Parking", "HEAT/HOT WATER", "Blocked Driveway",
+    "Noise - Street/Sidewalk", "Street Condition", "UNSANITARY CONDITION", "Water System",
+    "Noise - Commercial", "PLUMBING", "Abandoned Vehicle", "Rodent", "Sanitation Condition",
+    "Noise - Vehicle", "Street Light Condition", "Dirty Condition", "Graffiti",
+    "Homeless Person Assistance", "Sidewalk Condition", "Noise - Helicopter",
+]
+BOROUGHS = ["BROOKLYN", "QUEENS", "MANHATTAN", "BRONX", "STATEN ISLAND", "Unspecified"]
+BOROUGH_WEIGHTS = [0.31, 0.24, 0.21, 0.18, 0.05, 0.01]
+STATUSES = ["Closed", "Open", "In Progress", "Assigned", "Pending"]
+STATUS_WEIGHTS = [0.70, 0.15, 0.08, 0.05, 0.02]
+RESOLUTIONS = [
+    "The Police Department responded to the complaint and took action to fix the condition.",
+    "The Department of Sanitation investigated this complaint and found no violation.",
+    "The Department of Housing Preservation and Development inspected the condition.",
+    "This complaint does not fall under the jurisdiction of the agency.",
+]
+# created_date values the real feed has been seen to carry that validation must reject.
+BAD_DATES = ["", "N/A", "2025-13-45T25:61:00.000", "not a date"]
+
+
+def generate_records(
+    n: int,
+    seed: int = 0,
+    start: str = "2025-01-01",
+    days: float = 30,
+    key_start: int = 60_000_000,
+    null_rate: float = 0.0,
+    bad_date_rate: float = 0.0,
+    dup_rate: float = 0.0,
+) -> pd.DataFrame:
+    """
+    Seeded synthetic 311 rows in the API's shape (all values as strings, ISO
+    created_date with milliseconds), sorted by (created_date, unique_key).
+    Complaint types follow a Zipf-like skew; lat/lon fall inside the NYC bounding box.
+
+    The *_rate knobs make the data messy the way the real feed is (all default to 0,
+    which is what the fake API serves):
+    null_rate: fraction of optional fields (borough, lat/lon) set to None, and a tenth
+        of that fraction of complaint_type, so some rows are rejected.
+    bad_date_rate: fraction of rows whose created_date is unparseable.
+    dup_rate: fraction of rows that reuse an earlier row's unique_key.
+    """
+    rng = np.random.default_rng(seed)
+    t0 = pd.Timestamp(start).value // 10**9
+    created = np.sort(rng.integers(t0, t0 + int(days * 86400), size=n))
+
+    ranks = np.arange(1, len(COMPLAINT_TYPES) + 1)
+    weights = 1 / ranks ** 1.1
+    ctype = rng.choice(COMPLAINT_TYPES, size=n, p=weights / weights.sum())
+    borough = rng.choice(BOROUGHS, size=n, p=BOROUGH_WEIGHTS)
+    lat = rng.uniform(40.50, 40.91, size=n).round(6)
+    lon = rng.uniform(-74.25, -73.70, size=n).round(6)
+
+    status = rng.choice(STATUSES, size=n, p=STATUS_WEIGHTS)
+    closed = status == "Closed"
+    closed_at = created + rng.integers(600, 7 * 86400, size=n)
+    resolution = rng.choice(RESOLUTIONS, size=n)
+
+    df = pd.DataFrame({
+        "unique_key": (key_start + np.arange(n)).astype(str),
+        "created_date": pd.to_datetime(created, unit="s").strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "complaint_type": ctype,
+        "borough": borough,
+        "latitude": lat.astype(str),
+        "longitude": lon.astype(str),
+        "status": status,
+        "closed_date": np.where(closed, pd.to_datetime(closed_at, unit="s").strftime("%Y-%m-%dT%H:%M:%S.000"), None),
+        "resolution_description": np.where(closed, resolution, None),
+    })
+    if not (null_rate or bad_date_rate or dup_rate):
+        return df
+
+    df = df.astype(object)
+    for col in ("borough", "latitude", "longitude", "resolution_description"):
+        df.loc[rng.random(n) < null_rate, col] = None
+    df.loc[rng.random(n) < null_rate / 10, "complaint_type"] = None
+
+    bad = rng.random(n) < bad_date_rate
+    df.loc[bad, "created_date"] = rng.choice(BAD_DATES, size=int(bad.sum()))
+
+    dup = np.flatnonzero(rng.random(n) < dup_rate)
+    dup = dup[dup > 0]
+    if len(dup):
+        # Each duplicate points back at a random earlier row.
+        src = (rng.random(len(dup)) * dup).astype(int)
+        df.loc[dup, "unique_key"] = df["unique_key"].to_numpy()[src]
+    return df
@@ -1,36 +1,290 @@
 import os
 import sqlite3
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from typing import Optional, Sequence
+from src.db_utils import connection
+from src.schema import LOOKUPS, migrate, to_epoch
+
+# Metres per degree of latitude, and the latitude the density grid's longitude step is
+# taken at (mid NYC) so cells come out roughly square.
+METRES_PER_DEG = 111_320.0
+GRID_LAT = 40.7
 
 class TrendAnalyser:
     """
     Provides simple historical trend analysis for NYC 311 service requests.
     Reads from SQLite and produces PNG plots for easy demo/display.
+
+    Each analysis is a GROUP BY pushed down to SQLite, so only the aggregated result
+    comes back into pandas. Queries are answered from the writer-maintained
+    rollup_hourly table whenever the since/until window is hour-aligned (or open), and
+    fall back to the indexed requests table otherwise. use_rollups=False forces the
+    raw-table path, e.g. to cross-check the rollups.
+
+    If parquet_dir is given, the same aggregations run over the parquet store instead,
+    reading only the partitions in the window and only the columns needed.
+
+    With partition_dir (monthly SQLite databases, see src/partitions.py) the same SQL
+    runs on each month the window overlaps and the per-month groups are summed.
+    A ConnectionPool (see `serve`) supplies warm read connections instead of opening one
+    per query.
     """
-    def __init__(self, db_path="data/nyc311.db", output_dir="analysis/output"):
+    DIMENSIONS = ("complaint_type", "borough")
+
+    def __init__(self, db_path="data/nyc311.db", output_dir="analysis/output", use_rollups=True, parquet_dir=None,
+                 partition_dir=None, pool=None):
         self.db_path = db_path
+        self.pool = pool
         self.output_dir = output_dir
+        self.use_rollups = use_rollups
+        self.parquet_dir = parquet_dir
+        self.partitions = None
+        if partition_dir is not None:
+            from src.partitions import PartitionSet
+            self.partitions = PartitionSet(partition_dir)
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def _load_df(self):
-        with sqlite3.connect(self.db_path) as conn:
+    @staticmethod
+    def _epoch(ts: Optional[str]) -> Optional[int]:
+        return None if ts is None else int(to_epoch([ts]).iloc[0])
+
+    @staticmethod
+    def _window(column: str, since: Optional[int] = None, until: Optional[int] = None):
+        """
+        WHERE clause + params for an optional [since, until) epoch window on `column`.
+        """
+        clauses, params = [], []
+        if since is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{column} < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def _query(self, sql: str, params=(), since: Optional[str] = None, until: Optional[str] = None) -> pd.DataFrame:
+        if self.partitions is not None:
+            # since/until only pick the partitions; the SQL still filters on epochs.
+            return self.partitions.read_sql(sql, params, since=since, until=until)
+        with connection(self.db_path, self.pool) as conn:
             try: 
-                df = pd.read_sql("SELECT * FROM requests", conn)
-            except pd.errors.DatabaseError as e:
+                migrate(conn)
+                return pd.read_sql(sql, conn, params=params)
+            except (pd.errors.DatabaseError, sqlite3.OperationalError) as e:
                 print(f"Please first load data into the database, before running analysis")
                 raise
 
-        df["created_date"] = pd.to_datetime(df["created_date"])
-        return df
+    def counts(
+        self,
+        freq: Optional[str] = None,
+        by: Sequence[str] = (),
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Complaint counts grouped by time bucket (freq "day"/"hour"/None) and any of
+        complaint_type/borough. Time-bucketed results are ordered by bucket, otherwise
+        by count descending. Returns one row per group with the count in `n`.
+        """
+        if self.parquet_dir:
+            return self._parquet_counts(freq, by, since, until, limit)
+
+        lo, hi = self._epoch(since), self._epoch(until)
+        aligned = all(t is None or t % 3600 == 0 for t in (lo, hi))
+        if self.use_rollups and aligned:
+            table, ts, count, borough = "rollup_hourly", "hour_epoch", "SUM(n)", "NULLIF(borough_id, 0)"
+        else:
+            table, ts, count, borough = "requests", "created_epoch", "COUNT(*)", "borough_id"
+
+        # Group on the integer lookup ids, then join the names onto the (small) result.
+        cols, out, joins = [], [], []
+        if freq == "day":
+            cols.append(f"date({ts}, 'unixepoch') AS day")
+            out.append("t.day")
+        elif freq == "hour":
+            cols.append(f"datetime({ts} - {ts} % 3600, 'unixepoch') AS hour")
+            out.append("t.hour")
+        for dim in by:
+            if dim not in self.DIMENSIONS:
+                raise ValueError(f"Unknown dimension: {dim}")
+            lookup = LOOKUPS[dim]
+            cols.append(f"{borough} AS borough_id" if dim == "borough" else f"{dim}_id")
+            out.append(f"{lookup}.name AS {dim}")
+            joins.append(f"LEFT JOIN {lookup} ON {lookup}.id = t.{dim}_id")
+        if not cols:
+            raise ValueError("counts() needs a freq and/or at least one dimension.")
 
-    def daily_volume(self):
+        where, params = self._window(ts, lo, hi)
+        group = ", ".join(str(i + 1) for i in range(len(cols)))
+        order = group if freq else "n DESC"
+        sql = f"""
+            SELECT {", ".join(out)}, t.n
+            FROM (
+                SELECT {", ".join(cols)}, {count} AS n
+                FROM {table} {where}
+                GROUP BY {group}
+                HAVING n > 0
+            ) t {" ".join(joins)}
+            ORDER BY {order}
+        """
+        if self.partitions is not None:
+            df = self._query(sql, params, since, until)
+            if df.empty:
+                return df
+            keys = [c for c in df.columns if c != "n"]
+            df = df.groupby(keys, dropna=False, sort=False)["n"].sum().reset_index()
+            df[keys] = df[keys].astype(object).where(df[keys].notna(), None)  # groupby gives NaN back
+            df = df.sort_values(keys if freq else "n", ascending=bool(freq), kind="stable")
+            return (df.head(int(limit)) if limit else df).reset_index(drop=True)
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return self._query(sql, params)
+
+    def _parquet_counts(self, freq, by, since, until, limit) -> pd.DataFrame:
+        """
+        counts() over the parquet store: same output shape as the SQL path.
+        """
+        from src.parquet_store import ParquetStore
+
+        for dim in by:
+            if dim not in self.DIMENSIONS:
+                raise ValueError(f"Unknown dimension: {dim}")
+        if not freq and not by:
+            raise ValueError("counts() needs a freq and/or at least one dimension.")
+
+        df = ParquetStore(self.parquet_dir).scan(["created_epoch", *by], since=since, until=until)
+        keys = list(by)
+        if freq:
+            ts = pd.to_datetime(df["created_epoch"], unit="s")
+            fmt = "%Y-%m-%d" if freq == "day" else "%Y-%m-%d %H:00:00"
+            df[freq] = ts.dt.strftime(fmt)
+            keys = [freq, *keys]
+        out = df.groupby(keys, dropna=False).size().reset_index(name="n")
+        out = out.sort_values(keys if freq else "n", ascending=bool(freq), kind="stable")
+        if limit:
+            out = out.head(int(limit))
+        return out.reset_index(drop=True)
+
+    @staticmethod
+    def _grid_steps(cell_m: float):
+        dlat = cell_m / METRES_PER_DEG
+        dlon = cell_m / (METRES_PER_DEG * np.cos(np.radians(GRID_LAT)))
+        return float(dlat), float(dlon)
+
+    def density(
+        self,
+        cell_m: float = 500,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        bbox: Optional[Sequence[float]] = None,
+        complaint_type: Optional[str] = None,
+    ) -> pd.DataFrame:
+        """
+        Complaint counts on a grid of roughly `cell_m` x `cell_m` cells, one row per
+        non-empty cell: cell_lat/cell_lon (the cell centre) and n.
+
+        Binning happens in SQL. With a bbox (min_lat, min_lon, max_lat, max_lon) rows are
+        found through the requests_geo R*Tree, otherwise through the created_epoch index.
+        """
+        dlat, dlon = self._grid_steps(cell_m)
+        if self.parquet_dir:
+            return self._parquet_density(dlat, dlon, since, until, bbox, complaint_type)
+
+        lo, hi = self._epoch(since), self._epoch(until)
+        where, params = self._window("r.created_epoch", lo, hi)
+        clauses = [where[len("WHERE "):]] if where else []
+        clauses.append("r.latitude IS NOT NULL AND r.longitude IS NOT NULL")
+        source = "requests r"
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            source = "requests_geo g JOIN requests r ON r.rowid = g.id"
+            clauses.append(
+                "g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?"
+                " AND r.latitude BETWEEN ? AND ? AND r.longitude BETWEEN ? AND ?"
+            )
+            params += [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+            if lo is not None:
+                clauses.append("g.max_t >= ?")
+                params.append(lo)
+            if hi is not None:
+                clauses.append("g.min_t < ?")
+                params.append(hi)
+        if complaint_type is not None:
+            clauses.append(f"r.complaint_type_id = (SELECT id FROM {LOOKUPS['complaint_type']} WHERE name = ?)")
+            params.append(complaint_type)
+
+        # floor() without relying on SQLite's optional math functions
+        y, x = f"r.latitude / {dlat!r}", f"r.longitude / {dlon!r}"
+        sql = f"""
+            SELECT CAST({y} AS INTEGER) - ({y} < CAST({y} AS INTEGER)) AS gy,
+                   CAST({x} AS INTEGER) - ({x} < CAST({x} AS INTEGER)) AS gx,
+                   COUNT(*) AS n
+            FROM {source}
+            WHERE {" AND ".join(clauses)}
+            GROUP BY 1, 2
+            ORDER BY n DESC
+        """
+        df = self._query(sql, params, since, until)
+        if self.partitions is not None and not df.empty:
+            df = df.groupby(["gy", "gx"])["n"].sum().reset_index().sort_values("n", ascending=False, kind="stable")
+        return self._cells(df, dlat, dlon)
+
+    def _parquet_density(self, dlat, dlon, since, until, bbox, complaint_type) -> pd.DataFrame:
+        from src.parquet_store import ParquetStore
+
+        df = ParquetStore(self.parquet_dir).scan(["latitude", "longitude", "complaint_type"], since=since, until=until)
+        mask = df["latitude"].notna() & df["longitude"].notna()
+        if bbox is not None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            mask &= df["latitude"].between(min_lat, max_lat) & df["longitude"].between(min_lon, max_lon)
+        if complaint_type is not None:
+            mask &= df["complaint_type"] == complaint_type
+        df = df.loc[mask]
+        grid = pd.DataFrame({
+            "gy": np.floor(df["latitude"] / dlat).astype("int64"),
+            "gx": np.floor(df["longitude"] / dlon).astype("int64"),
+        })
+        out = grid.groupby(["gy", "gx"]).size().reset_index(name="n")
+        return self._cells(out.sort_values("n", ascending=False, kind="stable"), dlat, dlon)
+
+    @staticmethod
+    def _cells(df: pd.DataFrame, dlat: float, dlon: float) -> pd.DataFrame:
+        return pd.DataFrame({
+            "cell_lat": (df["gy"].to_numpy() + 0.5) * dlat,
+            "cell_lon": (df["gx"].to_numpy() + 0.5) * dlon,
+            "n": df["n"].to_numpy(),
+        })
+
+    def daily_counts(self, since: Optional[str] = None, until: Optional[str] = None) -> pd.Series:
+        """
+        Complaints per day, indexed by date.
+        """
+        df = self.counts("day", since=since, until=until)
+        return pd.Series(df["n"].values, index=pd.to_datetime(df["day"]), name="n")
+
+    def complaint_counts(self, n: Optional[int] = None, since: Optional[str] = None, until: Optional[str] = None) -> pd.Series:
+        """
+        Complaint counts by type, most common first (top-N if n given).
+        """
+        df = self.counts(by=["complaint_type"], since=since, until=until, limit=n)
+        return df.set_index("complaint_type")["n"]
+
+    def borough_counts(self, since: Optional[str] = None, until: Optional[str] = None) -> pd.Series:
+        """
+        Complaint counts by borough (rows without a borough are left out).
+        """
+        df = self.counts(by=["borough"], since=since, until=until).dropna(subset=["borough"])
+        return df.set_index("borough")["n"]
+
+    def daily_volume(self, since: Optional[str] = None, until: Optional[str] = None):
         """
         Aggregates total complaints per day.
         """
-        df = self._load_df()
-        df["day"] = df["created_date"].dt.date
-        counts = df.groupby("day").size()
+        counts = self.daily_counts(since, until)
 
         plt.figure(figsize=(10, 4))
         counts.plot(title="Daily Complaint Volume")
@@ -42,12 +296,11 @@ class TrendAnalyser:
 
         print(f"TrendAnalyser: Saved daily volume plot → {out}")
 
-    def top_complaints(self, n=10):
+    def top_complaints(self, n=10, since: Optional[str] = None, until: Optional[str] = None):
         """
         Shows top-N complaint types.
         """
-        df = self._load_df()
-        counts = df["complaint_type"].value_counts().head(n)
+        counts = self.complaint_counts(n, since, until)
 
         plt.figure(figsize=(10, 4))
         counts.plot(kind="bar", title=f"Top {n} Complaint Types")
@@ -59,12 +312,11 @@ class TrendAnalyser:
 
         print(f"TrendAnalyser: Saved top complaints plot → {out}")
 
-    def borough_distribution(self):
+    def borough_distribution(self, since: Optional[str] = None, until: Optional[str] = None):
         """
         Visual summary of complaints by borough.
         """
-        df = self._load_df()
-        counts = df["borough"].value_counts()
+        counts = self.borough_counts(since, until)
 
         plt.figure(figsize=(6, 6))
         counts.plot(kind="pie", autopct="%1.1f%%", title="Complaint Distribution by Borough")
@@ -75,4 +327,31 @@ class TrendAnalyser:
         plt.savefig(out)
         plt.close()
 
-        print(f"TrendAnalyser: Saved borough distribution plot → {out}")
\ No newline at end of file
+        print(f"TrendAnalyser: Saved borough distribution plot → {out}")
+
+    def density_map(
+        self,
+        cell_m: float = 500,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        bbox: Optional[Sequence[float]] = None,
+    ):
+        """
+        Heatmap of complaint density per grid cell.
+        """
+        cells = self.density(cell_m, since, until, bbox)
+
+        plt.figure(figsize=(8, 8))
+        plt.scatter(cells["cell_lon"], cells["cell_lat"], c=cells["n"], s=4, marker="s", cmap="inferno")
+        plt.colorbar(label=f"Complaints per {cell_m:g} m cell")
+        plt.title("Complaint Density")
+        plt.xlabel("longitude")
+        plt.ylabel("latitude")
+        plt.tight_layout()
+
+        out = f"{self.output_dir}/density.png"
+        plt.savefig(out)
+        plt.close()
+
+        print(f"TrendAnalyser: Saved density map ({len(cells)} cells) → {out}")
+        return cells
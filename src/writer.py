@@ -1,7 +1,13 @@
+import json
+from collections import OrderedDict
 import sqlite3
 import pandas as pd
 from abc import ABC, abstractmethod
 from pathlib import Path
+from src.schema import (
+    LOOKUPS, REQUESTS_COLUMNS, content_hash, create_requests_table, has_search_index, index_new_rows, migrate,
+    to_epoch,
+)
 
 class WriterBase(ABC):
     """
@@ -12,68 +18,333 @@ class WriterBase(ABC):
     def write(self, df: pd.DataFrame): 
         pass
 
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class SQLiteWriter(WriterBase):
     """
     Concrete writer that persists data into a SQLite database. 
+
+    The table layout is declared in src/schema.py; only those columns are written and
+    created_epoch is derived here from created_date.
+
+    By default each write opens (and closes) its own connection. With persistent=True
+    the writer keeps a single connection for its lifetime, switches it to WAL with
+    relaxed fsyncs and a bigger page cache, and only sets the table up on the first
+    write - this is the mode for listen/backfill, where the same writer sees many batches.
+    Use close() (or a `with` block) when done.
+
+    mode="ignore" (default) keeps the first version of each unique_key (INSERT OR IGNORE).
+    mode="upsert" applies upstream changes: every row carries a row_hash of its tracked
+    fields and an existing row is only rewritten when the hash differs, so re-fetching an
+    unchanged window costs a key lookup per row and no page writes.
     """
-    def __init__(self, db_path: str = 'data/nyc311.db'):
+    PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",   # safe under WAL, one fsync per checkpoint not per commit
+        "cache_size": "-65536",    # 64 MiB page cache
+        "temp_store": "MEMORY",
+    }
+
+    MODES = ("ignore", "upsert")
+
+    def __init__(self, db_path: str = 'data/nyc311.db', persistent: bool = False, mode: str = "ignore"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported write mode: {mode}")
         self.db_path = db_path
+        self.persistent = persistent
+        self.mode = mode
+        self.last_updated = 0  # rows rewritten by the last upsert write
+        self._conn = None
+        self._ready_tables = set()
+        self._searchable = False  # requests_fts exists (see schema.index_new_rows)
+        self._lookup_ids = {}     # lookup table -> {name: id}; lookups only ever grow
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
 
+    def _connect(self):
+        if not self.persistent:
+            return sqlite3.connect(self.db_path)
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path)
+            for pragma, value in self.PRAGMAS.items():
+                self._conn.execute(f"PRAGMA {pragma} = {value}")
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._ready_tables.clear()
+
+    def _ensure_schema(self, conn, table: str):
+        """
+        Requests table comes from the declared schema in src/schema.py (migrating older
+        databases in place). Only checked once per connection in persistent mode.
+        """
+        if table in self._ready_tables:
+            return
+        if table == "requests":
+            migrate(conn)
+            self._searchable = has_search_index(conn)
+        else:
+            create_requests_table(conn, table)
+            conn.commit()
+        if self.persistent:
+            self._ready_tables.add(table)
+
     @staticmethod
-    def _count(conn, table: str) -> int:
+    def _prepare(df: pd.DataFrame) -> pd.DataFrame:
         """
-        Count the number of rows in table to track inserts
+        Keep only declared columns, derive created_epoch from created_date and hash the
+        tracked fields.
         """
-        cur = conn.cursor()
-        cur.execute(f"SELECT COUNT(*) FROM {table}")
-        (count,) = cur.fetchone()
-        return count
-    
-    def _ensure_unique_constraint(self, conn, table):
-        """Add UNIQUE constraint on unique_key if missing."""
-        # SQLite doesn't allow adding UNIQUE directly; use an index.
-        conn.execute(f"""
-            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_unique_key
-            ON {table}(unique_key);
-        """)
-        conn.commit()
-
-    def write(self, df: pd.DataFrame, table: str = "requests"):
+        df = df[[c for c in REQUESTS_COLUMNS if c in df.columns]].copy()
+        df["created_epoch"] = to_epoch(df["created_date"])
+        df["row_hash"] = content_hash(df)
+        return df
+
+    def _encode(self, conn, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Swap complaint_type/borough for their lookup ids (schema.LOOKUPS), adding names
+        that haven't been seen before. Ids are cached, so a batch of known names costs
+        one dict lookup per distinct value.
+        """
+        for name, lookup in LOOKUPS.items():
+            if name not in df:
+                continue
+            ids = self._lookup_ids.setdefault(lookup, {})
+            values = df.pop(name)
+            new = [v for v in values.dropna().unique() if v not in ids]
+            if new:
+                conn.executemany(f"INSERT OR IGNORE INTO {lookup} (name) VALUES (?)", [(v,) for v in new])
+                ids.update(conn.execute(f"SELECT name, id FROM {lookup}"))
+            codes = values.map(ids).astype("Int64").astype(object)
+            df[f"{name}_id"] = codes.where(codes.notna(), None)
+        return df
+
+    @staticmethod
+    def _upsert_sql(table: str, columns) -> str:
+        # IS NOT rather than <> so rows stored before v5 (NULL hash) get filled in too.
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "unique_key")
+        return f"""
+            INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})
+            ON CONFLICT(unique_key) DO UPDATE SET {updates}
+            WHERE {table}.row_hash IS NOT excluded.row_hash
+        """
+
+    @staticmethod
+    def _advance_checkpoint(conn, df: pd.DataFrame, table: str):
+        """
+        Moves the ingest checkpoint forward inside the write transaction, so it can never
+        disagree with what's actually in the table. Alongside the watermark it keeps the
+        unique_keys stored at exactly that timestamp: the next poll asks for
+        created_date >= watermark and skips those keys, so rows that share the boundary
+        timestamp but arrived late aren't lost.
+        """
+        batch = df.dropna(subset=["created_epoch"])
+        row = conn.execute(
+            "SELECT watermark, watermark_epoch, boundary_keys FROM ingest_checkpoint WHERE name = ?",
+            (table,),
+        ).fetchone()
+        watermark, wm_epoch, keys = row if row else (None, None, "[]")
+        keys = set(json.loads(keys))
+
+        if not batch.empty:
+            top = batch.loc[batch["created_epoch"] == batch["created_epoch"].max()]
+            top_ts = top["created_date"].max()
+            top_epoch = int(top["created_epoch"].iloc[0])
+            top_keys = set(top.loc[top["created_date"] == top_ts, "unique_key"].dropna())
+            if wm_epoch is None or (top_epoch, top_ts) > (wm_epoch, watermark):
+                watermark, wm_epoch, keys = top_ts, top_epoch, top_keys
+            elif (top_epoch, top_ts) == (wm_epoch, watermark):
+                keys |= top_keys
+
+        conn.execute(
+            """
+            INSERT INTO ingest_checkpoint
+                (name, watermark, watermark_epoch, boundary_keys, rows_processed, pages_processed, updated_at)
+            VALUES (?, ?, ?, ?, ?, 1, datetime('now'))
+            ON CONFLICT(name) DO UPDATE SET
+                watermark = excluded.watermark,
+                watermark_epoch = excluded.watermark_epoch,
+                boundary_keys = excluded.boundary_keys,
+                rows_processed = rows_processed + excluded.rows_processed,
+                pages_processed = pages_processed + 1,
+                updated_at = excluded.updated_at
+            """,
+            (table, watermark, wm_epoch, json.dumps(sorted(keys)), len(df)),
+        )
+
+    def write(self, df: pd.DataFrame, table: str = "requests") -> int:
         """
         Main write method to write records into dataframe, make sure that only new records are written. 
+        Returns the number of rows actually inserted (upserted rows are in last_updated).
         """
+        self.last_updated = 0
         if df.empty:
             print("Writer: No records to write.")
-            return
+            return 0
+        conn = self._connect()
         try: 
-            with sqlite3.connect(self.db_path) as conn:
-
-                # Create table if not exists (pandas handles schema extraction)
-                df.head(0).to_sql(table, conn, if_exists="append", index=False)
+            self._ensure_schema(conn, table)
+            df = self._prepare(df)
+            if table == "requests":
+                df = self._encode(conn, df)
 
-                # Ensure unique index exists
-                self._ensure_unique_constraint(conn, table)
+            # UPSERT rows using dynamic column selection
+            columns = ", ".join(df.columns)
+            placeholders = ", ".join(['?'] * len(df.columns))
+            rows = df.values.tolist()
 
-                before = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            # New rows are the ones above the previous max rowid (a seek, not a scan).
+            (top,) = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table}").fetchone()
 
-                # UPSERT rows using dynamic column selection
-                columns = ", ".join(df.columns)
-                placeholders = ", ".join(['?'] * len(df.columns))
-                rows = df.values.tolist()
-
-                conn.executemany(f"""
+            # rowcount is SQLite's changes(): only rows really inserted (OR IGNORE skips and
+            # trigger side effects don't count), so it costs nothing regardless of table size.
+            if self.mode == "upsert":
+                # changes() counts inserts and hash-changed updates alike.
+                cur = conn.executemany(self._upsert_sql(table, list(df.columns)), rows)
+                (inserted,) = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE rowid > ?", (top,)).fetchone()
+                self.last_updated = cur.rowcount - inserted
+            else:
+                cur = conn.executemany(f"""
                     INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})
                     """, 
                     rows
                 )
+                inserted = cur.rowcount
+            if table == "requests":
+                if inserted and self._searchable:
+                    index_new_rows(conn, top)
+                self._advance_checkpoint(conn, df, table)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self._lookup_ids.clear()  # ids added in this transaction are gone
+            raise RuntimeError(f"Error writing to SQLite: {e}.")
+        finally:
+            if not self.persistent:
+                conn.close()
 
-                after = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
-                inserted = after - before
+        if self.mode == "upsert":
+            print(f"Writer: Inserted {inserted} rows, updated {self.last_updated}.")
+        else:
+            print(f"Writer: Inserted {inserted} rows.")
+        return inserted
 
-                conn.commit()
 
-            print(f"Writer: Inserted {inserted} rows.")
-        except Exception as e:
-            raise RuntimeError(f"Error writing to SQLite: {e}.")
+class PartitionedSQLiteWriter(WriterBase):
+    """
+    SQLiteWriter spread over monthly databases (see src/partitions.py): each batch is
+    split by the month of created_date and each part written to that month's file.
+
+    One SQLiteWriter per month is kept, with the same persistent/mode settings; only
+    the `max_open` most recently written months hold a connection, so a backfill over
+    years doesn't pile up file handles. New rows for a month that's already archived go
+    to a new hot file for it and are merged in the next time the month is compacted.
+    Rows whose unique_key is already in the archive are dropped in "ignore" mode; in
+    "upsert" mode the month is compacted straight away, so the new version replaces
+    the archived one instead of both being read back.
+    """
+    def __init__(self, root: str = "data/partitions", persistent: bool = False, mode: str = "ignore",
+                 max_open: int = 12):
+        from src.partitions import PartitionSet
+        if mode not in SQLiteWriter.MODES:
+            raise ValueError(f"Unsupported write mode: {mode}")
+        self.partitions = PartitionSet(root)
+        self.persistent = persistent
+        self.mode = mode
+        self.max_open = max_open
+        self.last_updated = 0
+        self._writers = OrderedDict()  # month -> SQLiteWriter, least recently used first
+
+    def _writer(self, month: str) -> SQLiteWriter:
+        writer = self._writers.pop(month, None)
+        if writer is None:
+            writer = SQLiteWriter(str(self.partitions.hot_path(month)), persistent=self.persistent, mode=self.mode)
+        self._writers[month] = writer
+        while len(self._writers) > self.max_open:
+            _, oldest = self._writers.popitem(last=False)
+            oldest.close()
+        return writer
+
+    def write(self, df: pd.DataFrame, table: str = "requests") -> int:
+        from src.partitions import split_by_month
+
+        self.last_updated = 0
+        if df.empty:
+            print("Writer: No records to write.")
+            return 0
+        parts = split_by_month(df)
+        skipped = len(df) - sum(len(part) for part in parts.values())
+        if skipped:
+            print(f"Writer: Skipped {skipped} rows without a usable created_date.")
+        inserted = 0
+        for month, part in sorted(parts.items()):
+            archived = part["unique_key"].astype(str).isin(self.partitions.archived_keys(month, part["unique_key"]))
+            if not archived.all():
+                writer = self._writer(month)
+                inserted += writer.write(part[~archived], table=table)
+                self.last_updated += writer.last_updated
+            if not archived.any():
+                continue
+            if self.mode == "ignore":
+                print(f"Writer: Skipped {archived.sum()} rows already archived for {month}.")
+                continue
+            self._writer(month).write(part[archived], table=table)
+            self.last_updated += int(archived.sum())
+            self._writers.pop(month).close()
+            archive = self.partitions.months()[month]["archive"]
+            self.partitions.compact(month, compress=archive.suffix == ".gz")
+        return inserted
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+class ParquetWriter(WriterBase):
+    """
+    Writer for columnar analytics: appends each batch into the Hive-partitioned parquet
+    store (see src/parquet_store.py), deduped on unique_key within each day partition.
+    """
+    def __init__(self, root: str = "data/parquet", compact_after: int = 16):
+        from src.parquet_store import ParquetStore
+        self.store = ParquetStore(root, compact_after=compact_after)
+
+    def write(self, df: pd.DataFrame, table: str = "requests") -> int:
+        if df.empty:
+            print("ParquetWriter: No records to write.")
+            return 0
+        inserted = self.store.append(df)
+        print(f"ParquetWriter: Appended {inserted} rows.")
+        return inserted
+
+
+class FanoutWriter(WriterBase):
+    """
+    Sends every batch to several writers (e.g. SQLite and parquet) in turn.
+    Returns the first writer's inserted count.
+    """
+    def __init__(self, writers):
+        self.writers = list(writers)
+
+    def write(self, df: pd.DataFrame, table: str = "requests") -> int:
+        counts = [w.write(df, table=table) for w in self.writers]
+        return counts[0] if counts else 0
+
+    @property
+    def last_updated(self) -> int:
+        return getattr(self.writers[0], "last_updated", 0) if self.writers else 0
+
+    def close(self):
+        for w in self.writers:
+            w.close()
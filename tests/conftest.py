@@ -3,6 +3,7 @@
 import pytest
 import pandas as pd
 import sqlite3
+from src.reader import NYC311Reader
 from src.writer import SQLiteWriter
 
 
@@ -12,3 +13,38 @@ def temp_db(tmp_path):
     db_path = tmp_path / "test.db"
     writer = SQLiteWriter(db_path=str(db_path))
     return writer, str(db_path)
+
+
+def make_rows(n):
+    """Raw API rows, 3 per timestamp so page boundaries land mid-timestamp."""
+    return [
+        {
+            "unique_key": f"{i:05d}",
+            "created_date": f"2025-01-01T00:00:{i // 3:02d}.000",
+            "complaint_type": "Noise",
+        }
+        for i in range(n)
+    ]
+
+
+class FakeReader(NYC311Reader):
+    """Serves pages from an in-memory list by applying the keyset cursor itself."""
+
+    def __init__(self, rows, limit=None, fail_on_page=None):
+        super().__init__(limit=limit or len(rows))
+        self.rows = rows
+        self.calls = 0
+        self.fail_on_page = fail_on_page
+
+    def _get(self, params):
+        self.calls += 1
+        self.stats["requests"] += 1
+        if self.calls == self.fail_on_page:
+            raise RuntimeError("boom")
+        rows = self.rows
+        where = params.get("$where", "")
+        if "unique_key >" in where:
+            ts = where.split("'")[1]
+            key = where.split("'")[5]
+            rows = [r for r in rows if (r["created_date"], r["unique_key"]) > (ts, key)]
+        return rows[: params["$limit"]]
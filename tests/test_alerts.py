@@ -0,0 +1,136 @@
+# tests/test_alerts.py
+
+import pandas as pd
+import pytest
+from src.alerts import AlertEngine
+
+
+def rows(keys, complaint="Noise - Street"):
+    now = pd.Timestamp.now()
+    return pd.DataFrame([
+        {"unique_key": k, "created_date": (now - pd.Timedelta(minutes=5)).isoformat(), "complaint_type": complaint}
+        for k in keys
+    ])
+
+
+def test_new_matches_only_returns_rows_since_last_run(temp_db):
+    writer, db_path = temp_db
+    ae = AlertEngine(db_path=db_path)
+
+    writer.write(rows(["1", "2"]))
+    writer.write(rows(["3"], complaint="Heat"))
+    assert len(ae.new_matches("noise")) == 2
+    assert len(ae.new_matches("noise")) == 0
+
+    writer.write(rows(["4"]))
+    writer.write(rows(["1"]))  # duplicate, not re-ingested
+    assert ae.new_matches("noise")["unique_key"].tolist() == ["4"]
+
+    # Separate rule keeps its own cursor.
+    assert len(ae.new_matches("heat")) == 1
+
+
+def test_new_matches_after_drop_and_reload(temp_db):
+    from src.db_utils import DBUtils
+
+    writer, db_path = temp_db
+    ae = AlertEngine(db_path=db_path)
+    writer.write(rows(["1", "2", "3"]))
+    assert len(ae.new_matches("noise")) == 3
+
+    DBUtils(db_path).drop_table()
+    writer.write(rows(["4"]))
+    assert ae.new_matches("noise")["unique_key"].tolist() == ["4"]
+
+
+def test_recent_complaints_window(temp_db):
+    writer, db_path = temp_db
+    writer.write(rows(["1"]))
+    writer.write(pd.DataFrame([{"unique_key": "old", "created_date": "2020-01-01T00:00:00", "complaint_type": "Noise"}]))
+    assert AlertEngine(db_path=db_path).recent_complaints("noise", hours=1)["unique_key"].tolist() == ["1"]
+
+
+def geo_rows(points, minutes_ago=5):
+    now = pd.Timestamp.now()
+    return pd.DataFrame([
+        {"unique_key": k, "created_date": (now - pd.Timedelta(minutes=minutes_ago)).isoformat(),
+         "complaint_type": "Noise - Street", "latitude": lat, "longitude": lon}
+        for k, lat, lon in points
+    ])
+
+
+def test_near_matches_haversine(temp_db):
+    import numpy as np
+    from src.rules import haversine_m
+
+    writer, db_path = temp_db
+    rng = np.random.default_rng(0)
+    lats = 40.758 + rng.uniform(-0.02, 0.02, 500)
+    lons = -73.9855 + rng.uniform(-0.02, 0.02, 500)
+    writer.write(geo_rows([(str(i), lat, lon) for i, (lat, lon) in enumerate(zip(lats, lons))]))
+    writer.write(geo_rows([("old", 40.758, -73.9855)], minutes_ago=600))
+
+    found = AlertEngine(db_path=db_path).recent_complaints("noise", hours=1, near=(40.758, -73.9855, 800))
+    expected = {str(i) for i, d in enumerate(haversine_m(lats, lons, 40.758, -73.9855)) if d <= 800}
+    assert set(found["unique_key"]) == expected
+    assert found["distance_m"].is_monotonic_increasing
+
+
+def test_bbox_and_geo_index_follow_upserts(tmp_path):
+    import sqlite3
+    from src.writer import SQLiteWriter
+
+    db_path = str(tmp_path / "geo.db")
+    writer = SQLiteWriter(db_path, mode="upsert")
+    writer.write(geo_rows([("a", 40.70, -74.00), ("b", 40.80, -73.90)]))
+    ae = AlertEngine(db_path=db_path)
+    box = (40.75, -73.95, 40.85, -73.85)
+    assert ae.recent_complaints("", hours=1, bbox=box)["unique_key"].tolist() == ["b"]
+
+    # a moves into the box; the trigger re-indexes it
+    writer.write(geo_rows([("a", 40.78, -73.92)]))
+    assert sorted(ae.recent_complaints("", hours=1, bbox=box)["unique_key"]) == ["a", "b"]
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM requests_geo").fetchone()[0] == 2
+
+
+def test_search_index_queries(tmp_path):
+    from src.writer import SQLiteWriter
+
+    db_path = str(tmp_path / "fts.db")
+    writer = SQLiteWriter(db_path, mode="upsert")
+    now = (pd.Timestamp.now() - pd.Timedelta(minutes=5)).isoformat()
+    writer.write(pd.DataFrame([
+        {"unique_key": "1", "created_date": now, "complaint_type": "Noise - Street", "resolution_description": "Police responded"},
+        {"unique_key": "2", "created_date": now, "complaint_type": "Noise - Residential"},
+        {"unique_key": "3", "created_date": now, "complaint_type": "HEAT/HOT WATER"},
+        {"unique_key": "4", "created_date": "2020-01-01T00:00:00", "complaint_type": "Noise - Street"},
+    ]))
+    ae = AlertEngine(db_path=db_path)
+    assert ae._searchable()
+
+    def keys(q):
+        return sorted(ae.recent_complaints(q, hours=1)["unique_key"])
+
+    assert keys("noise") == ["1", "2"]
+    assert keys("hot wat") == ["3"]              # substring, case-insensitive
+    assert keys("fts:noise NOT street") == ["2"]
+    assert keys("fts:street OR heat") == ["1", "3"]
+    assert keys("fts:resid*") == ["2"]
+    assert keys("fts:resolution_description: police") == ["1"]
+    assert keys("st") == ["1"]                   # too short for trigrams, falls back to a scan
+
+    # without the prefix, FTS syntax is plain text and regexes are still regexes
+    assert keys("noise OR heat") == []
+    assert keys('Street (Out) "x"') == []
+    assert keys("Noise: Street") == []
+    assert keys("hot|resid") == ["2", "3"]
+    with pytest.raises(ValueError, match="Invalid search query"):
+        keys("fts:Noise: Street")               # no such column
+    with pytest.raises(ValueError, match="Invalid search query"):
+        keys('fts:Condition (Out')
+
+    # updates re-index; unchanged text doesn't touch the index
+    writer.write(pd.DataFrame([{"unique_key": "2", "created_date": now, "complaint_type": "Illegal Parking"}]))
+    assert keys("noise") == ["1"]
+    assert keys("parking") == ["2"]
@@ -0,0 +1,66 @@
+# tests/test_anomaly.py
+
+import pandas as pd
+from src.anomaly import AnomalyDetector, slot_of
+from src.sinks import StdoutSink
+
+
+def hour_rows(start, hours, per_hour, complaint="Noise", borough="BROOKLYN"):
+    """`per_hour` rows in each of `hours` consecutive hours from `start`."""
+    t0 = pd.Timestamp(start)
+    return pd.DataFrame([
+        {"unique_key": f"{h}-{i}", "created_date": (t0 + pd.Timedelta(hours=h, minutes=i % 60)).isoformat(),
+         "complaint_type": complaint, "borough": borough}
+        for h in range(hours) for i in range(per_hour)
+    ])
+
+
+def test_slots_follow_weekday_and_hour():
+    monday_9am = int(pd.Timestamp("2025-01-06T09:00:00").timestamp()) // 3600
+    assert slot_of(monday_9am) == 9
+    assert slot_of(monday_9am + 24 * 7) == 9
+    assert slot_of(monday_9am + 24) == 24 + 9
+
+
+def test_spike_alerts_once_against_seasonal_baseline(tmp_path, capsys):
+    state = tmp_path / "anomaly.npz"
+    detector = AnomalyDetector(state_path=str(state), min_obs=3)
+    # Four quiet weeks (3 an hour), fed a day at a time.
+    for day in range(28):
+        quiet = hour_rows(pd.Timestamp("2025-01-06") + pd.Timedelta(days=day), 24, 3)
+        assert detector(quiet).empty
+    assert detector.late == 0
+
+    # A restart picks the statistics up from disk.
+    detector = AnomalyDetector(state_path=str(state), min_obs=3)
+    spike = hour_rows("2025-02-03T09:00:00", 1, 30)
+    alerts = detector(spike.iloc[:20])
+    assert alerts[["complaint_type", "borough", "count"]].values.tolist() == [["Noise", "BROOKLYN", 20]]
+    assert alerts["expected"].iloc[0] == 3 and alerts["z"].iloc[0] > 4
+    StdoutSink().emit(alerts)
+    assert "ALERT [anomaly] 2025-02-03T09:00:00 BROOKLYN Noise: 20 this hour vs 3.0 expected" in capsys.readouterr().out
+    # Same hour keeps growing: no second alert; other series are unaffected.
+    assert detector(spike.iloc[20:]).empty
+    assert detector(hour_rows("2025-02-03T10:00:00", 1, 3, complaint="Heat")).empty
+
+    # Noise's 10am hour is back to nothing; Heat has no history yet, so no z-score.
+    current = detector.current()
+    assert current["complaint_type"].tolist() == ["Noise", "Heat"]
+    assert current["count"].tolist() == [0, 3]
+    assert current.loc[0, "expected"] == 3 and pd.isna(current.loc[1, "z"])
+
+
+def test_state_saved_on_hour_rollover_and_batches_sorted(tmp_path):
+    state = tmp_path / "anomaly.npz"
+    detector = AnomalyDetector(state_path=str(state))
+    rows = hour_rows("2025-01-06T09:00:00", 3, 4)
+    # Newest first inside a batch is fine: it is counted hour by hour.
+    detector(rows.iloc[::-1].iloc[:-2])
+    assert detector.late == 0 and detector.hour == int(pd.Timestamp("2025-01-06T11:00").timestamp()) // 3600
+    assert state.exists()
+
+    state.unlink()
+    detector(rows.iloc[-2:].assign(created_date="2025-01-06T11:30:00"))
+    assert not state.exists()  # same open hour, nothing rewritten
+    detector(hour_rows("2025-01-06T12:00:00", 1, 1))
+    assert state.exists()
@@ -0,0 +1,79 @@
+# tests/test_backfill.py
+
+import re
+import sqlite3
+from datetime import datetime
+from src.backfill import BackfillRunner, make_slices, slice_key
+from src.reader import NYC311Reader
+from src.state import SliceStore
+
+
+ROWS = [
+    {
+        "unique_key": f"{d}{h:02d}",
+        "created_date": f"2025-01-0{d}T{h:02d}:00:00.000",
+        "complaint_type": "Noise",
+    }
+    for d in range(1, 5)
+    for h in range(0, 24, 3)
+]
+
+
+class SliceReader(NYC311Reader):
+    """Applies the >= / < slice bounds of the generated $where to ROWS."""
+
+    fetched = []
+
+    def _get(self, params):
+        where = params["$where"]
+        lo = re.search(r"created_date >= '([^']+)'", where).group(1)
+        hi = re.search(r"created_date < '([^']+)'", where).group(1)
+        SliceReader.fetched.append(lo)
+        return [r for r in ROWS if lo <= r["created_date"] < hi][: params["$limit"]]
+
+
+def test_make_slices_hour():
+    slices = make_slices(datetime(2025, 1, 1), datetime(2025, 1, 1, 3), unit="hour")
+    assert slices[0] == ("2025-01-01T00:00:00", "2025-01-01T01:00:00")
+    assert len(slices) == 3
+
+
+def test_backfill_writes_all_slices_and_skips_done(temp_db, tmp_path):
+    writer, db_path = temp_db
+    store = SliceStore(str(tmp_path / "slices.json"))
+    store.mark_done("2025-01-02T00:00:00/2025-01-03T00:00:00")
+    SliceReader.fetched = []
+
+    runner = BackfillRunner(lambda: SliceReader(limit=10), writer, store, workers=3)
+    summary = runner.run(datetime(2025, 1, 1), datetime(2025, 1, 5))
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert summary["skipped"] == 1
+    assert "2025-01-02T00:00:00" not in SliceReader.fetched
+    assert count == len(ROWS) - 8
+    assert len(store.completed()) == 4
+
+    SliceReader.fetched = []
+    assert runner.run(datetime(2025, 1, 1), datetime(2025, 1, 5))["skipped"] == 4
+    assert SliceReader.fetched == []
+
+
+def test_rerun_refetches_slices_with_other_bounds(temp_db, tmp_path):
+    writer, db_path = temp_db
+    store = SliceStore(str(tmp_path / "slices.json"))
+    runner = BackfillRunner(lambda: SliceReader(limit=10), writer, store, workers=2)
+
+    # The last slice is cut short at 12:00; a later --until must fetch the whole day.
+    runner.run(datetime(2025, 1, 1), datetime(2025, 1, 2, 12))
+    assert slice_key("2025-01-02T00:00:00", "2025-01-02T12:00:00") in store.completed()
+    SliceReader.fetched = []
+    assert runner.run(datetime(2025, 1, 1), datetime(2025, 1, 3))["skipped"] == 1
+    assert SliceReader.fetched == ["2025-01-02T00:00:00"]
+
+    # Hour slices don't count as the day that starts at the same time.
+    runner.run(datetime(2025, 1, 3), datetime(2025, 1, 3, 1), unit="hour")
+    assert runner.run(datetime(2025, 1, 3), datetime(2025, 1, 4))["skipped"] == 0
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0] == 24
@@ -0,0 +1,31 @@
+# tests/test_bench.py
+
+from src.bench import STAGES, compare, run_benchmark
+from src.schema import validate_batch
+from src.synthetic import generate_records
+
+
+def test_generator_is_seeded_and_messy():
+    a = generate_records(5000, seed=3, null_rate=0.05, bad_date_rate=0.02, dup_rate=0.02)
+    b = generate_records(5000, seed=3, null_rate=0.05, bad_date_rate=0.02, dup_rate=0.02)
+    assert a.equals(b)
+    assert a["borough"].isna().any()
+    assert a["unique_key"].duplicated().any()
+
+    clean = validate_batch(a)
+    assert 0 < len(a) - len(clean) < 500  # bad dates and missing complaint types dropped
+
+
+def test_benchmark_reports_every_stage(tmp_path):
+    report = run_benchmark([2000], chunk_rows=500, workdir=str(tmp_path))
+
+    stages = report["sizes"]["2000"]
+    assert set(stages) == set(STAGES)
+    assert stages["decode_json"]["rows"] == 2000
+    assert all(r["records_per_s"] > 0 and r["peak_rss_mb"] > 0 for r in stages.values())
+
+
+def test_compare_flags_slower_stages():
+    base = {"sizes": {"10": {"a": {"records_per_s": 100.0}, "b": {"records_per_s": 100.0}}}}
+    cur = {"sizes": {"10": {"a": {"records_per_s": 50.0}, "b": {"records_per_s": 95.0}}}}
+    assert [r["stage"] for r in compare(base, cur, threshold=0.1)] == ["a"]
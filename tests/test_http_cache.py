@@ -0,0 +1,107 @@
+# tests/test_http_cache.py
+
+import sqlite3
+import pytest
+from src.fake_socrata import FakeSocrata, apply_soql
+from src.http_cache import CachedSession, CacheMiss
+from src.reader import NYC311Reader
+from src.runner import PipelineRunner
+from src.synthetic import generate_records
+
+
+@pytest.fixture
+def fake_api():
+    with FakeSocrata(generate_records(250, seed=1)) as server:
+        yield server
+
+
+def test_keyset_pages_against_fake_api(temp_db, fake_api):
+    writer, db_path = temp_db
+    reader = NYC311Reader(limit=100, base_url=fake_api.resource_url)
+
+    pages = PipelineRunner(reader, writer).run_pages()
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert pages == 3
+    assert count == 250
+
+
+def test_csv_pages_match_json(fake_api):
+    as_json = NYC311Reader(limit=100, base_url=fake_api.resource_url)
+    as_csv = NYC311Reader(limit=100, fmt="csv", base_url=fake_api.resource_url)
+
+    json_keys = [r["unique_key"] for page in as_json.fetch_pages() for r in page]
+    csv_keys = [k for page in as_csv.fetch_pages() for k in page["unique_key"]]
+    assert json_keys == csv_keys
+    assert len(set(json_keys)) == 250
+
+
+def test_record_then_replay(tmp_path, fake_api):
+    cache_dir = str(tmp_path / "cache")
+    recorder = NYC311Reader(limit=100, base_url=fake_api.resource_url,
+                            session=CachedSession(cache_dir, mode="record"))
+    recorded = list(recorder.fetch_pages())
+    served = fake_api.requests_served
+
+    replay = CachedSession(cache_dir, mode="replay")
+    replayed = list(NYC311Reader(limit=100, base_url=fake_api.resource_url, session=replay).fetch_pages())
+
+    assert replayed == recorded
+    assert fake_api.requests_served == served  # nothing went over the wire
+    assert replay.hits == len(recorded)
+
+
+def test_record_skips_error_responses(tmp_path, fake_api):
+    cache_dir = tmp_path / "cache"
+    recorder = CachedSession(str(cache_dir), mode="record")
+    url = f"{fake_api.resource_url}.json"
+    assert recorder.get(f"{fake_api.resource_url}.xml").status_code == 404
+    assert recorder.get(url, params={"$where": "no such ("}).status_code == 400
+    assert list(cache_dir.iterdir()) == []
+
+    with pytest.raises(CacheMiss):
+        CachedSession(str(cache_dir), mode="replay").get(url, params={"$where": "no such ("})
+
+
+def test_replay_miss_is_not_retried(tmp_path):
+    reader = NYC311Reader(limit=10, session=CachedSession(str(tmp_path), mode="replay"))
+    with pytest.raises(CacheMiss):
+        reader.fetch()
+
+
+def test_soql_order_offset_select():
+    df = generate_records(20, seed=2)
+    page = apply_soql(df, {
+        "$where": "borough = 'BROOKLYN' OR borough = 'QUEENS'",
+        "$order": "created_date DESC, unique_key ASC",
+        "$offset": 1, "$limit": 3, "$select": "unique_key,borough",
+    })
+    expected = df[df["borough"].isin(["BROOKLYN", "QUEENS"])].sort_values(
+        ["created_date", "unique_key"], ascending=[False, True]).iloc[1:4]
+    assert list(page.columns) == ["unique_key", "borough"]
+    assert page["unique_key"].tolist() == expected["unique_key"].tolist()
+
+
+def test_refresh_upserts_records_updated_upstream(tmp_path, fake_api):
+    from src.state import CursorStore
+    from src.writer import SQLiteWriter
+
+    db_path = str(tmp_path / "refresh.db")
+    store = CursorStore(str(tmp_path / "refresh.json"))
+    reader = NYC311Reader(limit=100, base_url=fake_api.resource_url)
+
+    with SQLiteWriter(db_path, persistent=True, mode="upsert") as writer:
+        runner = PipelineRunner(reader, writer)
+        assert runner.run_updates(cursor_store=store) == 250
+
+        fake_api.update(["60000007", "60000100"], "2030-01-01T00:00:00.000",
+                        status="Closed", resolution_description="Fixed.")
+        assert runner.run_updates(cursor_store=store) == 2  # only what changed since the cursor
+        assert runner.metrics.last_cycle["rows"] == {"inserted": 0, "updated": 2, "ignored": 0}
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT unique_key FROM requests WHERE resolution_description = 'Fixed.' ORDER BY 1"
+        ).fetchall()
+    assert rows == [("60000007",), ("60000100",)]
@@ -0,0 +1,71 @@
+# tests/test_listener.py
+
+import asyncio
+import sqlite3
+from src.fake_socrata import FakeSocrata
+from src.listener import AdaptiveInterval, AsyncListener
+from src.reader import NYC311Reader
+from src.runner import PipelineRunner
+from src.synthetic import generate_records
+from src.writer import SQLiteWriter
+
+
+def test_interval_tightens_on_full_pages_and_backs_off_when_empty():
+    policy = AdaptiveInterval(base=10, min_interval=0.5, max_interval=60)
+
+    assert policy.update(rows=100, page_size=100, elapsed=10) == 0.5
+    assert policy.update(rows=0, page_size=100, elapsed=10) == 2.0
+    assert policy.update(rows=0, page_size=100, elapsed=10) == 4.0
+    for _ in range(10):
+        policy.update(rows=0, page_size=100, elapsed=10)
+    assert policy.interval == 60
+
+
+def test_interval_follows_arrival_rate():
+    policy = AdaptiveInterval(base=10, min_interval=0, max_interval=600, target_fill=0.5, alpha=1.0)
+    # 10 rows/s, so half a 1000-row page takes 50s to arrive
+    assert policy.update(rows=100, page_size=1000, elapsed=10) == 50
+
+
+def test_listener_catches_up_then_idles(tmp_path):
+    db_path = str(tmp_path / "listen.db")
+    with FakeSocrata(generate_records(250, seed=4)) as api:
+        reader = NYC311Reader(limit=100, base_url=api.resource_url)
+        runner = PipelineRunner(reader, SQLiteWriter(db_path, persistent=True))
+        policy = AdaptiveInterval(base=0.05, min_interval=0, max_interval=0.1)
+        listener = AsyncListener(runner, policy, since="2000-01-01")
+
+        rows = asyncio.run(listener.run(max_polls=5))
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert rows == 250
+    assert count == 250
+    assert listener.cursor[1] == "60000249"
+    assert policy.interval == 0.1  # backed off after the backlog was drained
+
+
+class RecordingReader(NYC311Reader):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.params = []
+
+    def _get(self, params):
+        self.params.append(params)
+        return super()._get(params)
+
+
+def test_fresh_listener_starts_at_newest_page(tmp_path):
+    db_path = str(tmp_path / "listen.db")
+    with FakeSocrata(generate_records(250, seed=4)) as api:
+        reader = RecordingReader(limit=100, base_url=api.resource_url)
+        runner = PipelineRunner(reader, SQLiteWriter(db_path, persistent=True))
+        listener = AsyncListener(runner, AdaptiveInterval(base=0.05, min_interval=0, max_interval=0.1))
+
+        rows = asyncio.run(listener.run(max_polls=2))
+
+    probe, first = reader.params[:2]
+    assert probe["$order"] == "created_date DESC"
+    assert first["$order"].endswith("ASC") and "created_date >= " in first["$where"]
+    assert rows == 100  # only the newest page, not all 250 rows of history
+    assert listener.cursor[1] == "60000249"
@@ -0,0 +1,49 @@
+# tests/test_metrics.py
+
+import json
+import pytest
+from src.metrics import JSONLinesExporter, Metrics, PrometheusTextfile
+from src.runner import PipelineRunner
+from conftest import FakeReader, make_rows
+
+
+def test_cycle_metrics_per_stage(temp_db, tmp_path):
+    writer, _ = temp_db
+    rows = make_rows(10)
+    rows[0]["created_date"] = "garbage"
+    rows[1]["complaint_type"] = None
+    rows.append(dict(rows[5]))  # same key twice -> ignored by the writer
+
+    metrics = Metrics([PrometheusTextfile(str(tmp_path / "m.prom")), JSONLinesExporter(str(tmp_path / "m.jsonl"))])
+    PipelineRunner(FakeReader(rows), writer, metrics=metrics).run()
+
+    cycle = json.loads((tmp_path / "m.jsonl").read_text().splitlines()[-1])
+    assert cycle["kind"] == "run"
+    assert cycle["fetch"]["requests"] == 1
+    assert set(cycle["stages"]) == {"fetch", "validate", "hooks", "write"}
+    assert cycle["records"] == {"raw": 11, "accepted": 9,
+                                "rejected": {"bad_created_date": 1, "missing_complaint_type": 1}}
+    assert cycle["rows"] == {"inserted": 8, "updated": 0, "ignored": 1}
+
+    text = (tmp_path / "m.prom").read_text()
+    assert 'nyc311_records_total{outcome="rejected",reason="bad_created_date"} 1' in text
+    assert 'nyc311_rows_written_total{result="inserted"} 8' in text
+    assert 'nyc311_cycles_total{kind="run"} 1' in text
+
+
+def test_failed_cycle_is_counted(temp_db):
+    writer, _ = temp_db
+    metrics = Metrics()
+    with pytest.raises(RuntimeError):
+        PipelineRunner(FakeReader(make_rows(3), fail_on_page=1), writer, metrics=metrics).run()
+    assert metrics.get("nyc311_cycle_errors_total", kind="run") == 1
+    assert "error" in metrics.last_cycle
+
+
+def test_profile_next_cycle_only(temp_db, tmp_path):
+    writer, _ = temp_db
+    runner = PipelineRunner(FakeReader(make_rows(4)), writer)
+    runner.profile_next_cycle("cprofile", str(tmp_path / "cycle.prof"))
+    runner.run()
+    assert (tmp_path / "cycle.prof").exists()
+    assert runner._profile is None
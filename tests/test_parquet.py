@@ -0,0 +1,49 @@
+# tests/test_parquet.py
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from src.trends import TrendAnalyser
+from src.writer import FanoutWriter, ParquetWriter
+
+
+def batch(keys, day="01"):
+    return pd.DataFrame([
+        {
+            "unique_key": str(k),
+            "created_date": f"2025-01-{day}T{k % 24:02d}:00:00.000",
+            "complaint_type": "Noise" if k % 3 else "Heat",
+            "borough": "BROOKLYN" if k % 2 else None,
+        }
+        for k in keys
+    ])
+
+
+def test_parquet_dedupes_and_compacts(tmp_path):
+    writer = ParquetWriter(root=str(tmp_path / "pq"), compact_after=2)
+    assert writer.write(batch(range(5))) == 5
+    assert writer.write(batch(range(3, 8))) == 3
+    assert writer.write(batch(range(8, 10))) == 2  # third file triggers compaction
+
+    day = tmp_path / "pq" / "requests" / "year=2025" / "month=1" / "day=1"
+    assert len(list(day.glob("*.parquet"))) == 1
+    # A fresh writer re-reads the partition's keys and still dedupes.
+    assert ParquetWriter(root=str(tmp_path / "pq")).write(batch(range(10))) == 0
+
+
+def test_trends_from_parquet_match_sqlite(temp_db, tmp_path):
+    sqlite_writer, db_path = temp_db
+    pq_dir = str(tmp_path / "pq")
+    writer = FanoutWriter([sqlite_writer, ParquetWriter(root=pq_dir)])
+    writer.write(batch(range(10), day="01"))
+    writer.write(batch(range(10, 16), day="02"))
+
+    out = str(tmp_path / "out")
+    sql = TrendAnalyser(db_path=db_path, output_dir=out)
+    pq = TrendAnalyser(db_path=db_path, output_dir=out, parquet_dir=pq_dir)
+
+    assert pq.daily_counts().equals(sql.daily_counts())
+    assert pq.complaint_counts().to_dict() == sql.complaint_counts().to_dict()
+    assert pq.borough_counts(since="2025-01-02").to_dict() == sql.borough_counts(since="2025-01-02").to_dict()
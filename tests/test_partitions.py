@@ -0,0 +1,103 @@
+# tests/test_partitions.py
+
+import os
+import sqlite3
+import stat
+import pandas as pd
+import pytest
+from src.db_utils import DBUtils
+from src.partitions import PartitionSet
+from src.trends import TrendAnalyser
+from src.writer import PartitionedSQLiteWriter
+
+ROWS = [
+    {"unique_key": "1", "created_date": "2025-01-05T08:00:00.000", "complaint_type": "Noise", "borough": "BROOKLYN",
+     "latitude": 40.70, "longitude": -73.95},
+    {"unique_key": "2", "created_date": "2025-01-31T23:30:00.000", "complaint_type": "Heat", "borough": "QUEENS",
+     "latitude": 40.71, "longitude": -73.80},
+    {"unique_key": "3", "created_date": "2025-02-01T00:10:00.000", "complaint_type": "Noise", "borough": None,
+     "latitude": 40.75, "longitude": -73.99},
+    {"unique_key": "4", "created_date": "2025-03-15T12:00:00.000", "complaint_type": "Noise", "borough": "BROOKLYN",
+     "latitude": 40.70, "longitude": -73.95},
+    {"unique_key": "5", "created_date": "not a date", "complaint_type": "Noise", "borough": "BROOKLYN"},
+]
+
+
+@pytest.fixture
+def partition_dir(tmp_path):
+    root = tmp_path / "parts"
+    with PartitionedSQLiteWriter(str(root), persistent=True) as writer:
+        assert writer.write(pd.DataFrame(ROWS)) == 4
+    return str(root)
+
+
+def test_rows_routed_by_month(partition_dir):
+    parts = PartitionSet(partition_dir)
+    assert list(parts.months()) == ["2025_01", "2025_02", "2025_03"]
+    assert [p.name for p in parts.plan("2025-01-20", "2025-02-15")] == ["requests_2025_01.db", "requests_2025_02.db"]
+    assert [p.name for p in parts.plan("2025-02-01", "2025-03-01")] == ["requests_2025_02.db"]
+    assert DBUtils(partition_dir=partition_dir).count_rows() == 4
+
+
+def test_counts_match_single_database(partition_dir, temp_db, tmp_path):
+    writer, db_path = temp_db
+    writer.write(pd.DataFrame(ROWS))
+    single = TrendAnalyser(db_path=db_path, output_dir=str(tmp_path / "out"))
+    parted = TrendAnalyser(partition_dir=partition_dir, output_dir=str(tmp_path / "out"))
+
+    for kwargs in ({"by": ["complaint_type"]}, {"freq": "day", "by": ["borough"]},
+                   {"by": ["complaint_type"], "since": "2025-01-31T23:45:00", "until": "2025-03-01"}):
+        expected = single.counts(**kwargs)
+        got = parted.counts(**kwargs)
+        keys = [c for c in expected.columns if c != "n"]
+        pd.testing.assert_frame_equal(
+            got.sort_values(keys).reset_index(drop=True), expected.sort_values(keys).reset_index(drop=True),
+            check_dtype=False,
+        )
+    assert parted.complaint_counts(n=1).to_dict() == {"Noise": 3}
+    assert parted.density(cell_m=1000)["n"].sum() == 4
+
+
+def test_retention_archives_and_drops(partition_dir):
+    parts = PartitionSet(partition_dir)
+    done = parts.apply_retention(hot_months=1, keep_months=3, compress=True, now="2025-04-10")
+    assert done == {"archived": ["2025_02", "2025_03"], "dropped": ["2025_01"]}
+
+    months = parts.months()
+    assert list(months) == ["2025_02", "2025_03"]
+    archive = months["2025_03"]["archive"]
+    assert archive.name.endswith(".db.gz") and "hot" not in months["2025_03"]
+    assert not os.stat(archive).st_mode & stat.S_IWUSR
+
+    # Archives stay queryable, and a late row for an archived month is merged back in.
+    db = DBUtils(partition_dir=partition_dir)
+    assert db.count_rows() == 2
+    with PartitionedSQLiteWriter(partition_dir) as writer:
+        writer.write(pd.DataFrame([{"unique_key": "6", "created_date": "2025-03-20T09:00:00.000",
+                                    "complaint_type": "Heat", "borough": "QUEENS"}]))
+    assert db.count_rows() == 3
+    parts.compact("2025_03")
+    assert list(parts.months()["2025_03"]) == ["archive"]
+    with sqlite3.connect(parts.plan("2025-03-01")[0]) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+        assert conn.execute("SELECT COUNT(*) FROM requests").fetchone() == (2,)
+
+
+def test_reingested_archived_key_is_not_double_counted(partition_dir, tmp_path):
+    parts = PartitionSet(partition_dir)
+    parts.apply_retention(hot_months=1, compress=True, now="2025-04-10")
+    db = DBUtils(partition_dir=partition_dir)
+    trends = TrendAnalyser(partition_dir=partition_dir, output_dir=str(tmp_path / "out"))
+    changed = pd.DataFrame([dict(ROWS[0], complaint_type="Heat")])
+
+    with PartitionedSQLiteWriter(partition_dir) as writer:
+        assert writer.write(changed) == 0
+    assert "hot" not in parts.months()["2025_01"]
+    assert trends.complaint_counts(n=5).to_dict() == {"Noise": 3, "Heat": 1}
+
+    with PartitionedSQLiteWriter(partition_dir, mode="upsert") as writer:
+        assert writer.write(changed) == 0 and writer.last_updated == 1
+    assert list(parts.months()["2025_01"]) == ["archive"]
+    assert parts.months()["2025_01"]["archive"].name.endswith(".db.gz")
+    assert db.count_rows() == 4
+    assert trends.complaint_counts(n=5).to_dict() == {"Noise": 2, "Heat": 2}
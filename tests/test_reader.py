@@ -0,0 +1,94 @@
+# tests/test_reader.py
+
+import io
+import json
+import pandas as pd
+from src.reader import NYC311Reader, iter_json_array
+from src.runner import PipelineRunner
+
+RECORDS = [
+    {"unique_key": "1", "created_date": "2025-01-01T10:00:00.000", "complaint_type": "Noise",
+     "borough": "QUEENS", "latitude": "40.7", "longitude": "-73.9"},
+    {"unique_key": "2", "created_date": "2025-01-01T11:00:00.000", "complaint_type": "Heat"},
+    {"unique_key": "3", "created_date": "bad", "complaint_type": "Heat"},
+]
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body: bytes):
+        self.content = body
+        self.raw = io.BytesIO(body)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeSession:
+    """Records requests and answers in whichever format the URL asks for."""
+
+    def __init__(self):
+        self.calls = []
+        self.headers = {}
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        self.calls.append((url, params))
+        if url.endswith(".csv"):
+            return FakeResponse(pd.DataFrame(RECORDS).to_csv(index=False).encode())
+        return FakeResponse(json.dumps(RECORDS).encode())
+
+
+def make_reader(**kwargs):
+    reader = NYC311Reader(limit=10, **kwargs)
+    reader.session = FakeSession()
+    return reader
+
+
+def test_select_projects_schema_fields():
+    reader = make_reader()
+    reader.fetch()
+    url, params = reader.session.calls[0]
+    assert url.endswith(".json")
+    assert params["$select"] == (
+        "unique_key,created_date,complaint_type,borough,latitude,longitude,"
+        "status,closed_date,resolution_description"
+    )
+
+
+def test_csv_pages_validate_like_json():
+    json_df = PipelineRunner.validate(make_reader().fetch())
+    csv_page = make_reader(fmt="csv").fetch()
+
+    assert isinstance(csv_page, pd.DataFrame)
+    pd.testing.assert_frame_equal(PipelineRunner.validate(csv_page), json_df)
+    assert NYC311Reader.page_cursor(csv_page) == ("bad", "3")
+
+
+def test_iter_json_array_handles_split_chunks():
+    body = json.dumps([{"k": "é" * 3, "n": i} for i in range(20)]).encode()
+    chunks = [body[i:i + 7] for i in range(0, len(body), 7)]  # splits multi-byte chars too
+    assert [r["n"] for r in iter_json_array(chunks)] == list(range(20))
+    assert list(iter_json_array([b"[", b"]"])) == []
+
+
+def test_fetch_stream_chunks_match_fetch():
+    for fmt in ("json", "csv"):
+        reader = make_reader(fmt=fmt)
+        chunks = list(reader.fetch_stream(chunk_rows=2))
+        assert [len(c) for c in chunks] == [2, 1]
+        streamed = pd.concat([PipelineRunner.validate(c) for c in chunks], ignore_index=True)
+        pd.testing.assert_frame_equal(streamed, PipelineRunner.validate(make_reader().fetch()))
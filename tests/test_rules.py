@@ -0,0 +1,79 @@
+# tests/test_rules.py
+
+import json
+import pandas as pd
+import pytest
+from src.alerts import StreamAlerter
+from src.rules import Rule, RuleSet, load_rules
+from src.sinks import JSONLSink, make_sink
+
+
+BATCH = pd.DataFrame({
+    "unique_key": ["1", "2", "3", "4"],
+    "created_date": ["2025-01-01T10:00:00.000"] * 4,
+    "complaint_type": ["Noise - Street", "Rodent", "HEAT/HOT WATER", None],
+    "borough": ["BROOKLYN", "QUEENS", None, "BROOKLYN"],
+    "latitude": [40.7000, 40.7030, None, 40.8],
+    "longitude": [-74.0000, -74.0000, None, -73.9],
+})
+
+
+def matched(ruleset, df=BATCH):
+    out = ruleset.match(df)
+    return sorted(zip(out["rule"], out["unique_key"])) if not out.empty else []
+
+
+def test_predicates_are_anded():
+    rules = RuleSet.from_dicts([
+        {"name": "noise", "contains": "NOISE"},
+        {"name": "pests", "regex": r"rodent|mice"},
+        {"name": "bk_noise", "contains": "noise", "borough": "brooklyn"},
+        {"name": "qn_noise", "contains": "noise", "borough": "QUEENS"},
+        {"name": "near", "near": {"lat": 40.7, "lon": -74.0, "radius_m": 100}},
+        {"name": "box", "bbox": [40.75, -74.0, 40.85, -73.8]},
+    ])
+    assert matched(rules) == [
+        ("bk_noise", "1"), ("box", "4"), ("near", "1"), ("noise", "1"), ("pests", "2"),
+    ]
+
+
+def test_many_rules_and_memo_reuse():
+    rules = RuleSet.from_dicts(
+        [{"name": f"r{i}", "contains": f"type {i}"} for i in range(500)] + [{"name": "heat", "contains": "heat"}]
+    )
+    assert matched(rules) == [("heat", "3")]
+    # Second batch with the same values is answered from the memo.
+    assert matched(rules) == [("heat", "3")]
+    assert "HEAT/HOT WATER" in rules._memo["complaint_type"]
+
+
+def test_backreferences_and_inline_flags_match_per_rule():
+    rules = RuleSet.from_dicts([
+        {"name": "pests", "regex": r"(rodent|mice)"},
+        {"name": "double_t", "regex": r"(t)\1"},              # \1 would be pests' group in the alternation
+        {"name": "street", "regex": r"(?P<w>street)"},
+        {"name": "heat", "regex": r"(?s)heat/hot"},          # global flag, only valid at the start
+    ])
+    assert [r.combinable for r in rules.rules] == [True, False, False, False]
+    assert matched(rules) == [("heat", "3"), ("pests", "2"), ("street", "1")]
+    assert matched(rules, BATCH.assign(complaint_type=["Litter", None, None, None])) == [("double_t", "1")]
+
+
+def test_rule_needs_a_predicate():
+    with pytest.raises(ValueError):
+        Rule(name="empty")
+    with pytest.raises(ValueError, match="invalid regex"):
+        Rule(name="broken", regex="(noise")
+
+
+def test_stream_alerter_writes_jsonl(tmp_path):
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"rules": [{"name": "noise", "contains": "noise"}]}))
+    out = tmp_path / "alerts.jsonl"
+
+    alerter = StreamAlerter(load_rules(str(rules_path)), [JSONLSink(str(out)), make_sink("stdout")])
+    alerter(BATCH)
+
+    lines = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [(a["rule"], a["unique_key"]) for a in lines] == [("noise", "1")]
+    assert "alerted_at" in lines[0]
@@ -0,0 +1,70 @@
+# tests/test_runner.py
+
+import sqlite3
+import pytest
+from src.reader import NYC311Reader
+from src.runner import PipelineRunner
+from src.state import CursorStore
+from conftest import FakeReader, make_rows
+
+
+def test_run_pages_walks_every_row(temp_db):
+    writer, db_path = temp_db
+    reader = FakeReader(make_rows(10), limit=4)
+
+    pages = PipelineRunner(reader, writer).run_pages()
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert pages == 3
+    assert count == 10
+
+
+def test_run_pages_resumes_after_crash(temp_db, tmp_path):
+    writer, db_path = temp_db
+    store = CursorStore(str(tmp_path / "cursor.json"))
+    rows = make_rows(10)
+
+    with pytest.raises(RuntimeError):
+        PipelineRunner(FakeReader(rows, limit=4, fail_on_page=2), writer).run_pages(cursor_store=store)
+    assert store.load()["after"] == ["2025-01-01T00:00:01.000", "00003"]
+
+    reader = FakeReader(rows, limit=4)
+    PipelineRunner(reader, writer).run_pages(cursor_store=store)
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert reader.calls == 2  # only the pages after the saved cursor
+    assert count == 10
+    assert store.load() is None
+
+
+class StreamReader(NYC311Reader):
+    def __init__(self, rows, fail_after=None):
+        super().__init__(limit=len(rows))
+        self.rows = rows
+        self.fail_after = fail_after
+
+    def fetch_stream(self, since=None, inclusive=False, chunk_rows=5000):
+        for i in range(0, len(self.rows), chunk_rows):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise RuntimeError("connection reset")
+            yield self.rows[i:i + chunk_rows]
+
+
+def test_run_stream_writes_every_chunk(temp_db):
+    writer, db_path = temp_db
+    rows = make_rows(25)
+
+    total = PipelineRunner(StreamReader(rows), writer).run_stream(chunk_rows=4, skip_keys={"00000"})
+
+    with sqlite3.connect(db_path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
+    assert total == 25
+    assert count == 24
+
+
+def test_run_stream_surfaces_reader_errors(temp_db):
+    writer, _ = temp_db
+    with pytest.raises(RuntimeError, match="connection reset"):
+        PipelineRunner(StreamReader(make_rows(25), fail_after=8), writer).run_stream(chunk_rows=4)
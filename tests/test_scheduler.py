@@ -0,0 +1,135 @@
+# tests/test_scheduler.py
+
+import threading
+import time
+import pytest
+import requests
+from src.scheduler import CircuitOpen, RequestScheduler, TokenBucket, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+class Resp:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(str(self.status_code), response=self)
+
+    def close(self):
+        pass
+
+
+def scripted(*outcomes):
+    outcomes = list(outcomes)
+    calls = []
+
+    def send():
+        calls.append(1)
+        out = outcomes.pop(0)
+        if isinstance(out, Exception):
+            raise out
+        return out
+    return send, calls
+
+
+def make_scheduler(clock, **kw):
+    return RequestScheduler(clock=clock, sleep=clock.sleep, **kw)
+
+
+def test_token_bucket_paces_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+    for _ in range(7):
+        bucket.acquire()
+    assert clock.now == pytest.approx(2.0)  # 3 free, then 4 more at 2/s
+
+
+def test_429_honours_retry_after_and_retries():
+    clock = FakeClock()
+    sched = make_scheduler(clock, rate=None)
+    send, calls = scripted(Resp(429, {"Retry-After": "7"}), Resp(200))
+    stats = {"requests": 0, "retries": 0}
+
+    assert sched.request(send, stats).status_code == 200
+    assert len(calls) == 2
+    assert clock.sleeps == [7.0]
+    assert stats == {"requests": 2, "retries": 1}
+
+
+def test_client_error_is_not_retried():
+    clock = FakeClock()
+    send, calls = scripted(Resp(400), Resp(200))
+    with pytest.raises(RuntimeError):
+        make_scheduler(clock, rate=None).request(send)
+    assert len(calls) == 1
+
+
+def test_breaker_opens_then_half_opens():
+    clock = FakeClock()
+    sched = make_scheduler(clock, rate=None, failure_threshold=3, reset_timeout=30, max_attempts=3, base_delay=0.01)
+    send, calls = scripted(*[requests.ConnectionError("down")] * 3, Resp(200))
+
+    with pytest.raises(RuntimeError):
+        sched.request(send)
+    assert sched.breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        sched.request(send)
+    assert len(calls) == 3  # failed fast, nothing sent
+
+    clock.now += 30
+    assert sched.request(send).status_code == 200
+    assert sched.breaker.state == "closed"
+
+
+def test_half_open_trial_settled_by_429_or_exception():
+    clock = FakeClock()
+    sched = make_scheduler(clock, rate=None, failure_threshold=1, reset_timeout=30, max_attempts=2, base_delay=0.01)
+    send, _ = scripted(requests.ConnectionError("down"), requests.ConnectionError("down"))
+    with pytest.raises(RuntimeError):
+        sched.request(send)
+
+    # A 429 on the trial is an answer: the breaker closes and the retry goes through.
+    clock.now += 31
+    send, calls = scripted(Resp(429, {"Retry-After": "1"}), Resp(200))
+    assert sched.request(send).status_code == 200
+    assert sched.breaker.state == "closed" and len(calls) == 2
+
+    # An exception that isn't a network error hands the trial back instead of wedging it.
+    sched.breaker.record_failure()
+    clock.now += 31
+    send, calls = scripted(KeyError("not recorded"), Resp(200))
+    with pytest.raises(KeyError):
+        sched.request(send)
+    assert sched.breaker.state == "half-open"
+    assert sched.request(send).status_code == 200
+    assert sched.breaker.state == "closed"
+
+
+def test_retry_after_http_date():
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert retry_after_seconds("soon") is None
+
+
+def test_shared_bucket_across_threads():
+    sched = RequestScheduler(rate=100, burst=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [sched.request(lambda: Resp(200)) for _ in range(5)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.monotonic() - start >= 0.18  # 20 requests at 100/s after a burst of 1
@@ -1,7 +1,9 @@
 # tests/test_schema.py
 
+import pandas as pd
 import pytest
-from src.schema import NYC311Record
+from src.schema import NYC311Record, validate_batch
+from src.synthetic import generate_records
 
 
 def test_valid_record():
@@ -34,3 +36,38 @@ def test_missing_required_field():
             created_date=None,
             complaint_type="Noise"
         )
+
+
+def _record_path(raw_records):
+    """The original one-dataclass-per-row validation path."""
+    cleaned = []
+    for rec in raw_records:
+        try:
+            cleaned.append(NYC311Record.from_api(rec).to_dict())
+        except ValueError:
+            continue
+    return pd.DataFrame(cleaned)
+
+
+# Quirks the generator doesn't produce: non-string values, missing keys, impossible dates.
+ODD_RECORDS = [
+    {"unique_key": "a", "created_date": 20241201, "complaint_type": "Noise"},
+    {"unique_key": "b", "created_date": "2025-02-30T00:00:00.000", "complaint_type": "Noise"},
+    {"unique_key": "c", "created_date": "1 Dec 2024", "complaint_type": "Noise"},
+    {"unique_key": "d", "created_date": "2025-01-01T00:00:00.000", "complaint_type": ""},
+    {"unique_key": "e", "created_date": "2025-01-01T00:00:00.000", "complaint_type": "Noise", "latitude": "n/a"},
+    {"unique_key": "f", "created_date": "2025-01-01T00:00:00.000", "complaint_type": "Noise", "latitude": 40.5,
+     "longitude": "", "borough": None},
+    {"unique_key": "g", "created_date": None, "complaint_type": "Noise"},
+]
+
+
+def test_validate_batch_matches_record_path():
+    # Timing of the two paths lives in `main.py bench` (validate_records / validate_batch).
+    raw = generate_records(2000, null_rate=0.1, bad_date_rate=0.05).to_dict("records") + ODD_RECORDS
+    pd.testing.assert_frame_equal(validate_batch(raw), _record_path(raw))
+
+
+def test_validate_batch_empty_and_all_rejected():
+    assert validate_batch([]).empty
+    assert validate_batch([{"unique_key": "1", "created_date": "nope", "complaint_type": "Noise"}]).empty
@@ -0,0 +1,79 @@
+# tests/test_service.py
+
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+import requests
+from src.service import QueryService, query_service
+
+
+def rows(keys, complaint="Noise", minutes_ago=5):
+    now = pd.Timestamp.now()
+    return pd.DataFrame([
+        {"unique_key": k, "created_date": (now - pd.Timedelta(minutes=minutes_ago)).isoformat(),
+         "complaint_type": complaint, "borough": "QUEENS"}
+        for k in keys
+    ])
+
+
+def test_cached_trends_follow_writes(temp_db):
+    writer, db_path = temp_db
+    writer.write(rows(["1", "2"]))
+    with QueryService(db_path, port=0) as service:
+        first = requests.get(f"{service.url}/trends", params={"kind": "top"}).json()
+        again = requests.get(f"{service.url}/trends", params={"kind": "top"}).json()
+        assert first["rows"] == again["rows"] == [{"complaint_type": "Noise", "n": 2}]
+        assert (first["cached"], again["cached"]) == (False, True)
+
+        # A commit from the writer bumps the data version, so the cache is dropped.
+        writer.write(rows(["3"], complaint="Heat"))
+        after = requests.get(f"{service.url}/trends", params={"kind": "top"}).json()
+        assert not after["cached"] and after["data_version"] != first["data_version"]
+        assert after["rows"] == [{"complaint_type": "Noise", "n": 2}, {"complaint_type": "Heat", "n": 1}]
+
+        alerts = query_service(service.url, "alerts", filter="heat", hours=1)
+        assert alerts["unique_key"].tolist() == ["3"]
+        assert len(query_service(service.url, "preview", n=2)) == 2
+
+        with pytest.raises(RuntimeError, match="400"):
+            query_service(service.url, "trends", kind="weekly")
+        assert requests.get(f"{service.url}/nope").status_code == 404
+
+
+def test_thin_client_skips_matplotlib(temp_db):
+    writer, db_path = temp_db
+    writer.write(rows(["1", "2"]))
+    main = Path(__file__).resolve().parent.parent / "main.py"
+    with QueryService(db_path, port=0) as service:
+        # run main.py in a fresh interpreter and report what it imported
+        script = (
+            "import runpy, sys; "
+            f"sys.argv = [{str(main)!r}, 'trends', '--kind', 'top', '--server', {service.url!r}]; "
+            f"sys.path.insert(0, {str(main.parent)!r}); "
+            "runpy.run_path(sys.argv[0], run_name='__main__'); "
+            "print('matplotlib loaded:', 'matplotlib' in sys.modules)"
+        )
+        out = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    assert "Noise" in out.stdout
+    assert "matplotlib loaded: False" in out.stdout
+
+
+def test_pool_slot_freed_when_open_fails(tmp_path):
+    import sqlite3
+    from src.db_utils import ConnectionPool
+
+    db_path = tmp_path / "later.db"
+    pool = ConnectionPool(str(db_path), size=1)
+    for _ in range(2):
+        with pytest.raises(sqlite3.OperationalError):  # read-only open of a missing file
+            with pool.connection():
+                pass
+        assert pool._opened == 0
+
+    sqlite3.connect(db_path).close()
+    with pool.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+    pool.close()
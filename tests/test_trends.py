@@ -0,0 +1,76 @@
+# tests/test_trends.py
+
+from pathlib import Path
+import pandas as pd
+import pytest
+from src.trends import TrendAnalyser
+
+
+@pytest.fixture
+def analyser(temp_db, tmp_path):
+    writer, db_path = temp_db
+    writer.write(pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T08:00:00.000", "complaint_type": "Noise", "borough": "BROOKLYN"},
+        {"unique_key": "2", "created_date": "2025-01-01T09:00:00.000", "complaint_type": "Noise", "borough": "QUEENS"},
+        {"unique_key": "3", "created_date": "2025-01-02T10:00:00.000", "complaint_type": "Heat", "borough": "BROOKLYN"},
+        {"unique_key": "4", "created_date": "2025-01-03T23:59:59.000", "complaint_type": "Noise", "borough": None},
+    ]))
+    return TrendAnalyser(db_path=db_path, output_dir=str(tmp_path / "out"))
+
+
+def test_daily_counts(analyser):
+    counts = analyser.daily_counts()
+    assert counts.tolist() == [2, 1, 1]
+    assert str(counts.index[0].date()) == "2025-01-01"
+
+
+def test_counts_respect_window(analyser):
+    assert analyser.complaint_counts(since="2025-01-02", until="2025-01-03").to_dict() == {"Heat": 1}
+    assert analyser.complaint_counts(n=1).to_dict() == {"Noise": 3}
+    assert analyser.borough_counts().to_dict() == {"BROOKLYN": 2, "QUEENS": 1}
+
+
+def test_plots_written(analyser):
+    analyser.daily_volume(since="2025-01-01")
+    analyser.top_complaints(5)
+    analyser.borough_distribution()
+    assert len(list(Path(analyser.output_dir).glob("*.png"))) == 3
+
+
+def test_rollups_match_raw_queries(analyser, temp_db):
+    from src.db_utils import DBUtils
+
+    writer, db_path = temp_db
+    # Duplicate key must not be double counted in the rollups.
+    writer.write(pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T08:00:00.000", "complaint_type": "Noise", "borough": "BROOKLYN"},
+        {"unique_key": "5", "created_date": "2025-01-01T08:30:00.000", "complaint_type": "Noise", "borough": "BROOKLYN"},
+    ]))
+    raw = TrendAnalyser(db_path=db_path, output_dir=analyser.output_dir, use_rollups=False)
+
+    by_hour = analyser.counts("hour", by=["complaint_type", "borough"])
+    pd.testing.assert_frame_equal(by_hour, raw.counts("hour", by=["complaint_type", "borough"]))
+    assert by_hour["n"].sum() == 5
+    assert analyser.daily_counts().equals(raw.daily_counts())
+    assert DBUtils(db_path).rebuild_rollups() == 0
+
+
+def test_density_grid(temp_db, tmp_path):
+    writer, db_path = temp_db
+    writer.write(pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T08:00:00", "complaint_type": "Noise", "latitude": 40.7001, "longitude": -73.9001},
+        {"unique_key": "2", "created_date": "2025-01-01T09:00:00", "complaint_type": "Noise", "latitude": 40.7002, "longitude": -73.9002},
+        {"unique_key": "3", "created_date": "2025-01-01T10:00:00", "complaint_type": "Heat", "latitude": 40.8000, "longitude": -73.9500},
+        {"unique_key": "4", "created_date": "2025-01-01T11:00:00", "complaint_type": "Noise"},
+    ]))
+    ta = TrendAnalyser(db_path=db_path, output_dir=str(tmp_path / "out"))
+
+    cells = ta.density(cell_m=500)
+    assert cells["n"].tolist() == [2, 1]
+    # cell centres are within half a cell of their points
+    assert abs(cells["cell_lat"].iloc[0] - 40.70015) < 0.0023
+    assert abs(cells["cell_lon"].iloc[0] + 73.90015) < 0.003
+
+    assert ta.density(cell_m=500, bbox=(40.75, -74.0, 40.85, -73.9))["n"].tolist() == [1]
+    assert ta.density(cell_m=500, since="2025-01-01T09:30:00")["n"].tolist() == [1]
+    assert ta.density(cell_m=500, complaint_type="Noise")["n"].tolist() == [2]
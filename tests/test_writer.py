@@ -24,3 +24,186 @@ def test_writer_inserts_and_avoids_duplicates(temp_db):
         count = conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0]
 
     assert count == 2
+
+
+def test_persistent_writer_reports_inserts_and_uses_wal(tmp_path):
+    db_path = str(tmp_path / "fast.db")
+    df = pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01", "complaint_type": "Noise"},
+        {"unique_key": "2", "created_date": "2025-01-02", "complaint_type": "Heat"},
+    ])
+    more = pd.DataFrame([
+        {"unique_key": "2", "created_date": "2025-01-02", "complaint_type": "Heat"},
+        {"unique_key": "3", "created_date": "2025-01-03", "complaint_type": "Heat"},
+    ])
+
+    with SQLiteWriter(db_path=db_path, persistent=True) as writer:
+        assert writer.write(df) == 2
+        assert writer.write(df) == 0
+        assert writer.write(more) == 1
+
+    assert writer._conn is None
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT COUNT(*) FROM requests").fetchone()[0] == 3
+
+
+def test_migrates_pandas_inferred_table(tmp_path):
+    db_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_path) as conn:
+        pd.DataFrame([
+            {"unique_key": "1", "created_date": "2025-01-01T10:00:00.000", "complaint_type": "Noise"},
+        ]).to_sql("requests", conn, index=False)
+        conn.execute("CREATE UNIQUE INDEX idx_requests_unique_key ON requests(unique_key)")
+
+    SQLiteWriter(db_path=db_path).write(pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T10:00:00.000", "complaint_type": "Noise"},
+        {"unique_key": "2", "created_date": "2025-01-02T00:00:00.000", "complaint_type": "Heat"},
+    ]))
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT unique_key, created_epoch FROM requests ORDER BY unique_key").fetchall()
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert conn.execute("PRAGMA user_version").fetchone()[0] >= 1
+    assert rows == [("1", 1735725600), ("2", 1735776000)]
+    assert {"idx_requests_unique_key", "idx_requests_created", "idx_requests_type_created"} <= indexes
+
+
+def test_checkpoint_tracks_watermark_and_boundary_keys(temp_db):
+    from src.db_utils import DBUtils
+
+    writer, db_path = temp_db
+    t1, t2 = "2025-01-01T10:00:00.000", "2025-01-01T11:00:00.000"
+    writer.write(pd.DataFrame([
+        {"unique_key": "1", "created_date": t1, "complaint_type": "Noise"},
+        {"unique_key": "2", "created_date": t1, "complaint_type": "Noise"},
+    ]))
+    # Late arrival sharing the boundary timestamp.
+    writer.write(pd.DataFrame([{"unique_key": "3", "created_date": t1, "complaint_type": "Heat"}]))
+
+    cp = DBUtils(db_path).get_checkpoint()
+    assert cp["watermark"] == t1
+    assert cp["boundary_keys"] == {"1", "2", "3"}
+
+    writer.write(pd.DataFrame([{"unique_key": "4", "created_date": t2, "complaint_type": "Heat"}]))
+    # Older rows (e.g. a backfill) never move the watermark backwards.
+    writer.write(pd.DataFrame([{"unique_key": "0", "created_date": "2024-01-01", "complaint_type": "Heat"}]))
+
+    cp = DBUtils(db_path).get_checkpoint()
+    assert cp["watermark"] == t2
+    assert cp["boundary_keys"] == {"4"}
+    assert cp["rows_processed"] == 5
+    assert cp["pages_processed"] == 4
+
+
+def test_upsert_rewrites_only_changed_rows(tmp_path):
+    db_path = str(tmp_path / "upsert.db")
+    df = pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T01:00:00", "complaint_type": "Noise", "status": "Open"},
+        {"unique_key": "2", "created_date": "2025-01-01T02:00:00", "complaint_type": "Heat", "status": "Open"},
+    ])
+    changed = df.copy()
+    changed.loc[0, ["status", "closed_date", "complaint_type"]] = ["Closed", "2025-01-02T00:00:00", "Noise - Street"]
+    changed.loc[2] = {"unique_key": "3", "created_date": "2025-01-01T03:00:00", "complaint_type": "Heat", "status": "Open"}
+
+    with SQLiteWriter(db_path=db_path, persistent=True, mode="upsert") as writer:
+        assert writer.write(df) == 2
+        assert (writer.write(df), writer.last_updated) == (0, 0)  # same content: no rewrite
+        assert (writer.write(changed), writer.last_updated) == (1, 1)
+
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute("SELECT status, closed_date, complaint_type FROM requests_decoded WHERE unique_key = '1'").fetchone()
+        rollup = dict(conn.execute("""
+            SELECT c.name, SUM(n) FROM rollup_hourly JOIN complaint_types c ON c.id = complaint_type_id GROUP BY 1
+        """).fetchall())
+    assert row == ("Closed", "2025-01-02T00:00:00", "Noise - Street")
+    assert rollup == {"Noise": 0, "Noise - Street": 1, "Heat": 2}  # update trigger moved the count
+
+
+def test_upsert_fills_rows_stored_without_hash(temp_db):
+    writer, db_path = temp_db
+    df = pd.DataFrame([{"unique_key": "1", "created_date": "2025-01-01", "complaint_type": "Noise"}])
+    writer.write(df)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE requests SET row_hash = NULL")  # as migrated from v4
+
+    upsert = SQLiteWriter(db_path=db_path, mode="upsert")
+    upsert.write(df)
+    assert upsert.last_updated == 1
+    upsert.write(df)
+    assert upsert.last_updated == 0
+
+
+def test_lookup_encoded_storage(tmp_path):
+    from src.alerts import AlertEngine
+    from src.schema import CHECKPOINT_DDL, create_requests_table
+
+    # a v7 (text layout) table with a gap in its rowids
+    db_path = str(tmp_path / "v7.db")
+    with sqlite3.connect(db_path) as conn:
+        create_requests_table(conn)
+        conn.execute(CHECKPOINT_DDL)
+        conn.executemany(
+            "INSERT INTO requests (rowid, unique_key, created_date, created_epoch, complaint_type, borough) VALUES (?, ?, ?, ?, ?, ?)",
+            [(1, "1", "2025-01-01T00:00:00", 1735689600, "Noise", "QUEENS"), (5, "2", "2025-01-01T01:00:00", 1735693200, "Heat", None)],
+        )
+        conn.execute("PRAGMA user_version = 7")
+
+    SQLiteWriter(db_path=db_path).write(pd.DataFrame([
+        {"unique_key": "3", "created_date": "2025-01-01T02:00:00", "complaint_type": "Noise", "borough": "BRONX"},
+    ]))
+
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT rowid, complaint_type_id, borough_id FROM requests ORDER BY rowid").fetchall()
+        types = dict(conn.execute("SELECT id, name FROM complaint_types"))
+        decoded = conn.execute("SELECT rid, complaint_type, borough FROM requests_decoded ORDER BY rid").fetchall()
+    assert [r[0] for r in stored] == [1, 5, 6]
+    assert [types[r[1]] for r in stored] == ["Noise", "Heat", "Noise"]
+    assert decoded == [(1, "Noise", "QUEENS"), (5, "Heat", None), (6, "Noise", "BRONX")]
+
+    df = AlertEngine(db_path=db_path)._load_df()
+    assert isinstance(df["complaint_type"].dtype, pd.CategoricalDtype)
+    assert df["complaint_type"].tolist() == ["Noise", "Heat", "Noise"]
+    assert df["borough"].isna().tolist() == [False, True, False]
+
+
+def test_upgrades_from_every_version_match_a_fresh_database(tmp_path):
+    from src.schema import CHECKPOINT_DDL, MIGRATIONS, create_requests_table
+
+    def schema(path):
+        with sqlite3.connect(path) as conn:
+            return sorted((name, " ".join((sql or "").split())) for name, sql in conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+
+    def state(path):
+        with sqlite3.connect(path) as conn:
+            rollups = conn.execute("""
+                SELECT r.hour_epoch, t.name, b.name, r.n FROM rollup_hourly r
+                JOIN complaint_types t ON t.id = r.complaint_type_id LEFT JOIN boroughs b ON b.id = r.borough_id
+                ORDER BY 1
+            """).fetchall()
+            return rollups, conn.execute("SELECT rowid FROM requests_fts WHERE requests_fts MATCH 'heat'").fetchall()
+
+    batch = pd.DataFrame([
+        {"unique_key": "1", "created_date": "2025-01-01T00:00:00", "complaint_type": "Noise", "borough": "QUEENS"},
+        {"unique_key": "2", "created_date": "2025-01-01T01:00:00", "complaint_type": "Heat"},
+    ])
+    fresh = str(tmp_path / "fresh.db")
+    SQLiteWriter(db_path=fresh).write(batch)
+
+    for version in (2, 6, 7):
+        old = str(tmp_path / f"v{version}.db")
+        with sqlite3.connect(old) as conn:
+            # a v2 database with a row already in it, taken up to `version` the way
+            # the builds of that time did
+            create_requests_table(conn)
+            conn.execute(CHECKPOINT_DDL)
+            conn.execute("INSERT INTO requests (unique_key, created_date, created_epoch, complaint_type, borough)"
+                         " VALUES ('1', '2025-01-01T00:00:00', 1735689600, 'Noise', 'QUEENS')")
+            for v in range(3, version + 1):
+                MIGRATIONS[v](conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        SQLiteWriter(db_path=old).write(batch)
+        assert schema(old) == schema(fresh)
+        assert state(old) == state(fresh) == (
+            [(1735689600, "Noise", "QUEENS", 1), (1735693200, "Heat", None, 1)], [(2,)])